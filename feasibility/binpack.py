@@ -0,0 +1,171 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import parallel
+
+HOST_MEMORY_MB = 256 * 1024
+HOST_CPUS = 64
+# vCPUs of one function instance, a horizontal VM has one instance, a vertical VM one per concurrent instance
+INSTANCE_CPUS = 1.0
+# memory of a VM besides its instances (guest kernel, VMM)
+VM_OVERHEAD_MB = 0
+# VM memory is rounded up to a multiple of this, which bounds the number of distinct VM sizes to pack
+SIZE_CLASS_MB = 64
+# CPUs are counted in thousandths so that all the packing arithmetic stays in integers
+MILLI = 1000
+MINUTE_BLOCK = 64
+
+
+class Hosts:
+    # free memory and CPU of the open hosts, in the order first-fit visits them
+
+    def __init__(self, memory, cpus):
+        self.memory = memory
+        self.cpus = cpus
+        self.free_memory = np.zeros(0, dtype=np.int64)
+        self.free_cpus = np.zeros(0, dtype=np.int64)
+
+    def fits(self, free_memory, free_cpus, memory, cpus):
+        fits = free_memory // memory
+        return np.minimum(fits, free_cpus // cpus) if cpus else fits
+
+    def place(self, memory, cpus, count):
+        # first fit of `count` identical VMs: every open host in turn takes as many as fit, the rest go to new hosts
+        # filled one after the other, which is where first fit puts them one by one
+        fits = self.fits(self.free_memory, self.free_cpus, memory, cpus)
+        take = np.clip(count - (np.cumsum(fits) - fits), 0, fits)
+        self.free_memory -= take * memory
+        self.free_cpus -= take * cpus
+        rest = count - int(take.sum())
+        if rest:
+            per_host = int(self.fits(self.memory, self.cpus, memory, cpus))
+            new = np.full(-(-rest // per_host), per_host, dtype=np.int64)
+            new[-1] = rest - per_host * (len(new) - 1)
+            self.free_memory = np.concatenate([self.free_memory, self.memory - new * memory])
+            self.free_cpus = np.concatenate([self.free_cpus, self.cpus - new * cpus])
+
+
+def first_fit_decreasing(memory, cpus, counts, host_memory, host_cpus):
+    # pack counts[i] VMs of (memory[i], cpus[i]) largest first, returns the hosts
+    hosts = Hosts(host_memory, host_cpus)
+    for i in np.lexsort((-cpus, -memory)):
+        hosts.place(int(memory[i]), int(cpus[i]), int(counts[i]))
+    return hosts
+
+
+def vm_classes(memory, cpus, counts):
+    # (memory, cpus, count) of the distinct VM sizes, for VMs given one by one with a multiplicity
+    keep = counts > 0
+    # one integer key per (memory, cpus), a 1-d unique sorts much faster than the rows of a 2-d one
+    base = int(cpus.max(initial=0)) + 1
+    keys, inverse = np.unique(memory[keep] * base + cpus[keep], return_inverse=True)
+    return keys // base, keys % base, np.bincount(inverse, weights=counts[keep]).astype(np.int64)
+
+
+class Packer:
+
+    def __init__(self, memory_mb, host_memory=HOST_MEMORY_MB, host_cpus=HOST_CPUS, instance_cpus=INSTANCE_CPUS,
+                 overhead=VM_OVERHEAD_MB, size_class=SIZE_CLASS_MB):
+        self.memory_mb = np.ceil(np.asarray(memory_mb, dtype=np.float64)).astype(np.int64)
+        self.host_memory = host_memory
+        self.host_cpus = int(round(host_cpus * MILLI))
+        self.instance_cpus = int(round(instance_cpus * MILLI))
+        self.overhead = overhead
+        self.size_class = size_class
+        # the largest VM memory that still fits a host once rounded to the size class
+        usable = host_memory // size_class * size_class
+        self.max_instances = (usable - overhead) // self.memory_mb
+        if self.instance_cpus:
+            self.max_instances = np.minimum(self.max_instances, self.host_cpus // self.instance_cpus)
+        if (self.max_instances < 1).any():
+            raise ValueError("a function instance of {} MB does not fit a host of {} MB and {} CPUs".format(
+                self.memory_mb.max(), host_memory, host_cpus))
+
+    def vm_memory(self, instances):
+        return -(-(instances * self.memory_mb + self.overhead) // self.size_class) * self.size_class
+
+    def horizontal(self, instances):
+        # one VM per instance
+        memory = self.vm_memory(np.ones_like(instances))
+        return vm_classes(memory, np.full_like(memory, self.instance_cpus), instances)
+
+    def vertical(self, instances):
+        # one VM per function grown by the function memory per concurrent instance, a function needing more than a
+        # host gets full VMs and one VM for the remainder
+        full, rest = np.divmod(instances, self.max_instances)
+        memory = np.concatenate([self.vm_memory(self.max_instances), self.vm_memory(rest)])
+        cpus = np.concatenate([self.max_instances, rest]) * self.instance_cpus
+        return vm_classes(memory, cpus, np.concatenate([full, (rest > 0).astype(np.int64)]))
+
+    def minute(self, instances, mode):
+        memory, cpus, counts = getattr(self, mode)(instances)
+        hosts = first_fit_decreasing(memory, cpus, counts, self.host_memory, self.host_cpus)
+        n = len(hosts.free_memory)
+        used_memory = int((memory * counts).sum())
+        if n:
+            # free memory on hosts that cannot take even the smallest VM of the minute anymore
+            stranded = (hosts.free_memory < memory.min()) | (hosts.free_cpus < cpus.min())
+            stranded_mb = int(hosts.free_memory[stranded].sum())
+        else:
+            stranded_mb = 0
+        return {"hosts": n, "vms": int(counts.sum()), "used_mb": used_memory,
+                "free_mb": int(hosts.free_memory.sum()), "stranded_mb": stranded_mb,
+                "memory_utilization": used_memory / (n * self.host_memory) if n else 0.0,
+                "cpu_utilization": int((cpus * counts).sum()) / (n * self.host_cpus) if n else 0.0}
+
+
+def binpack(containers, memory_mb, modes=("horizontal", "vertical"), jobs=1, **config):
+    # per-minute packing of every mode, the minutes are read in blocks of columns so the matrix can be a memory map
+    if jobs > 1:
+        # every minute is packed on its own, the workers take shards of the minutes
+        parts = parallel.map_shards(binpack, [containers], memory_mb, modes, jobs=jobs, axis=1, **config)
+        results = {mode: pd.concat([part[mode] for part in parts], ignore_index=True) for mode in modes}
+        for df in results.values():
+            df['minute'] = np.arange(1, len(df) + 1)
+        return results
+    packer = Packer(memory_mb, **config)
+    rows = {mode: [] for mode in modes}
+    for start in range(0, containers.shape[1], MINUTE_BLOCK):
+        block = np.asarray(containers[:, start:start + MINUTE_BLOCK], dtype=np.int64)
+        for j in range(block.shape[1]):
+            for mode in modes:
+                rows[mode].append(dict(minute=start + j + 1, **packer.minute(block[:, j], mode)))
+    return {mode: pd.DataFrame(rows[mode]) for mode in modes}
+
+
+def summary(results):
+    return pd.DataFrame([{"mode": mode, "peak_hosts": df['hosts'].max(), "mean_hosts": df['hosts'].mean(),
+                          "peak_used_mb": df['used_mb'].max(), "mean_used_mb": df['used_mb'].mean(),
+                          "mean_memory_utilization": df['memory_utilization'].mean(),
+                          "mean_stranded_mb": df['stranded_mb'].mean()} for mode, df in results.items()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", nargs="?", default="merged_data.csv",
+                        help="merged_data.csv or the output directory of merge.py stream")
+    parser.add_argument("--host-memory", type=int, default=HOST_MEMORY_MB, help="MB")
+    parser.add_argument("--host-cpus", type=float, default=HOST_CPUS)
+    parser.add_argument("--instance-cpus", type=float, default=INSTANCE_CPUS)
+    parser.add_argument("--overhead", type=int, default=VM_OVERHEAD_MB, help="MB per VM")
+    parser.add_argument("--size-class", type=int, default=SIZE_CLASS_MB, help="MB")
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+
+    result_dir = "statistics/binpack"
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    meta, _, containers = cache.load(args.source)
+    results = binpack(containers, meta['AverageAllocatedMb'], host_memory=args.host_memory, host_cpus=args.host_cpus,
+                      instance_cpus=args.instance_cpus, overhead=args.overhead, size_class=args.size_class,
+                      jobs=args.jobs)
+    for mode, df in results.items():
+        df.to_csv(os.path.join(result_dir, "{}.csv".format(mode)), index=False)
+    result = summary(results)
+    result.to_csv(os.path.join(result_dir, "summary.csv"), index=False)
+    print(result.to_string(index=False))
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 1
+CHUNK_ROWS = 4096
+
+
+def minute_columns(df):
+    # the per-minute invocation columns '1'..'1440', merged_data.csv also has Trigger and the percentile columns
+    return sorted((c for c in df.columns if c.isdigit()), key=int)
+
+
+def small_dtype(max_value):
+    return np.min_scalar_type(max(int(max_value), 1))
+
+
+def container_counts(invocations, durations):
+    # the minimum number of containers needed per function and minute: ceil(invocations * duration / 60s), in the
+    # smallest unsigned dtype that holds them, computed over row chunks to bound the float temporaries
+    counts = np.empty(invocations.shape, dtype=np.uint32)
+    durations = np.asarray(durations, dtype=np.float64)
+    for start in range(0, len(counts), CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        counts[rows] = np.ceil(invocations[rows] * durations[rows, None] / 1000 / 60)
+    return counts.astype(small_dtype(counts.max(initial=0)), copy=False)
+
+
+def source_state(path):
+    stat = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'version': CACHE_VERSION}
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'cache.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(cache_dir, state):
+    with open(os.path.join(cache_dir, 'cache.json'), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def save_matrix(cache_dir, name, matrix):
+    # written next to the final name and renamed, so an interrupted run never leaves a truncated matrix behind
+    path = os.path.join(cache_dir, name + '.npy')
+    np.save(path + '.tmp.npy', matrix)
+    os.replace(path + '.tmp.npy', path)
+
+
+def build_from_csv(csv_path, cache_dir):
+    meta_parts, invocation_parts = [], []
+    for chunk in pd.read_csv(csv_path, chunksize=CHUNK_ROWS * 4):
+        minutes = minute_columns(chunk)
+        meta_parts.append(chunk.drop(columns=minutes))
+        invocation_parts.append(chunk[minutes].to_numpy())
+    meta = pd.concat(meta_parts, ignore_index=True)
+    invocations = np.concatenate(invocation_parts)
+    invocations = invocations.astype(small_dtype(invocations.max(initial=0)), copy=False)
+    meta.to_parquet(os.path.join(cache_dir, 'meta.parquet'), index=False)
+    save_matrix(cache_dir, 'invocations', invocations)
+
+
+def load(source='merged_data.csv', cache_dir=None):
+    # (meta, invocations, containers) of merged_data.csv or of a `merge.py stream` directory: meta is a DataFrame
+    # with one row per function, the matrices are read-only memory maps, row i of both is row i of meta and column j
+    # is minute j + 1. The first use writes the cache, it is rebuilt when the source changes.
+    if os.path.isdir(source):
+        # meta.parquet and invocations.npy are already there, only the containers are cached next to them
+        cache_dir = source
+        state = source_state(os.path.join(source, 'invocations.npy'))
+    else:
+        cache_dir = cache_dir or os.path.join(CACHE_DIR, os.path.basename(source))
+        state = source_state(source)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if read_manifest(cache_dir) != state:
+        if not os.path.isdir(source):
+            build_from_csv(source, cache_dir)
+        meta = pd.read_parquet(os.path.join(cache_dir, 'meta.parquet'))
+        invocations = np.load(os.path.join(cache_dir, 'invocations.npy'), mmap_mode='r')
+        save_matrix(cache_dir, 'containers', container_counts(invocations, meta['AverageDurations']))
+        write_manifest(cache_dir, state)
+
+    meta = pd.read_parquet(os.path.join(cache_dir, 'meta.parquet'))
+    invocations = np.load(os.path.join(cache_dir, 'invocations.npy'), mmap_mode='r')
+    containers = np.load(os.path.join(cache_dir, 'containers.npy'), mmap_mode='r')
+    return meta, invocations, containers
@@ -1,75 +1,73 @@
+import argparse
 import os
 
 import pandas as pd
 import numpy as np
 
+import cache
+import parallel
 
-def cold_start():
-    # Load the CSV file
-    df = pd.read_csv('merged_data.csv')
-
-    cols_to_process = df.columns.difference(
-        ['HashOwner', 'HashApp', 'HashFunction', 'AverageAllocatedMb', 'AverageDurations'])
-
-    # Step 1: Calculate the minimum number of containers needed per minute.
-    minute_columns = df[cols_to_process]  # Adjust based on your data
-    container_df = df[['HashFunction']].copy()
-    for minute in minute_columns:
-        container_df[minute] = np.ceil(minute_columns[minute] * df['AverageDurations'] / 1000 / 60).astype(int)
-
-    cold_start_1min_df = df[['HashFunction']].copy()
-    cold_start_1min_vertical_df = cold_start_1min_df.copy()
-    for minute in minute_columns:
-        if minute == '1':
-            continue
-        else:
-            cold_start_1min_df[minute] = np.maximum(container_df[minute] - container_df[str(int(minute) - 1)], 0)
-            cold_start_1min_vertical_df[minute] = (
-                    (container_df[minute] > 0) & (container_df[str(int(minute) - 1)] == 0)).astype(int)
-    cold_start_1min_df['1'] = cold_start_1min_df[cold_start_1min_df.columns.difference(['HashFunction', '1'])].sum(
-        axis="columns")
-    cold_start_1min_vertical_df['1'] = cold_start_1min_vertical_df[
-        cold_start_1min_vertical_df.columns.difference(['HashFunction', '1'])].sum(
-        axis="columns")
-
-    cold_start_10min_df = df[['HashFunction']].copy()
-    cold_start_10min_vertical_df = cold_start_10min_df.copy()
-    for minute in minute_columns:
-        if minute == '1':
-            continue
-        else:
-            warm_list = [str(i) for i in range(max(1, int(minute) - 10), int(minute))]
-            cold_start_10min_df[minute] = np.maximum(container_df[minute] - container_df[warm_list].max(axis=1), 0)
-            cold_start_10min_vertical_df[minute] = (
-                    (container_df[minute] > 0) & (container_df[warm_list].max(axis=1) == 0)).astype(int)
-    cold_start_10min_df['1'] = cold_start_10min_df[cold_start_10min_df.columns.difference(['HashFunction', '1'])].sum(
-        axis="columns")
-    cold_start_10min_vertical_df['1'] = cold_start_10min_vertical_df[cold_start_10min_vertical_df.columns.difference(
-        ['HashFunction', '1'])].sum(
-        axis="columns")
-
-    cold_start_60min_df = df[['HashFunction']].copy()
-    cold_start_60min_vertical_df = cold_start_60min_df.copy()
-    for minute in minute_columns:
-        if minute in [str(i) for i in range(1, 61)]:
-            continue
-        else:
-            warm_list = [str(i) for i in range(max(1, int(minute) - 60), int(minute))]
-            cold_start_60min_df[minute] = np.maximum(container_df[minute] - container_df[warm_list].max(axis=1), 0)
-            cold_start_60min_vertical_df[minute] = (
-                    (container_df[minute] > 0) & (container_df[warm_list].max(axis=1) == 0)).astype(int)
-    cold_start_60min_df['1'] = cold_start_60min_df[cold_start_60min_df.columns.difference(['HashFunction', '1'])].sum(
-        axis="columns")
-    cold_start_60min_vertical_df['1'] = cold_start_60min_vertical_df[cold_start_60min_vertical_df.columns.difference(
-        ['HashFunction', '1'])].sum(
-        axis="columns")
-
-    print(cold_start_1min_df['1'].sum(), cold_start_1min_vertical_df['1'].sum(), cold_start_10min_df['1'].sum(),
-          cold_start_10min_vertical_df['1'].sum(), cold_start_60min_df['1'].sum(),
-          cold_start_60min_vertical_df['1'].sum())
-
-    return [cold_start_1min_df, cold_start_1min_vertical_df, cold_start_10min_df, cold_start_10min_vertical_df,
-            cold_start_60min_df, cold_start_60min_vertical_df]
+# keep-alive windows in minutes, a container stays warm for `window` minutes after its last use
+WINDOWS = [1, 10, 60]
+# minutes before the first counted one: the 60 minute window only counts once a whole window has passed, the other
+# windows count from minute 2 with a truncated window
+WARMUP = {60: 60}
+
+
+def rolling_max(x, window):
+    # out[:, j] = max(x[:, j - window + 1:j + 1]), truncated at the first column (van Herk/Gil-Werman: a prefix and
+    # a suffix max inside blocks of `window` columns, 3 comparisons per element whatever the window)
+    rows, n = x.shape
+    blocks = -(-(n + window - 1) // window)
+    padded = np.zeros((rows, blocks * window), dtype=x.dtype)
+    # counts are never negative, so the zero padding does not change any max
+    padded[:, window - 1:window - 1 + n] = x
+    padded = padded.reshape(rows, blocks, window)
+    prefix = np.maximum.accumulate(padded, axis=2).reshape(rows, -1)
+    suffix = np.maximum.accumulate(padded[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+    return np.maximum(suffix[:, :n], prefix[:, window - 1:window - 1 + n])
+
+
+def cold_start_counts(containers, windows=WINDOWS, warmup=WARMUP, jobs=1):
+    # for every window, (horizontal, vertical) cold starts per function and minute: horizontal scaling starts the
+    # containers missing from the warm ones, vertical scaling starts one VM when none is warm (the counts are
+    # unsigned, a - min(a, b) is max(a - b, 0))
+    if jobs > 1:
+        parts = parallel.map_shards(cold_start_counts, [containers], windows, warmup, jobs=jobs)
+        return {window: (parts[0][window][0], np.concatenate([part[window][1] for part in parts]),
+                         np.concatenate([part[window][2] for part in parts])) for window in windows}
+    results = {}
+    for window in windows:
+        first = warmup.get(window, 1)
+        warm = rolling_max(containers, window)[:, first - 1:-1]
+        current = containers[:, first:]
+        horizontal = current - np.minimum(current, warm)
+        vertical = ((current > 0) & (warm == 0)).astype(np.uint8)
+        results[window] = (first, horizontal, vertical)
+    return results
+
+
+def to_frame(hash_function, columns, first, counts):
+    # HashFunction, the counted minutes in the column order of the original script, and their total in column '1'
+    names = columns[first:]
+    df = pd.DataFrame(counts, columns=names)
+    df = df[sorted(names)]
+    df.insert(0, 'HashFunction', hash_function.to_numpy())
+    df['1'] = counts.sum(axis=1)
+    return df
+
+
+def cold_start(windows=WINDOWS, warmup=WARMUP, source='merged_data.csv', jobs=1):
+    # Step 1: the minimum number of containers needed per minute, from the cache of merged_data.csv
+    meta, _, containers = cache.load(source)
+    columns = [str(m) for m in range(1, containers.shape[1] + 1)]
+
+    results = {}
+    for window, (first, horizontal, vertical) in cold_start_counts(containers, windows, warmup, jobs).items():
+        results[window] = (to_frame(meta['HashFunction'], columns, first, horizontal),
+                           to_frame(meta['HashFunction'], columns, first, vertical))
+        print("{}min: {} horizontal, {} vertical".format(window, horizontal.sum(), vertical.sum()))
+    return results
 
 
 def save_to_csv(df, filename):
@@ -77,14 +75,17 @@ def save_to_csv(df, filename):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("windows", nargs="*", type=int, default=WINDOWS, help="keep-alive windows in minutes")
+    parser.add_argument("--source", default="merged_data.csv",
+                        help="merged_data.csv, or the output directory of merge.py stream or reconstruct.py")
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+
     result_dir = "statistics/cold-start-counts"
     if not os.path.exists(result_dir):
         os.makedirs(result_dir)
 
-    results = cold_start()
-    save_to_csv(results[0], os.path.join(result_dir, "1min_horizontal.csv"))
-    save_to_csv(results[1], os.path.join(result_dir, "1min_vertical.csv"))
-    save_to_csv(results[2], os.path.join(result_dir, "10min_horizontal.csv"))
-    save_to_csv(results[3], os.path.join(result_dir, "10min_vertical.csv"))
-    save_to_csv(results[4], os.path.join(result_dir, "60min_horizontal.csv"))
-    save_to_csv(results[5], os.path.join(result_dir, "60min_vertical.csv"))
+    for window, (horizontal, vertical) in cold_start(args.windows, source=args.source, jobs=args.jobs).items():
+        save_to_csv(horizontal, os.path.join(result_dir, "{}min_horizontal.csv".format(window)))
+        save_to_csv(vertical, os.path.join(result_dir, "{}min_vertical.csv".format(window)))
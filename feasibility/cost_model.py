@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+from cold_start import WARMUP, rolling_max
+
+# keep-alive window in minutes, a VM is torn down after this long without containers
+WINDOW = 10
+# ms an invocation waits for a VM to boot
+COLD_START_MS = 500
+SEED = 0
+CHUNK_ROWS = 4096
+# the added latencies are kept in a histogram of log-spaced bins, 1us to 1000s
+BINS = np.concatenate([[0], np.logspace(-3, 6, 1801)])
+QUANTILES = [50, 90, 99, 99.9, 99.99]
+
+
+class LatencyDistribution:
+    # the use_time samples (ms) of one mechanism and direction by scaled size (MB): a draw for a size between two
+    # measured sizes interpolates the quantiles of both, a size outside extrapolates from the nearest two
+
+    def __init__(self, samples):
+        by_size = {}
+        for s in samples:
+            by_size.setdefault(s["size"], []).append(s["use_time"])
+        self.sizes = np.array(sorted(by_size), dtype=np.float64)
+        self.values = [np.sort(by_size[size]) for size in sorted(by_size)]
+
+    def quantile(self, i, u):
+        values = self.values[i]
+        return np.interp(u * (len(values) - 1), np.arange(len(values)), values)
+
+    def draw(self, size_mb, u):
+        # latency in ms of scaling each of `size_mb` with the quantile `u`, the same u for every mechanism
+        if len(self.sizes) == 1:
+            return self.quantile(0, u) * size_mb / self.sizes[0]
+        segment = np.clip(np.searchsorted(self.sizes, size_mb) - 1, 0, len(self.sizes) - 2)
+        result = np.empty(len(size_mb))
+        for i in np.unique(segment):
+            rows = segment == i
+            low, high = self.quantile(i, u[rows]), self.quantile(i + 1, u[rows])
+            weight = (size_mb[rows] - self.sizes[i]) / (self.sizes[i + 1] - self.sizes[i])
+            result[rows] = low + (high - low) * weight
+        return np.maximum(result, 0)
+
+
+def load_latencies(path):
+    # {mechanism: {"up": LatencyDistribution, "down": ...}} from the results.json of the scale harness
+    with open(path) as f:
+        samples = json.load(f)["samples"]
+    mechanisms = {}
+    for s in samples:
+        if s["direction"] in ("up", "down"):
+            mechanisms.setdefault(s["setting"], {}).setdefault(s["direction"], []).append(s)
+    return {mechanism: {direction: LatencyDistribution(directions[direction]) for direction in ("up", "down")}
+            for mechanism, directions in mechanisms.items() if {"up", "down"} <= directions.keys()}
+
+
+def scale_events(containers, window=WINDOW, first=1):
+    # per function and minute from `first` on, under vertical scaling: a VM boots (a cold start) with one container
+    # when no container ran in the last `window` minutes and scales up to the others, follows the containers while
+    # they run, keeps one container while idle inside the window and is torn down after it; returns (VMs booted,
+    # containers added by a scale up, containers removed by a scale down) and the cold starts of horizontal scaling
+    warm = np.zeros_like(containers)
+    warm[:, 1:] = rolling_max(containers, window)[:, :-1]
+    size = np.where(containers > 0, containers, (warm > 0).astype(containers.dtype))
+    previous, size = size[:, first - 1:-1], size[:, first:]
+    current, warm = containers[:, first:], warm[:, first:]
+    cold = ((warm == 0) & (current > 0)).astype(containers.dtype)
+    up = np.where(warm > 0, np.maximum(size - previous, 0), current - cold)
+    down = np.where(warm > 0, np.maximum(previous - size, 0), 0)
+    horizontal = current - np.minimum(current, warm)
+    return cold, up, down, horizontal
+
+
+class Cost:
+    # total and per-invocation added latency of one mechanism, the invocations of a minute are spread over its
+    # containers and the first one on a new container waits for it
+
+    def __init__(self):
+        self.totals = {"cold_starts": 0, "scale_ups": 0, "scale_downs": 0, "cold_start_ms": 0.0, "scale_up_ms": 0.0,
+                       "scale_down_ms": 0.0, "delayed_invocations": 0}
+        self.histogram = np.zeros(len(BINS))
+
+    def charge(self, kind, latency_ms, delayed=None, events=None):
+        # `events` scalings or boots of `latency_ms` each, holding back `delayed` invocations for that long; without
+        # `delayed` they are off the invocation path and only their own time counts
+        self.totals[kind + "s"] += len(latency_ms) if events is None else int(events.sum())
+        if delayed is None:
+            self.totals[kind + "_ms"] += float(latency_ms.sum())
+        else:
+            self.totals[kind + "_ms"] += float((latency_ms * delayed).sum())
+            self.totals["delayed_invocations"] += int(delayed.sum())
+            bins = np.minimum(np.searchsorted(BINS, latency_ms), len(BINS) - 1)
+            self.histogram += np.bincount(bins, weights=delayed, minlength=len(BINS))
+
+    def summary(self, invocations):
+        # the scale downs do not hold an invocation back, the added latency is the wait for the boots and the scale ups
+        result = dict(self.totals)
+        result["added_ms"] = result["cold_start_ms"] + result["scale_up_ms"]
+        result["mean_added_ms"] = result["added_ms"] / invocations if invocations else 0.0
+        histogram = self.histogram.copy()
+        histogram[0] += invocations - result["delayed_invocations"]
+        cdf = np.cumsum(histogram) / histogram.sum() if histogram.sum() else np.ones(len(BINS))
+        for q in QUANTILES:
+            result["p{}_ms".format(q)] = float(BINS[min(np.searchsorted(cdf, q / 100), len(BINS) - 1)])
+        return result
+
+
+def cost_model(latency_file, source='merged_data.csv', window=WINDOW, cold_start_ms=COLD_START_MS, seed=SEED):
+    latencies = load_latencies(latency_file)
+    meta, invocations, containers = cache.load(source)
+    memory = meta['AverageAllocatedMb'].to_numpy(dtype=np.float64)
+    first = WARMUP.get(window, 1)
+    costs = {mechanism: Cost() for mechanism in ["horizontal"] + list(latencies)}
+    rng = np.random.default_rng(seed)
+    total_invocations = 0
+    for start in range(0, len(containers), CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        chunk = np.asarray(containers[rows], dtype=np.int64)
+        calls = np.asarray(invocations[rows, first:], dtype=np.int64)
+        total_invocations += int(calls.sum())
+        cold, up, down, horizontal = scale_events(chunk, window, first)
+        mb = np.broadcast_to(memory[rows, None], up.shape)
+
+        # every container horizontal scaling starts is a VM boot
+        delayed = np.minimum(horizontal, calls)[horizontal > 0]
+        costs["horizontal"].charge("cold_start", np.full(len(delayed), float(cold_start_ms)), delayed,
+                                   horizontal[horizontal > 0])
+        cold_delayed = np.minimum(cold, calls)[cold > 0]
+        # the first invocation of a boot waits for the VM, the next ones for the scale up
+        up_delayed = np.minimum(up, calls - np.minimum(cold, calls))[up > 0]
+        up_size, down_size = (up * mb)[up > 0], (down * mb)[down > 0]
+        # common random numbers: every mechanism draws the same quantile for an event
+        up_u, down_u = rng.random(len(up_size)), rng.random(len(down_size))
+        for mechanism, distributions in latencies.items():
+            cost = costs[mechanism]
+            cost.charge("cold_start", np.full(len(cold_delayed), float(cold_start_ms)), cold_delayed)
+            cost.charge("scale_up", distributions["up"].draw(up_size, up_u), up_delayed)
+            cost.charge("scale_down", distributions["down"].draw(down_size, down_u))
+    return pd.DataFrame([dict(mechanism=mechanism, **cost.summary(total_invocations))
+                         for mechanism, cost in costs.items()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("latencies", help="results.json of the scale harness")
+    parser.add_argument("--source", default="merged_data.csv",
+                        help="merged_data.csv, or the output directory of merge.py stream or reconstruct.py")
+    parser.add_argument("--window", type=int, default=WINDOW, help="keep-alive window in minutes")
+    parser.add_argument("--cold-start-ms", type=float, default=COLD_START_MS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    result_dir = "statistics/cost"
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    result = cost_model(args.latencies, args.source, args.window, args.cold_start_ms, args.seed)
+    result.to_csv(os.path.join(result_dir, "cost.csv"), index=False)
+    print(result.to_string(index=False))
@@ -0,0 +1,86 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import parallel
+import vm_counts
+from cold_start import WINDOWS, WARMUP, cold_start_counts
+
+# the functions sharing a VM at each level
+LEVELS = {"function": ['HashOwner', 'HashApp', 'HashFunction'], "app": ['HashOwner', 'HashApp'],
+          "owner": ['HashOwner']}
+# caps of the capped VM counts, containers per VM
+CAPS = [8, 16]
+MINUTE_BLOCK = 64
+
+
+def group_reduce(containers, memory, groups):
+    # (containers, memory) per group and minute: the rows sorted by group and summed with np.add.reduceat, in blocks
+    # of minutes so that only a block of the memory map is read at a time
+    order = np.argsort(groups, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(groups[order]) != 0])
+    weights = np.asarray(memory, dtype=np.float64)[order, None]
+    grouped = np.zeros((len(starts), containers.shape[1]), dtype=np.int64)
+    grouped_memory = np.zeros((len(starts), containers.shape[1]))
+    for start in range(0, containers.shape[1], MINUTE_BLOCK):
+        block = np.asarray(containers[order, start:start + MINUTE_BLOCK], dtype=np.int64)
+        grouped[:, start:start + MINUTE_BLOCK] = np.add.reduceat(block, starts, axis=0)
+        grouped_memory[:, start:start + MINUTE_BLOCK] = np.add.reduceat(block * weights, starts, axis=0)
+    return grouped, grouped_memory
+
+
+def level_statistics(containers, memory, windows=WINDOWS, warmup=WARMUP, jobs=1):
+    # cold starts and VM counts when each row of `containers` is one VM, `memory` its MB per minute
+    result = {"vms": len(containers)}
+    for window, (_, horizontal, vertical) in cold_start_counts(containers, windows, warmup, jobs).items():
+        result["{}min_horizontal".format(window)] = int(horizontal.sum(dtype=np.int64))
+        result["{}min_vertical".format(window)] = int(vertical.sum(dtype=np.int64))
+    values, hist = vm_counts.minute_histogram(containers, jobs)
+    active = vm_counts.minute_statistics(values, hist)[1]
+    result["peak_active_vms"], result["mean_active_vms"] = int(active.max(initial=0)), float(active.mean())
+    for cap, vms in zip(CAPS, vm_counts.vms_needed(values, hist, CAPS).T):
+        result["peak_vms_cap{}".format(cap)], result["mean_vms_cap{}".format(cap)] = int(vms.max()), float(vms.mean())
+    result["peak_vm_mb"] = float(memory.max(initial=0))
+    return result
+
+
+def grouping(levels=("function", "app", "owner"), source='merged_data.csv', windows=WINDOWS, warmup=WARMUP, jobs=1):
+    # one row per level, with the cold starts of every level relative to one VM per function
+    meta, _, containers = cache.load(source)
+    rows = []
+    for level in levels:
+        groups = meta.groupby(LEVELS[level], sort=False, observed=True).ngroup().to_numpy()
+        grouped, memory = group_reduce(containers, meta['AverageAllocatedMb'], groups)
+        rows.append(dict(level=level, **level_statistics(grouped, memory, windows, warmup, jobs)))
+        print("{}: {} VMs".format(level, len(grouped)))
+    df = pd.DataFrame(rows)
+    if "function" in levels:
+        baseline = df[df['level'] == "function"].iloc[0]
+        for window in windows:
+            for kind in ("horizontal", "vertical"):
+                column = "{}min_{}".format(window, kind)
+                df[column + "_reduction"] = 1 - df[column] / baseline[column] if baseline[column] else 0.0
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("levels", nargs="*", default=list(LEVELS),
+                        help="the functions sharing a VM: {}".format(", ".join(LEVELS)))
+    parser.add_argument("--source", default="merged_data.csv",
+                        help="merged_data.csv, or the output directory of merge.py stream or reconstruct.py")
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+    if set(args.levels) - set(LEVELS):
+        parser.error("unknown levels {}".format(", ".join(sorted(set(args.levels) - set(LEVELS)))))
+
+    result_dir = "statistics/grouping"
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    result = grouping(args.levels, args.source, jobs=args.jobs)
+    result.to_csv(os.path.join(result_dir, "grouping.csv"), index=False)
+    print(result.to_string(index=False))
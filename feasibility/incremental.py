@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import vm_counts
+from cold_start import WINDOWS, WARMUP, cold_start_counts, rolling_max, save_to_csv, to_frame
+
+STATE_DIR = '.incremental'
+KEYS = ['HashOwner', 'HashApp', 'HashFunction']
+
+
+def pad_tail(matrix, width):
+    # the last `width` minutes, zeros in front when there are fewer: counts are never negative, so the zeros do not
+    # change any window max
+    tail = np.zeros((len(matrix), width), dtype=np.int64)
+    columns = min(width, matrix.shape[1])
+    if columns:
+        tail[:, width - columns:] = matrix[:, -columns:]
+    return tail
+
+
+class State:
+    # everything the cold start and VM count statistics need to take new data without going over the old again:
+    # per function, the last minutes of container counts the keep-alive windows look back on, the cold start totals
+    # and the minute CDF_x columns of the CDF tables; per minute, the VM count statistics summed over the functions.
+    # The per-minute cold starts are kept as one block per batch for the CSV files.
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.dir = state_dir
+        self.manifest = {"minutes": 0, "windows": WINDOWS, "warmup": WARMUP, "max_cap": vm_counts.MAX_CAP,
+                         "batches": [], "blocks": []}
+        self.functions = pd.DataFrame(columns=KEYS)
+        self.arrays = {}
+        if os.path.exists(os.path.join(state_dir, 'state.json')):
+            with open(os.path.join(state_dir, 'state.json')) as f:
+                self.manifest = json.load(f)
+            self.manifest["warmup"] = {int(w): m for w, m in self.manifest["warmup"].items()}
+            self.functions = pd.read_parquet(os.path.join(state_dir, 'functions.parquet'))
+            with np.load(os.path.join(state_dir, 'state.npz')) as arrays:
+                self.arrays = dict(arrays)
+        else:
+            self.arrays = {"tail": np.zeros((0, max(WINDOWS)), dtype=np.int64),
+                           "totals": np.zeros((0, len(WINDOWS), 2), dtype=np.int64),
+                           "cdf_invocations": np.zeros((0, int(vm_counts.CDF_x)), dtype=np.int64),
+                           "cdf_containers": np.zeros((0, int(vm_counts.CDF_x)), dtype=np.int64),
+                           "statistics": np.zeros((4, 0), dtype=np.int64),
+                           "vms": np.zeros((0, vm_counts.MAX_CAP), dtype=np.int64)}
+
+    @property
+    def minutes(self):
+        return self.manifest["minutes"]
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.functions.to_parquet(os.path.join(self.dir, 'functions.parquet'), index=False)
+        np.savez(os.path.join(self.dir, 'state.tmp.npz'), **self.arrays)
+        os.replace(os.path.join(self.dir, 'state.tmp.npz'), os.path.join(self.dir, 'state.npz'))
+        with open(os.path.join(self.dir, 'state.json'), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def rows(self, meta):
+        # the state rows of the batch functions, functions seen for the first time are appended
+        keys = meta[KEYS].astype(str)
+        index = pd.MultiIndex.from_frame(self.functions[KEYS].astype(str))
+        rows = index.get_indexer(pd.MultiIndex.from_frame(keys))
+        new = rows < 0
+        rows[new] = len(self.functions) + np.arange(new.sum())
+        self.functions = pd.concat([self.functions, keys[new]], ignore_index=True) if len(self.functions) else \
+            keys[new].reset_index(drop=True)
+        for name in ("tail", "totals", "cdf_invocations", "cdf_containers"):
+            array = self.arrays[name]
+            self.arrays[name] = np.concatenate([array, np.zeros((new.sum(),) + array.shape[1:], dtype=array.dtype)])
+        return rows, new
+
+    def add(self, source, functions=False):
+        # a batch either continues the minutes of the state (its functions may be new or not, the functions it does
+        # not have are idle in its minutes) or, with `functions`, brings new functions over all the minutes so far
+        meta, invocations, containers = cache.load(source)
+        first_minute = 0 if functions else self.minutes
+        if functions and containers.shape[1] != self.minutes:
+            raise ValueError("{} has {} minutes, the state has {}".format(source, containers.shape[1], self.minutes))
+        rows, new = self.rows(meta)
+        if functions and not new.all():
+            raise ValueError("{} has functions the state already has".format(source))
+        containers = np.asarray(containers, dtype=np.int64)
+
+        block = {"rows": rows}
+        for w, window in enumerate(self.manifest["windows"]):
+            first = self.manifest["warmup"].get(window, 1)
+            if functions:
+                _, horizontal, vertical = cold_start_counts(containers, [window], {window: first})[window]
+            else:
+                # the window max of the new minutes looks back on the kept tail
+                before = self.arrays["tail"][rows]
+                extended = np.concatenate([before, containers], axis=1)
+                warm = rolling_max(extended, window)[:, before.shape[1] - 1:-1]
+                skip = max(first - first_minute, 0)
+                current, warm = containers[:, skip:], warm[:, skip:]
+                horizontal = current - np.minimum(current, warm)
+                vertical = ((current > 0) & (warm == 0)).astype(np.uint8)
+            self.arrays["totals"][rows, w, 0] += horizontal.sum(axis=1, dtype=np.int64)
+            self.arrays["totals"][rows, w, 1] += vertical.sum(axis=1, dtype=np.int64)
+            block["{}_horizontal".format(window)] = horizontal
+            block["{}_vertical".format(window)] = vertical
+        name = "block-{}.npz".format(len(self.manifest["blocks"]))
+        os.makedirs(os.path.join(self.dir, 'blocks'), exist_ok=True)
+        np.savez(os.path.join(self.dir, 'blocks', name), **block)
+        self.manifest["blocks"].append({"file": name, "minute": first_minute})
+
+        tail = self.arrays["tail"]
+        width = tail.shape[1]
+        if functions:
+            tail[rows] = pad_tail(containers, width)
+        else:
+            # the functions the batch does not have were idle in its minutes
+            kept = width - min(containers.shape[1], width)
+            idle = np.zeros_like(tail)
+            idle[:, :kept] = tail[:, width - kept:]
+            idle[rows] = pad_tail(np.concatenate([tail[rows], containers], axis=1), width)
+            self.arrays["tail"] = idle
+
+        # the minutes of the CDF columns the batch covers
+        cdf_minutes = range(first_minute, min(first_minute + containers.shape[1], int(vm_counts.CDF_x)))
+        if len(cdf_minutes):
+            columns = list(cdf_minutes)
+            self.arrays["cdf_invocations"][np.ix_(rows, columns)] = invocations[:, [m - first_minute for m in columns]]
+            self.arrays["cdf_containers"][np.ix_(rows, columns)] = containers[:, [m - first_minute for m in columns]]
+
+        values, hist = vm_counts.minute_histogram(containers)
+        statistics = vm_counts.minute_statistics(values, hist)
+        vms = vm_counts.vms_needed(values, hist, np.arange(1, self.manifest["max_cap"] + 1))
+        if functions:
+            self.arrays["statistics"] += statistics
+            self.arrays["vms"] += vms
+        else:
+            self.arrays["statistics"] = np.concatenate([self.arrays["statistics"], statistics], axis=1)
+            self.arrays["vms"] = np.concatenate([self.arrays["vms"], vms])
+            self.manifest["minutes"] += containers.shape[1]
+        self.manifest["batches"].append({"source": os.path.abspath(source), "functions": functions,
+                                         "minute": first_minute, "block": name})
+
+    def cold_starts(self, window):
+        # (horizontal, vertical) per function and counted minute, put together from the blocks
+        first = self.manifest["warmup"].get(window, 1)
+        counts = [np.zeros((len(self.functions), self.minutes), dtype=np.int64) for _ in range(2)]
+        for block in self.manifest["blocks"]:
+            with np.load(os.path.join(self.dir, 'blocks', block["file"])) as arrays:
+                start = max(block["minute"], first)
+                for matrix, kind in zip(counts, ("horizontal", "vertical")):
+                    part = arrays["{}_{}".format(window, kind)]
+                    matrix[arrays["rows"], start:start + part.shape[1]] = part
+        return counts[0][:, first:], counts[1][:, first:]
+
+    def vm_statistics(self, caps=vm_counts.CDF_CAPS):
+        curve, per_minute = vm_counts.capacity_frames(self.arrays["vms"])
+        tables = (vm_counts.cdf_tables(self.arrays["cdf_invocations"], self.arrays["cdf_containers"], caps)
+                  if self.minutes >= int(vm_counts.CDF_x) else {})
+        return vm_counts.statistics_rows(self.arrays["statistics"]), tables, curve, per_minute
+
+    def export(self, result_dir="statistics", caps=vm_counts.CDF_CAPS, cold_start_csv=True):
+        vm_counts.save(os.path.join(result_dir, "vm-counts"), *self.vm_statistics(caps))
+        cold_start_dir = os.path.join(result_dir, "cold-start-counts")
+        os.makedirs(cold_start_dir, exist_ok=True)
+        totals = self.functions[['HashFunction']].copy()
+        for w, window in enumerate(self.manifest["windows"]):
+            totals["{}min_horizontal".format(window)] = self.arrays["totals"][:, w, 0]
+            totals["{}min_vertical".format(window)] = self.arrays["totals"][:, w, 1]
+        save_to_csv(totals, os.path.join(cold_start_dir, "totals.csv"))
+        if not cold_start_csv:
+            return
+        # the per-minute files hold every minute, so writing them costs as much as their size
+        columns = [str(m) for m in range(1, self.minutes + 1)]
+        for window in self.manifest["windows"]:
+            first = self.manifest["warmup"].get(window, 1)
+            for kind, counts in zip(("horizontal", "vertical"), self.cold_starts(window)):
+                df = to_frame(self.functions['HashFunction'], columns, first, counts)
+                save_to_csv(df, os.path.join(cold_start_dir, "{}min_{}.csv".format(window, kind)))
+
+    def recompute(self):
+        # the invocations and container matrices of every batch put together, in the rows of the state
+        invocations = np.zeros((len(self.functions), self.minutes), dtype=np.int64)
+        containers = np.zeros((len(self.functions), self.minutes), dtype=np.int64)
+        for batch in self.manifest["batches"]:
+            meta, batch_invocations, batch_containers = cache.load(batch["source"])
+            with np.load(os.path.join(self.dir, 'blocks', batch["block"])) as arrays:
+                rows = arrays["rows"]
+            columns = slice(batch["minute"], batch["minute"] + batch_containers.shape[1])
+            invocations[rows, columns] = batch_invocations
+            containers[rows, columns] = batch_containers
+        return invocations, containers
+
+    def verify(self, caps=vm_counts.CDF_CAPS):
+        # the differences between the incremental results and a full recompute over the batches, none when they match
+        invocations, containers = self.recompute()
+        errors = []
+        full = cold_start_counts(containers, self.manifest["windows"], self.manifest["warmup"])
+        for window, (_, horizontal, vertical) in full.items():
+            incremental = self.cold_starts(window)
+            for kind, expected, actual in zip(("horizontal", "vertical"), (horizontal, vertical), incremental):
+                if not np.array_equal(expected, actual):
+                    errors.append("{}min {} cold starts".format(window, kind))
+
+        result, tables, curve, per_minute = vm_counts.process_data_dynamic(None, invocations, containers, caps,
+                                                                           self.manifest["max_cap"])
+        incremental = self.vm_statistics(caps)
+        if result != incremental[0]:
+            errors.append("vm count statistics")
+        if tables.keys() != incremental[1].keys() or not all(tables[c].equals(incremental[1][c]) for c in tables):
+            errors.append("CDF tables")
+        if not curve.equals(incremental[2]) or not per_minute.equals(incremental[3]):
+            errors.append("capacity curve")
+        return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="*",
+                        help="batches in order: merged_data.csv files or output directories of merge.py stream")
+    parser.add_argument("--functions", action="store_true",
+                        help="the batches bring new functions over the minutes so far instead of new minutes")
+    parser.add_argument("--state", default=STATE_DIR, help="state directory")
+    parser.add_argument("--caps", nargs="*", type=int, default=vm_counts.CDF_CAPS, help="caps of the CDF tables")
+    parser.add_argument("--totals-only", action="store_true",
+                        help="write the cold start totals but not the per-minute cold start files")
+    parser.add_argument("--verify", action="store_true", help="compare the results with a full recompute")
+    args = parser.parse_args()
+
+    state = State(args.state)
+    for source in args.sources:
+        state.add(source, args.functions)
+        print("{}: {} functions, {} minutes".format(source, len(state.functions), state.minutes))
+    state.save()
+    state.export(caps=args.caps, cold_start_csv=not args.totals_only)
+
+    if args.verify:
+        errors = state.verify(args.caps)
+        print("verify: " + ("ok" if not errors else "mismatch in " + ", ".join(errors)))
+        if errors:
+            raise SystemExit(1)
@@ -1,5 +1,18 @@
+import glob
+import json
+import os
+import re
+import resource
+import sys
+import time
+
+import numpy as np
 import pandas as pd
 
+MINUTES_PER_DAY = 1440
+CHUNK_SIZE = 20000
+KEYS = ['HashOwner', 'HashApp', 'HashFunction']
+
 
 def merge_tables(df1, df2, df3):
     # 扩展表2以包含HashFunction信息
@@ -13,7 +26,117 @@ def merge_tables(df1, df2, df3):
     return final_merged
 
 
-if __name__ == '__main__':
+def day_files(data_dir, prefix):
+    # {"d01": path, ...} of one kind of trace file
+    files = glob.glob(os.path.join(data_dir, prefix + '.anon.d*.csv'))
+    return {re.search(r'\.(d\d+)\.csv$', f).group(1): f for f in sorted(files)}
+
+
+def memory_mb():
+    # current and peak RSS of this process in MB
+    with open('/proc/self/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    return rss / 1024 / 1024, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(step, day, start):
+    rss, peak = memory_mb()
+    print("{} {}: {:.1f}s, rss {:.0f}MB, peak {:.0f}MB".format(step, day, time.perf_counter() - start, rss, peak))
+
+
+def function_key(df):
+    return df['HashOwner'] + df['HashApp'] + df['HashFunction']
+
+
+def collect_metadata(invocation_files, duration_files, memory_files, chunksize):
+    # pass 1: the functions of every day, their durations weighted by invocation count and the memory of their app
+    # weighted by sample count, all days together
+    functions, durations, memory = [], [], []
+    for day, path in invocation_files.items():
+        start = time.perf_counter()
+        for chunk in pd.read_csv(path, usecols=KEYS + ['Trigger'], chunksize=chunksize):
+            functions.append(chunk.drop_duplicates(KEYS))
+        if day in duration_files:
+            for chunk in pd.read_csv(duration_files[day], chunksize=chunksize):
+                percentiles = [c for c in chunk.columns if c.startswith('percentile_Average_')]
+                part = chunk[KEYS + percentiles].copy()
+                part['weighted'] = chunk['Average'] * chunk['Count']
+                part['Count'] = chunk['Count']
+                part['days'] = 1
+                durations.append(part)
+        if day in memory_files:
+            for chunk in pd.read_csv(memory_files[day], usecols=['HashOwner', 'HashApp', 'SampleCount',
+                                                                 'AverageAllocatedMb'], chunksize=chunksize):
+                part = chunk[['HashOwner', 'HashApp', 'SampleCount']].copy()
+                part['weighted'] = chunk['AverageAllocatedMb'] * chunk['SampleCount']
+                memory.append(part)
+        report("pass 1", day, start)
+
+    functions = pd.concat(functions).drop_duplicates(KEYS)
+    durations = pd.concat(durations).groupby(KEYS).sum().reset_index()
+    percentiles = [c for c in durations.columns if c.startswith('percentile_Average_')]
+    durations[percentiles] = durations[percentiles].div(durations['days'], axis=0)
+    durations['AverageDurations'] = durations['weighted'] / durations['Count']
+    memory = pd.concat(memory).groupby(['HashOwner', 'HashApp']).sum().reset_index()
+    memory['AverageAllocatedMb'] = memory['weighted'] / memory['SampleCount']
+
+    # like merge_tables, only functions with durations and app memory are kept
+    meta = functions.merge(memory[['HashOwner', 'HashApp', 'AverageAllocatedMb']], on=['HashOwner', 'HashApp'])
+    meta = meta.merge(durations[KEYS + ['AverageDurations', 'Count'] + percentiles], on=KEYS)
+    meta = meta.reset_index(drop=True)
+    for column in KEYS + ['Trigger']:
+        meta[column] = meta[column].astype('category')
+    meta.insert(0, 'FunctionId', np.arange(len(meta), dtype=np.uint32))
+    meta.insert(1, 'OwnerId', meta['HashOwner'].cat.codes.astype(np.uint32))
+    meta.insert(2, 'AppId', (meta['HashOwner'].astype(str) + meta['HashApp'].astype(str)).astype('category')
+                .cat.codes.astype(np.uint32))
+    return meta
+
+
+def write_invocations(meta, invocation_files, out_dir, chunksize):
+    # pass 2: the invocations of every day into one (functions x days * 1440) uint32 matrix, the rows of a function
+    # listed more than once in a day (one per trigger) are summed
+    index = pd.Index(function_key(meta[KEYS].astype(str)))
+    matrix = np.lib.format.open_memmap(os.path.join(out_dir, 'invocations.npy'), mode='w+', dtype=np.uint32,
+                                       shape=(len(meta), len(invocation_files) * MINUTES_PER_DAY))
+    for i, (day, path) in enumerate(invocation_files.items()):
+        start = time.perf_counter()
+        minutes = [str(m) for m in range(1, MINUTES_PER_DAY + 1)]
+        for chunk in pd.read_csv(path, usecols=KEYS + minutes, dtype={m: np.uint32 for m in minutes},
+                                 chunksize=chunksize):
+            ids = index.get_indexer(function_key(chunk))
+            kept = ids >= 0
+            day_columns = matrix[:, i * MINUTES_PER_DAY:(i + 1) * MINUTES_PER_DAY]
+            np.add.at(day_columns, ids[kept], chunk[minutes].to_numpy()[kept])
+        matrix.flush()
+        report("pass 2", day, start)
+    return matrix
+
+
+def stream_merge(data_dir='data', out_dir='merged', chunksize=CHUNK_SIZE):
+    # merge all days in chunks into out_dir: meta.parquet (one row per function, hashes as categoricals and integer
+    # ids), invocations.npy (row FunctionId of meta, minute columns of all days one after the other) and
+    # manifest.json
+    start = time.perf_counter()
+    invocation_files = day_files(data_dir, 'invocations_per_function_md')
+    duration_files = day_files(data_dir, 'function_durations_percentiles')
+    memory_files = day_files(data_dir, 'app_memory_percentiles')
+    os.makedirs(out_dir, exist_ok=True)
+
+    meta = collect_metadata(invocation_files, duration_files, memory_files, chunksize)
+    meta.to_parquet(os.path.join(out_dir, 'meta.parquet'), index=False)
+    write_invocations(meta, invocation_files, out_dir, chunksize)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump({'days': list(invocation_files), 'minutes_per_day': MINUTES_PER_DAY, 'functions': len(meta)}, f,
+                  indent=2)
+    print("{} functions over {} days merged in {:.1f}s".format(len(meta), len(invocation_files),
+                                                               time.perf_counter() - start))
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['stream']:
+    # python3 merge.py stream [data_dir] [out_dir]
+    stream_merge(*sys.argv[2:])
+elif __name__ == '__main__':
     file_name1 = 'data/invocations_per_function_md.anon.d01.csv'
     file_name2 = 'data/app_memory_percentiles.anon.d01.csv'
     file_name3 = 'data/function_durations_percentiles.anon.d01.csv'
@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+JOBS = os.cpu_count() or 1
+
+
+def source(matrix):
+    # a whole memory-mapped .npy (what cache.load returns) goes to the workers as its path and every worker maps it
+    # again, anything else is pickled
+    if isinstance(matrix, np.memmap) and matrix.filename and matrix.flags.c_contiguous:
+        if np.load(matrix.filename, mmap_mode='r').shape == matrix.shape:
+            return matrix.filename
+    return matrix
+
+
+def shard_indexes(n, jobs, axis):
+    bounds = np.linspace(0, n, min(jobs, n) + 1).astype(np.int64)
+    slices = [slice(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+    return [(slice(None), s) if axis else s for s in slices]
+
+
+def run_shard(task):
+    func, sources, index, args, kwargs = task
+    shards = [(np.load(s, mmap_mode='r') if isinstance(s, str) else s)[index] for s in sources]
+    return func(*shards, *args, **kwargs)
+
+
+def map_shards(func, matrices, *args, jobs=JOBS, axis=0, **kwargs):
+    # func(*shards, *args, **kwargs) over contiguous shards of the rows (axis 0) or the columns (axis 1) of every
+    # matrix, in a pool of `jobs` processes; func must be a module level function, the results come back in shard
+    # order for the caller to merge
+    indexes = shard_indexes(matrices[0].shape[axis], jobs, axis)
+    if jobs <= 1 or len(indexes) <= 1:
+        return [func(*(m[i] for m in matrices), *args, **kwargs) for i in indexes]
+    sources = [source(m) for m in matrices]
+    with multiprocessing.Pool(len(indexes)) as pool:
+        return pool.map(run_shard, [(func, sources, i, args, kwargs) for i in indexes])
@@ -0,0 +1,167 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import cache
+import parallel
+from cold_start import WARMUP, rolling_max
+
+# functions with fewer idle periods than this have no usable histogram and fall back to a fixed keep-alive
+MIN_IDLE_PERIODS = 4
+HISTOGRAM_MARGIN = 0.1
+
+
+# A policy maps the container matrix (functions x minutes) to a per-function (prewarm, keepalive) in minutes: once a
+# container is last used at minute s it is unloaded until s + prewarm and kept warm from s + prewarm + 1 to
+# s + prewarm + keepalive. A fixed keep-alive window w is (0, w).
+
+def fixed(window):
+    def policy(containers):
+        rows = containers.shape[0]
+        return np.zeros(rows, dtype=np.int64), np.full(rows, window, dtype=np.int64)
+
+    return policy
+
+
+def idle_times(containers):
+    # (row, minutes between two consecutive active minutes) for every idle period of every function
+    rows, cols = np.nonzero(containers > 0)
+    same = rows[1:] == rows[:-1]
+    gaps = cols[1:] - cols[:-1]
+    keep = same & (gaps > 1)
+    return rows[1:][keep], gaps[keep]
+
+
+def row_percentile(rows, values, n_rows, q):
+    # nearest-rank q-th percentile of `values` per row, -1 for rows without values, and the number of values per row
+    order = np.lexsort((values, rows))
+    rows, values = rows[order], values[order]
+    counts = np.bincount(rows, minlength=n_rows)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.maximum(np.ceil(q / 100 * counts).astype(np.int64) - 1, 0)
+    result = np.full(n_rows, -1, dtype=np.int64)
+    has = counts > 0
+    result[has] = values[starts[has] + ranks[has]]
+    return result, counts
+
+
+def idle_percentile(q, fallback=10):
+    # keep alive until the q-th percentile of the function's idle times is covered, no prewarm
+    def policy(containers):
+        rows, gaps = idle_times(containers)
+        percentile, counts = row_percentile(rows, gaps, containers.shape[0], q)
+        keepalive = np.where(counts >= MIN_IDLE_PERIODS, percentile, fallback)
+        return np.zeros_like(keepalive), np.maximum(keepalive, 1)
+
+    return policy
+
+
+def hybrid(head=5, tail=99, fallback=10):
+    # the hybrid histogram policy: prewarm just before the head of the idle time histogram, keep alive until its
+    # tail, both with a 10% margin
+    def policy(containers):
+        rows, gaps = idle_times(containers)
+        n = containers.shape[0]
+        low, counts = row_percentile(rows, gaps, n, head)
+        high, _ = row_percentile(rows, gaps, n, tail)
+        prewarm = np.maximum(np.floor(low * (1 - HISTOGRAM_MARGIN)).astype(np.int64) - 1, 0)
+        keepalive = np.maximum(np.ceil(high * (1 + HISTOGRAM_MARGIN)).astype(np.int64) - prewarm, 1)
+        usable = counts >= MIN_IDLE_PERIODS
+        return np.where(usable, prewarm, 0), np.where(usable, keepalive, fallback)
+
+    return policy
+
+
+POLICIES = {"fixed": fixed, "idle": idle_percentile, "hybrid": hybrid}
+
+
+def parse_policy(spec):
+    # "fixed:10", "idle:99", "hybrid:5:99"
+    name, *args = spec.split(":")
+    return POLICIES[name](*(int(a) for a in args))
+
+
+def warmup(spec):
+    # the first minute cold_start.py counts for a fixed window, the minutes before it are the warm-up of the window
+    name, *args = spec.split(":")
+    return WARMUP.get(int(args[0]), 1) if name == "fixed" else 1
+
+
+def warm_containers(containers, prewarm, keepalive):
+    # containers kept warm at every minute, functions sharing a (prewarm, keepalive) go through the window engine
+    # together
+    warm = np.zeros(containers.shape, dtype=containers.dtype)
+    pairs, groups = np.unique(np.stack([prewarm, keepalive], axis=1), axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    for g, (p, k) in enumerate(pairs):
+        rows = np.nonzero(groups == g)[0]
+        shift = p + 1
+        if shift < containers.shape[1]:
+            warm[rows, shift:] = rolling_max(containers[rows], k)[:, :-shift]
+    return warm
+
+
+def simulate(containers, memory, policy, first):
+    # cold starts, idle VM-minutes and idle MB-minutes from minute `first` on: horizontal scaling keeps every warm
+    # container as a VM of its own, vertical scaling keeps one VM per function scaled down to one container when idle
+    prewarm, keepalive = policy(containers)
+    warm = warm_containers(containers, prewarm, keepalive)[:, first:]
+    current = containers[:, first:]
+    # the counts are unsigned, a - min(a, b) is max(a - b, 0)
+    idle_horizontal = warm - np.minimum(warm, current)
+    idle_vertical = (current == 0) & (warm > 0)
+    return {
+        "cold_starts_horizontal": int((current - np.minimum(current, warm)).sum()),
+        "cold_starts_vertical": int(((current > 0) & (warm == 0)).sum()),
+        "idle_vm_minutes_horizontal": int(idle_horizontal.sum()),
+        "idle_vm_minutes_vertical": int(idle_vertical.sum()),
+        "idle_mb_minutes_horizontal": float((idle_horizontal.sum(axis=1) * memory).sum()),
+        "idle_mb_minutes_vertical": float((idle_vertical.sum(axis=1) * memory).sum()),
+        "mean_prewarm": float(prewarm.mean()),
+        "mean_keepalive": float(keepalive.mean()),
+    }
+
+
+def simulate_spec(containers, memory, spec, first=None):
+    # simulate() of a policy given by its spec, which unlike the policy function can be sent to a worker process,
+    # from the policy's warm-up on by default
+    first = warmup(spec) if first is None else first
+    return simulate(containers, memory, parse_policy(spec), first), len(containers)
+
+
+def merge_results(parts):
+    # sums add up, the means are weighted by the functions of each shard
+    if len(parts) == 1:
+        return parts[0][0]
+    rows = sum(n for _, n in parts)
+    return {key: (sum(result[key] * n for result, n in parts) / rows if key.startswith("mean_") else
+                  sum(result[key] for result, _ in parts)) for key in parts[0][0]}
+
+
+def simulate_policies(specs, source='merged_data.csv', jobs=1):
+    # all the policies count from the same minute, the end of the longest warm-up among them
+    meta, _, containers = cache.load(source)
+    memory = meta['AverageAllocatedMb'].to_numpy(dtype=np.float64)
+    first = max(warmup(spec) for spec in specs)
+    return pd.DataFrame([dict(policy=spec, first=first, **merge_results(
+        parallel.map_shards(simulate_spec, [containers, memory], spec, first, jobs=jobs))) for spec in specs])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("specs", nargs="*", default=["fixed:1", "fixed:10", "fixed:60", "idle:90", "idle:99",
+                                                      "hybrid:5:99"], help="fixed:<w>, idle:<q> or hybrid:<head>:<tail>")
+    parser.add_argument("--source", default="merged_data.csv",
+                        help="merged_data.csv, or the output directory of merge.py stream or reconstruct.py")
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+
+    result_dir = "statistics/policies"
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    results = simulate_policies(args.specs, args.source, args.jobs)
+    results.to_csv(os.path.join(result_dir, "policies.csv"), index=False)
+    print(results.to_string(index=False))
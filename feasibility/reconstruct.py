@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import cache
+import parallel
+
+# the percentiles of function_durations_percentiles, as the percentile_Average_<p> columns of the merged trace
+PERCENTILES = [0, 1, 25, 50, 75, 99, 100]
+SECONDS = 60
+SEED = 0
+# invocations drawn at once: a group of functions stays below it, a function with more is done alone in blocks of
+# minutes on per-second arrays over the whole trace
+ARRIVAL_BUDGET = 1 << 22
+# per-second cells a group of functions may cover at most
+CELL_BUDGET = 1 << 24
+# a busy time that is an integer up to rounding needs that many instances, not one more
+EPSILON = 1e-9
+
+
+def duration_curves(meta):
+    # (functions x percentiles) durations in seconds, functions without a usable percentile curve get their average
+    # duration at every percentile
+    columns = ['percentile_Average_{}'.format(p) for p in PERCENTILES]
+    average = meta['AverageDurations'].to_numpy(dtype=np.float64)[:, None]
+    if not set(columns) <= set(meta.columns):
+        return np.repeat(average, len(PERCENTILES), axis=1) / 1000
+    curves = meta[columns].to_numpy(dtype=np.float64)
+    unusable = ~np.isfinite(curves).all(axis=1) | (np.diff(curves, axis=1) < 0).any(axis=1)
+    curves[unusable] = average[unusable]
+    return curves / 1000
+
+
+def arrivals(rng, counts, curve, first_minute):
+    # (start, end) in seconds since the start of the trace of the invocations of one function from `first_minute` on:
+    # every invocation of a minute lands on a uniformly drawn instant of it (a multinomial split of the count over its
+    # seconds) and runs for a duration drawn from the percentile curve, linear between the percentiles
+    minutes = np.repeat(np.arange(first_minute, first_minute + len(counts)), counts)
+    start = (minutes + rng.random(len(minutes))) * SECONDS
+    return start, start + np.interp(rng.random(len(minutes)) * 100, PERCENTILES, curve)
+
+
+def busy_events(start, end, owner, horizon):
+    # the busy time an interval adds to each second is a fraction of its first and last second and a whole second in
+    # between: (owner, second, fraction) of the partial seconds and (owner, second, +1/-1) of a difference array for
+    # the whole ones, second `horizon` takes whatever runs past the end of the trace
+    a = np.floor(start).astype(np.int64)
+    b = np.minimum(np.floor(end), horizon).astype(np.int64)
+    same = a == b
+    last = ~same & (b < horizon)
+    partial = (np.concatenate([owner, owner[last]]), np.concatenate([a, b[last]]),
+               np.concatenate([np.where(same, end - start, a + 1 - start), (end - b)[last]]))
+    whole = (np.tile(owner[~same], 2), np.concatenate([a[~same] + 1, b[~same]]), np.repeat([1.0, -1.0], (~same).sum()))
+    return partial, whole
+
+
+def needed(busy):
+    # instances needed per minute, the max over its seconds of the ceiled busy time
+    return np.ceil(busy - EPSILON).reshape(-1, SECONDS).max(axis=1)
+
+
+def minute_blocks(counts):
+    # consecutive minutes with at most ARRIVAL_BUDGET invocations together, or a single minute with more
+    total = np.cumsum(counts)
+    bounds = [0]
+    while bounds[-1] < len(counts):
+        drawn = total[bounds[-1] - 1] if bounds[-1] else 0
+        bounds.append(max(int(np.searchsorted(total, drawn + ARRIVAL_BUDGET, side='right')), bounds[-1] + 1))
+    return zip(bounds[:-1], bounds[1:])
+
+
+def reconstruct_heavy(counts, curve, rng):
+    # one function with too many invocations to draw at once, on per-second arrays over the whole trace
+    minutes = len(counts)
+    horizon = minutes * SECONDS
+    busy, steps = np.zeros(horizon + SECONDS), np.zeros(horizon + SECONDS)
+    for first, last in minute_blocks(counts):
+        start, end = arrivals(rng, counts[first:last], curve, first)
+        (_, points, fractions), (_, seconds, signs) = busy_events(start, end, np.zeros(len(start), dtype=np.int64),
+                                                                   horizon)
+        busy += np.bincount(points, weights=fractions, minlength=len(busy))
+        steps += np.bincount(seconds, weights=signs, minlength=len(steps))
+    return needed(busy + np.cumsum(steps))[:minutes]
+
+
+def reconstruct_group(counts, curves, rngs):
+    # a group of functions drawn at once, only the minutes some interval of a function touches get per-second cells
+    rows, minutes = counts.shape
+    horizon = minutes * SECONDS
+    drawn = [arrivals(rng, row, curve, 0) for row, curve, rng in zip(counts, curves, rngs)]
+    owner = np.repeat(np.arange(rows), [len(start) for start, _ in drawn])
+    start = np.concatenate([start for start, _ in drawn])
+    end = np.concatenate([end for _, end in drawn])
+
+    # minutes 0..minutes of every function, the last one holds the second past the end of the trace; every interval
+    # lies inside a run of covered minutes, so the difference array sums to zero over the minutes left out
+    width = minutes + 2
+    first = owner * width + (start // SECONDS).astype(np.int64)
+    after = owner * width + np.minimum(end // SECONDS, minutes).astype(np.int64) + 1
+    covered = np.bincount(first, minlength=rows * width) - np.bincount(after, minlength=rows * width)
+    covered = np.cumsum(covered.reshape(rows, width), axis=1)[:, :-1] > 0
+    position = np.cumsum(covered.ravel()) - 1
+    n_cells = int(covered.sum()) * SECONDS
+
+    def cells(owners, seconds):
+        return position[owners * (minutes + 1) + seconds // SECONDS] * SECONDS + seconds % SECONDS
+
+    partial, whole = busy_events(start, end, owner, horizon)
+    busy = np.bincount(cells(*partial[:2]), weights=partial[2], minlength=n_cells)
+    busy += np.cumsum(np.bincount(cells(*whole[:2]), weights=whole[2], minlength=n_cells))
+    result = np.zeros((rows, minutes + 1))
+    result[covered] = needed(busy)
+    return result[:, :minutes]
+
+
+def reconstruct_rows(invocations, curves, row_ids, seed=SEED):
+    # per-minute concurrency of a shard of functions, each drawing from a generator seeded by its row in the whole
+    # trace so that the result does not depend on the shards
+    counts = np.asarray(invocations, dtype=np.int64)
+    result = np.zeros(counts.shape, dtype=np.uint32)
+    group_rows = max(CELL_BUDGET // ((counts.shape[1] + 1) * SECONDS), 1)
+    group, drawn = [], 0
+
+    def flush():
+        rows = [i for i, _ in group]
+        result[rows] = reconstruct_group(counts[rows], curves[rows], [rng for _, rng in group])
+
+    for i, total in enumerate(counts.sum(axis=1)):
+        rng = np.random.default_rng([seed, int(row_ids[i])])
+        if total > ARRIVAL_BUDGET:
+            result[i] = reconstruct_heavy(counts[i], curves[i], rng)
+            continue
+        if group and (len(group) == group_rows or drawn + total > ARRIVAL_BUDGET):
+            flush()
+            group, drawn = [], 0
+        group.append((i, rng))
+        drawn += total
+    if group:
+        flush()
+    return result
+
+
+def reconstruct(source='merged_data.csv', out_dir='reconstructed', seed=SEED, jobs=1):
+    # writes out_dir in the layout of `merge.py stream` with the reconstructed concurrency as its cached containers,
+    # so cache.load(out_dir) gives it to every analysis
+    meta, invocations, containers = cache.load(source)
+    curves = duration_curves(meta)
+    result = np.concatenate(parallel.map_shards(reconstruct_rows, [invocations, curves, np.arange(len(meta))],
+                                                seed=seed, jobs=jobs))
+    result = result.astype(cache.small_dtype(result.max(initial=0)), copy=False)
+
+    os.makedirs(out_dir, exist_ok=True)
+    meta.to_parquet(os.path.join(out_dir, 'meta.parquet'), index=False)
+    cache.save_matrix(out_dir, 'invocations', invocations)
+    cache.save_matrix(out_dir, 'containers', result)
+    cache.write_manifest(out_dir, cache.source_state(os.path.join(out_dir, 'invocations.npy')))
+    with open(os.path.join(out_dir, 'reconstruct.json'), 'w') as f:
+        json.dump({'source': os.path.abspath(source), 'seed': seed, 'percentiles': PERCENTILES}, f, indent=2)
+    return containers, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", nargs="?", default="merged_data.csv",
+                        help="merged_data.csv or the output directory of merge.py stream")
+    parser.add_argument("--out", default="reconstructed", help="output directory")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+
+    average, result = reconstruct(args.source, args.out, args.seed, args.jobs)
+    print("container-minutes: {} from the average duration, {} reconstructed".format(average.sum(dtype=np.int64),
+                                                                                   result.sum(dtype=np.int64)))
+    print("peak containers in a minute: {} from the average duration, {} reconstructed".format(
+        average.sum(axis=0, dtype=np.int64).max(), result.sum(axis=0, dtype=np.int64).max()))
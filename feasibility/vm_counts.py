@@ -1,56 +1,112 @@
+import argparse
 import os
 
 import numpy as np
 import pandas as pd
 import csv
 
-CDF_x = '2'
-
-
-def process_data_dynamic(df):
-    # Identify the columns to process (all columns excluding the specified metadata columns)
-    cols_to_process = df.columns.difference(
-        ['HashOwner', 'HashApp', 'HashFunction', 'AverageAllocatedMb', 'AverageDurations'])
-
-    df['invocations'] = df[CDF_x].astype(int)
-
-    # Step 1 and 2: Multiply these columns with AverageDurations, divide by 1000, divide by 60, and round up
-    for col in cols_to_process:
-        df[col] = np.ceil(df[col] * df['AverageDurations'] / 1000 / 60).astype(int)
-
-    # Step 3: Sum each column and output
-    sums = df[cols_to_process].sum().tolist()
-
-    # Step 4: Count values greater than 0 in each column and output
-    counts = (df[cols_to_process] > 0).sum().tolist()
-
-    # Step 5: Set values greater than 16 to 16, sum each column and output
-    capped_sums_ = df[cols_to_process].map(lambda x: min(x, 8)).sum().tolist()
-
-    # Step 5: Set values greater than 16 to 16, sum each column and output
-    capped_sums = df[cols_to_process].map(lambda x: min(x, 16)).sum().tolist()
-
-    grouped_df = df.groupby(CDF_x)['invocations'].sum().reset_index()
-    grouped_df['CDF'] = grouped_df['invocations'].cumsum() / grouped_df['invocations'].sum()
-
-    df[CDF_x + "_16"] = np.ceil(df[CDF_x] / 16).astype(int)
-    df[CDF_x + "_8"] = np.ceil(df[CDF_x] / 8).astype(int)
+import cache
+import parallel
 
-    grouped_df_8 = df.groupby(CDF_x + "_8")['invocations'].sum().reset_index()
-    grouped_df_8['CDF'] = grouped_df_8['invocations'].cumsum() / grouped_df_8['invocations'].sum()
-
-    grouped_df_16 = df.groupby(CDF_x + "_16")['invocations'].sum().reset_index()
-    grouped_df_16['CDF'] = grouped_df_16['invocations'].cumsum() / grouped_df_16['invocations'].sum()
-
-    return [sums, counts, capped_sums_, capped_sums], grouped_df, grouped_df_8, grouped_df_16
-
-
-if __name__ == '__main__':
-    # 读取本地CSV文件
-    df = pd.read_csv('merged_data.csv')
-    result, grouped_df, grouped_df_8, grouped_df_16 = process_data_dynamic(df)
-
-    result_dir = "statistics/vm-counts"
+CDF_x = '2'
+# caps of the CDF tables, containers per VM
+CDF_CAPS = [1, 8, 16]
+# the capacity curve covers every cap from 1 to MAX_CAP
+MAX_CAP = 64
+CHUNK_ROWS = 4096
+
+
+def minute_histogram(containers, jobs=1):
+    # (values, hist): the distinct container counts and, per minute, how many functions need each of them, built in
+    # one pass over row chunks of the matrix
+    if jobs > 1:
+        return merge_histograms(parallel.map_shards(minute_histogram, [containers], jobs=jobs))
+    present = np.zeros(int(containers.max(initial=0)) + 1, dtype=bool)
+    for start in range(0, len(containers), CHUNK_ROWS):
+        present[np.unique(containers[start:start + CHUNK_ROWS])] = True
+    values = np.nonzero(present)[0]
+    lookup = np.zeros(len(present), dtype=np.int64)
+    lookup[values] = np.arange(len(values))
+
+    minutes = containers.shape[1]
+    offsets = np.arange(minutes, dtype=np.int64) * len(values)
+    hist = np.zeros(minutes * len(values), dtype=np.int64)
+    for start in range(0, len(containers), CHUNK_ROWS):
+        cells = lookup[containers[start:start + CHUNK_ROWS]] + offsets
+        hist += np.bincount(cells.ravel(), minlength=len(hist))
+    return values, hist.reshape(minutes, len(values))
+
+
+def merge_histograms(parts):
+    values = np.unique(np.concatenate([part_values for part_values, _ in parts]))
+    hist = np.zeros((parts[0][1].shape[0], len(values)), dtype=np.int64)
+    for part_values, part_hist in parts:
+        hist[:, np.searchsorted(values, part_values)] += part_hist
+    return values, hist
+
+
+def vms_needed(values, hist, caps):
+    # VMs needed per minute (minutes x caps) when a VM holds up to `cap` containers: sum of ceil(x / cap)
+    caps = np.asarray(caps, dtype=np.int64)
+    return hist @ -(-values[:, None] // caps[None, :])
+
+
+def capacity_curve(values, hist, max_cap=MAX_CAP):
+    return capacity_frames(vms_needed(values, hist, np.arange(1, max_cap + 1)))
+
+
+def capacity_frames(vms):
+    # the capacity curve and the per-minute VMs of the caps 1..vms.shape[1]
+    caps = np.arange(1, vms.shape[1] + 1)
+    curve = pd.DataFrame({'cap': caps, 'peak_vms': vms.max(axis=0), 'mean_vms': vms.mean(axis=0),
+                          'peak_minute': vms.argmax(axis=0) + 1})
+    per_minute = pd.DataFrame(vms.T, columns=[str(m) for m in range(1, vms.shape[0] + 1)])
+    per_minute.insert(0, 'cap', caps)
+    return curve, per_minute
+
+
+def cdf_tables(invocations, containers, caps=CDF_CAPS):
+    # invocations at minute CDF_x by the number of VMs of `cap` containers their function needs, one table per cap
+    minute = int(CDF_x) - 1
+    needed = containers[:, minute].astype(np.int64)
+    df = pd.DataFrame({'invocations': invocations[:, minute].astype(np.int64)})
+    tables = {}
+    for cap in caps:
+        column = CDF_x if cap == 1 else "{}_{}".format(CDF_x, cap)
+        df[column] = -(-needed // cap)
+        grouped = df.groupby(column)['invocations'].sum().reset_index()
+        grouped['CDF'] = grouped['invocations'].cumsum() / grouped['invocations'].sum()
+        tables[cap] = grouped
+    return tables
+
+
+def minute_statistics(values, hist):
+    # Step 3: Sum each column
+    sums = hist @ values
+
+    # Step 4: Count values greater than 0 in each column
+    counts = hist[:, values > 0].sum(axis=1)
+
+    # Step 5: Cap every function at 8 and 16 containers, sum each column
+    capped_sums_ = hist @ np.minimum(values, 8)
+    capped_sums = hist @ np.minimum(values, 16)
+    return np.stack([sums, counts, capped_sums_, capped_sums])
+
+
+def statistics_rows(statistics):
+    # the statistics rows follow the column order of the original script, minute names sorted as text
+    order = sorted(range(statistics.shape[1]), key=lambda j: str(j + 1))
+    return statistics[:, order].tolist()
+
+
+def process_data_dynamic(meta, invocations, containers, caps=CDF_CAPS, max_cap=MAX_CAP, jobs=1):
+    values, hist = minute_histogram(containers, jobs)
+    curve, per_minute = capacity_curve(values, hist, max_cap)
+    return (statistics_rows(minute_statistics(values, hist)), cdf_tables(invocations, containers, caps), curve,
+            per_minute)
+
+
+def save(result_dir, result, tables, curve, per_minute):
     if not os.path.exists(result_dir):
         os.makedirs(result_dir)
 
@@ -61,6 +117,22 @@ if __name__ == '__main__':
             writer.writerow(row)
 
     # 计算累计频率
-    grouped_df.to_csv(os.path.join(result_dir, "CDF-1.csv"), index=False)
-    grouped_df_8.to_csv(os.path.join(result_dir, "CDF-8.csv"), index=False)
-    grouped_df_16.to_csv(os.path.join(result_dir, "CDF-16.csv"), index=False)
+    for cap, table in tables.items():
+        table.to_csv(os.path.join(result_dir, "CDF-{}.csv".format(cap)), index=False)
+
+    curve.to_csv(os.path.join(result_dir, "capacity-curve.csv"), index=False)
+    per_minute.to_csv(os.path.join(result_dir, "capacity-per-minute.csv"), index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("caps", nargs="*", type=int, default=CDF_CAPS, help="caps of the CDF tables")
+    parser.add_argument("--source", default="merged_data.csv",
+                        help="merged_data.csv, or the output directory of merge.py stream or reconstruct.py")
+    parser.add_argument("--jobs", type=int, default=parallel.JOBS, help="worker processes")
+    args = parser.parse_args()
+    # the trace through its cache
+    result, tables, curve, per_minute = process_data_dynamic(*cache.load(args.source), caps=args.caps,
+                                                             jobs=args.jobs)
+    save("statistics/vm-counts", result, tables, curve, per_minute)
+    print(curve.to_string(index=False))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import numpy as np
+
+sys.path.extend([os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scale"),
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "feasibility")])
+import cache
+from results import percentile, summarize, write_csv
+# the platform harness next to this file, found before the standard library's test package as the script directory
+# comes first on sys.path
+from test import (RESULT_DIR, WAIT_TIMEOUT, POLL_INTERVAL, clients, clean_up, create_function, daemon, load_params,
+                  prepare_snap, setup, start_vertical_vm, vm_running, wait_vm_ready)
+
+# seconds between building the schedule and its first arrival
+LEAD = 0.5
+SECONDS = 60
+
+
+def poisson_schedule(rng, funcs, rate, duration):
+    # open-loop arrivals at `rate` per second with exponential gaps, each for a uniformly drawn function
+    gaps = rng.exponential(1 / rate, int(rate * duration * 1.5) + 16)
+    while gaps.sum() < duration:
+        gaps = np.concatenate([gaps, rng.exponential(1 / rate, len(gaps))])
+    offsets = np.cumsum(gaps)
+    offsets = offsets[offsets < duration]
+    return [(float(t), funcs[i]) for t, i in zip(offsets, rng.integers(len(funcs), size=len(offsets)))]
+
+
+def constant_schedule(funcs, rate, duration):
+    # arrivals every 1/rate seconds, round robin over the functions
+    return [(i / rate, funcs[i % len(funcs)]) for i in range(int(rate * duration))]
+
+
+def trace_schedule(rng, funcs, trace):
+    # the per-minute counts of `trace.functions` trace functions drawn among the ones invoked in the window, each
+    # mapped onto the test function nearest its allocated memory; every invocation lands on a uniformly drawn instant
+    # of its minute, a trace minute lasts 60/speedup seconds and `scale` multiplies the counts (stochastic rounding)
+    meta, invocations, _ = cache.load(trace.source)
+    window = slice(trace.start_minute, trace.start_minute + trace.minutes)
+    invoked = np.flatnonzero(np.asarray(invocations[:, window], dtype=np.int64).sum(axis=1) > 0)
+    rows = np.sort(rng.choice(invoked, min(trace.functions, len(invoked)), replace=False))
+    counts = np.asarray(invocations[rows, window], dtype=np.float64) * trace.scale
+    counts = (np.floor(counts) + (rng.random(counts.shape) < counts % 1)).astype(np.int64)
+
+    memory = meta['AverageAllocatedMb'].to_numpy(dtype=np.float64)[rows]
+    nearest = np.abs(np.nan_to_num(memory)[:, None] - np.array([f.mem for f in funcs])[None, :]).argmin(axis=1)
+    schedule = []
+    for row, func in zip(counts, nearest):
+        minutes = np.repeat(np.arange(len(row)), row)
+        offsets = (minutes + rng.random(len(minutes))) * SECONDS / trace.speedup
+        schedule += [(float(t), funcs[func]) for t in offsets]
+    return sorted(schedule, key=lambda arrival: arrival[0])
+
+
+class Boot:
+    # every invocation starts a VM, cold or from a snapshot, on a free network namespace and the VM is deleted once it
+    # answered; a request waits for a namespace while all are taken
+
+    def __init__(self, params, bodies, namespaces):
+        self.params = params
+        self.bodies = bodies
+        self.namespaces = namespaces
+
+    def start(self):
+        self.free = asyncio.Queue()
+        for idx in range(1, 1 + self.namespaces):
+            self.free.put_nowait(idx)
+
+    async def acquire(self, func):
+        idx = await self.free.get()
+        return dict(self.bodies[func.id], namespace='fc%d' % idx), idx
+
+    async def release(self, http, idx, ret):
+        if ret is not None:
+            await http.delete("/vms/%s" % ret["vmId"])
+            await wait_vm_gone(self.params, ret["vmId"])
+        self.free.put_nowait(idx)
+
+
+class Resident:
+    # the invocations of a function go to its running VMs, one at a time per entry of vms[func.id]: a warm VM per
+    # entry, or one balloon or faascale VM listed once per concurrent invocation it takes
+
+    def __init__(self, bodies, vms):
+        self.bodies = bodies
+        self.vms = vms
+
+    def start(self):
+        self.free = {}
+        for func_id, vm_ids in self.vms.items():
+            self.free[func_id] = asyncio.Queue()
+            for vm_id in vm_ids:
+                self.free[func_id].put_nowait(vm_id)
+
+    async def acquire(self, func):
+        vm_id = await self.free[func.id].get()
+        return dict(self.bodies[func.id], vmId=vm_id), (func.id, vm_id)
+
+    async def release(self, http, slot, ret):
+        self.free[slot[0]].put_nowait(slot[1])
+
+
+async def wait_vm_gone(params, vm_id):
+    # until the firecracker process of the VM exited, the daemon has no API listing the running VMs
+    loop = asyncio.get_running_loop()
+    timeout = getattr(params, "wait_timeout", WAIT_TIMEOUT)
+    start = loop.time()
+    while await asyncio.to_thread(vm_running, params, vm_id):
+        if loop.time() - start > timeout:
+            raise TimeoutError("exit of VM %s not ready after %ds" % (vm_id, timeout))
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def request(http, target, setting, func, intended, start):
+    # the latency counts from the intended send time, so the time a request waited for a VM, a connection or the
+    # event loop is not omitted when the platform falls behind
+    loop = asyncio.get_running_loop()
+    body, slot = await target.acquire(func)
+    sent = loop.time()
+    ret, error = None, ""
+    try:
+        resp = await http.post("/invocations", json=body)
+        resp.raise_for_status()
+        ret = resp.json()
+    except httpx.HTTPError as e:
+        error = repr(e)
+    done = loop.time()
+    try:
+        await target.release(http, slot, ret)
+    except (httpx.HTTPError, TimeoutError) as e:
+        error = error or "release: %r" % e
+    return dict(setting=setting.name, func=func.id, intended=intended - start, lag_ms=(sent - intended) * 1000,
+                latency_ms=(done - intended) * 1000, service_ms=(done - sent) * 1000, ok=ret is not None,
+                error=error, vm_id=(ret or {}).get("vmId", ""))
+
+
+async def generate(host, target, setting, schedule, connections):
+    # open loop: every arrival is sent at its time whether or not the earlier ones answered, over at most
+    # `connections` keep-alive connections
+    target.start()
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=host, limits=limits, timeout=None) as http:
+        loop = asyncio.get_running_loop()
+        start = loop.time() + LEAD
+        tasks = []
+        for offset, func in schedule:
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(request(http, target, setting, func, start + offset, start)))
+        return await asyncio.gather(*tasks)
+
+
+def prepare(params, setting, funcs, slots):
+    # starts the daemon and what the setting's invocations run on: `slots` namespaces shared by the cold or snapshot
+    # starts, `slots` warm VMs per function, or one balloon or faascale VM per function sized for `slots` invocations
+    vertical = setting.name in ("balloon", "faascale")
+    namespaces = slots * len(funcs) if setting.name == 'warm' else len(funcs) if vertical else slots
+    daemon_pipe = setup(params, setting, namespaces, funcs[0])
+    for func in funcs[1:]:
+        create_function(clients[1], params, setting, func)
+
+    bodies = {f.id: {"func_name": f.name, "params": f.params} for f in funcs}
+    if setting.name == 'cold':
+        return daemon_pipe, Boot(params, bodies, namespaces)
+    if setting.name == 'warm':
+        vms = {}
+        for i, func in enumerate(funcs):
+            vms[func.id] = [clients[idx].vms_post(body={'func_name': func.name, 'namespace': 'fc%d' % idx}).vm_id
+                            for idx in range(1 + i * slots, 1 + (i + 1) * slots)]
+        for idx in range(1, 1 + namespaces):
+            wait_vm_ready(idx, 5 if idx == 1 else 0)
+        for func in funcs:
+            for vm_id in vms[func.id]:
+                invocation = daemon.Invocation(func_name=func.name, vm_id=vm_id, params=func.params)
+                print('1st invocation ret:', clients[1].invocations_post(body=invocation))
+        return daemon_pipe, Resident(bodies, vms)
+    if vertical:
+        vms = {}
+        for idx, func in enumerate(funcs, 1):
+            vm = start_vertical_vm(params, func.name, setting.name, func.mem * slots + params.mem,
+                                   min(os.cpu_count(), params.vcpu + slots), idx)
+            vms[func.id] = [vm.vm_id] * slots
+        return daemon_pipe, Resident(bodies, vms)
+    for func in funcs:
+        ss_id = prepare_snap(params, setting, func, func.params)
+        bodies[func.id].update(ssId=ss_id, mincore=-1, **vars(setting.invocation))
+    return daemon_pipe, Boot(params, bodies, namespaces)
+
+
+def summary_row(setting, func, samples):
+    ok = [s for s in samples if s["ok"]]
+    span = max(s["intended"] for s in samples) if len(samples) > 1 else 0
+    row = dict(setting=setting, func=func, requests=len(samples), errors=len(samples) - len(ok),
+               offered_rps=len(samples) / span if span else 0.0)
+    if ok:
+        latency = sorted(s["latency_ms"] for s in ok)
+        row.update(summarize(latency), p999=percentile(latency, 99.9))
+        row["service_p50"] = percentile(sorted(s["service_ms"] for s in ok), 50)
+        row["max_lag_ms"] = max(s["lag_ms"] for s in ok)
+    return row
+
+
+def summarize_load(samples):
+    groups = {}
+    for s in samples:
+        groups.setdefault((s["setting"], s["func"]), []).append(s)
+        groups.setdefault((s["setting"], "all"), []).append(s)
+    return [summary_row(setting, func, group) for (setting, func), group in groups.items()]
+
+
+def schedule_for(params, funcs):
+    load = params.loadgen
+    rng = np.random.default_rng(getattr(load, "seed", 0))
+    if load.arrival == "poisson":
+        return poisson_schedule(rng, funcs, load.rate, load.duration)
+    if load.arrival == "constant":
+        return constant_schedule(funcs, load.rate, load.duration)
+    if load.arrival == "trace":
+        return trace_schedule(rng, funcs, load.trace)
+    raise ValueError("unknown arrival %s" % load.arrival)
+
+
+def main(config_file):
+    os.makedirs(RESULT_DIR, mode=0o777, exist_ok=True)
+    params = load_params(config_file)
+    load = params.loadgen
+    funcs = [vars(params.functions)[f] for f in load.functions]
+    # every setting gets the same arrivals
+    schedule = schedule_for(params, funcs)
+    print("%d arrivals over %.1fs" % (len(schedule), schedule[-1][0] if schedule else 0))
+
+    samples = []
+    for name in load.settings:
+        setting = vars(params.settings)[name]
+        print("\n=========loadgen %s=========\n" % name)
+        daemon_pipe, target = prepare(params, setting, funcs, load.slots)
+        try:
+            samples += asyncio.run(generate(params.host, target, setting, schedule, load.connections))
+        finally:
+            clean_up(daemon_pipe)
+
+    result_dir = os.path.join(RESULT_DIR, "loadgen")
+    os.makedirs(result_dir, exist_ok=True)
+    summary = summarize_load(samples)
+    write_csv(samples, os.path.join(result_dir, "samples.csv"))
+    write_csv(summary, os.path.join(result_dir, "summary.csv"))
+    with open(os.path.join(result_dir, "results.json"), 'w') as f:
+        json.dump({"samples": samples, "summary": summary}, f, indent=2)
+    for row in summary:
+        if "p50" in row:
+            print("{setting:>14} {func:>12}: {requests} requests, {errors} errors, latency p50 {p50:.1f}ms "
+                  "p99 {p99:.1f}ms p99.9 {p999:.1f}ms".format(**row))
+        else:
+            print("{setting:>14} {func:>12}: {requests} requests, all failed".format(**row))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: %s <test.json>" % sys.argv[0])
+        exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print("File not found:", sys.argv[1])
+        exit(1)
+    main(sys.argv[1])
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 import json
+import multiprocessing
 import os
 import subprocess
 import sys
+import threading
 import time
 from multiprocessing.pool import Pool
 
 import requests
 
-sys.path.extend(["./platform/python-client"])
+sys.path.extend(["./platform/python-client",
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scale")])
+from firecracker_api import FirecrackerAPI
+from host_monitor import find_pid, read_smaps_rollup
+from results import write_csv
 from swagger_client.api.default_api import DefaultApi
 import swagger_client as daemon
 from swagger_client.configuration import Configuration
@@ -35,30 +41,96 @@ RESULT_DIR = "/tmp/faascale-evalution-results"
 PAUSE = None
 BPF = None
 
+# how long a readiness wait may take at most and how often it polls, in seconds
+WAIT_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+# wall time the readiness waits saved against the fixed sleeps they replace, measured by each wait and shared with
+# the Pool workers
+saved = multiprocessing.Value('d', 0.0)
+
+
+def wait_until(ready, what, replaces):
+    # poll `ready` instead of sleeping `replaces` seconds
+    start = time.time()
+    while not ready():
+        if time.time() - start > WAIT_TIMEOUT:
+            raise TimeoutError("%s not ready after %ds" % (what, WAIT_TIMEOUT))
+        time.sleep(POLL_INTERVAL)
+    with saved.get_lock():
+        saved.value += replaces - (time.time() - start)
+
+
+def unique_addr(idx):
+    return '192.168.0.%d' % (idx + 2)
+
+
+def running(name):
+    # pgrep matches the first 15 characters of the process name only
+    return subprocess.run(["pgrep", "-x", name[:15]], stdout=subprocess.DEVNULL).returncode == 0
+
+
+def answers(url, body=None):
+    try:
+        resp = requests.get(url, timeout=1)
+    except requests.RequestException:
+        return False
+    return resp.ok and (body is None or resp.text == body)
+
+
+def vm_path(params, vm_id):
+    # the directory the daemon keeps a VM's config, socket and logs in
+    return os.path.join(params.daemon.base_path, vm_id)
+
+
+def vm_running(params, vm_id):
+    # the firecracker process of a VM carries its directory in the API socket and config file arguments
+    return subprocess.run(["pgrep", "-f", vm_path(params, vm_id) + "/"], stdout=subprocess.DEVNULL).returncode == 0
+
+
+def daemon_ready(params, daemon_pipe):
+    # any answer from the daemon's port, the API has no health endpoint
+    if daemon_pipe.poll() is not None:
+        raise RuntimeError("daemon exited with %d" % daemon_pipe.returncode)
+    try:
+        requests.get(params.host, timeout=1)
+    except requests.RequestException:
+        return False
+    return True
+
+
+def wait_vm_ready(idx, replaces):
+    # the guest's / endpoint, what the daemon's WaitVMReady polls
+    wait_until(lambda: answers('http://%s:5000/' % unique_addr(idx), "Hello, World!"), "VM fc%d" % idx, replaces)
+
+
+def wait_vm_gone(params, vm_id, replaces):
+    wait_until(lambda: not vm_running(params, vm_id), "exit of VM %s" % vm_id, replaces)
+
+
+def killall(*names):
+    for name in names:
+        subprocess.Popen(["sudo", "killall", name], stdout=open('/tmp/out', 'a+'), stderr=open('/tmp/out', 'a+')).wait()
+
 
 def add_network(client: DefaultApi, idx: int):
     ns = 'fc%d' % idx
     guest_mac = 'AA:FC:00:00:00:01'  # fixed MAC
     guest_addr = '172.16.0.2'  # fixed guest IP
-    unique_addr = '192.168.0.%d' % (idx + 2)
     client.net_ifaces_namespace_put(namespace=ns, body={
         "host_dev_name": 'vmtap0',
         "iface_id": "eth0",
         "guest_mac": guest_mac,
         "guest_addr": guest_addr,
-        "unique_addr": unique_addr
+        "unique_addr": unique_addr(idx)
     })
 
 
 def setup(params, setting, par, func):
-    subprocess.Popen(["sudo", "killall", "main"], stdout=open('/tmp/out', 'a+'), stderr=open('/tmp/out', 'a+'))
-    subprocess.Popen(["sudo", "killall", "firecracker"], stdout=open('/tmp/out', 'a+'),
-                     stderr=open('/tmp/out', 'a+'))
-    subprocess.Popen(["sudo", "killall", "firecracker-uffd"], stdout=open('/tmp/out', 'a+'),
-                     stderr=open('/tmp/out', 'a+'))
+    names = ["main", "firecracker", "firecracker-uffd"]
+    killall(*names)
     if params.test_dir != "":
         os.system("sudo rm -rf %s/*" % params.test_dir)
-    time.sleep(1)
+    wait_until(lambda: not any(running(name) for name in names), "exit of %s" % ", ".join(names), 1)
 
     # start daemon
     daemon_pipe = None
@@ -66,11 +138,7 @@ def setup(params, setting, par, func):
                                     './main',
                                     '--port=8080', '--host=0.0.0.0'], cwd=params.home_dir,
                                    stdout=open('%s/stdout' % RESULT_DIR, 'a+'), stderr=subprocess.STDOUT)
-    time.sleep(5)
-
-    # only one client for balloon and faascale
-    if setting.name == "balloon" or setting.name == "faascale":
-        par = 1
+    wait_until(lambda: daemon_ready(params, daemon_pipe), "daemon", 5)
 
     # init clients, and add network
     for idx in range(1, 1 + par):
@@ -78,19 +146,22 @@ def setup(params, setting, par, func):
         add_network(clients[idx], idx)
 
     # Create a new function use only one client to create snapshot
-    client = clients[1]
-    client.functions_post(body=daemon.Function(func_name=func.name, image=func.image, kernel=setting.kernel,
-                                               vcpu=params.vcpu, mem_size=func.mem))
+    create_function(clients[1], params, setting, func)
 
     return daemon_pipe
 
 
+def create_function(client: DefaultApi, params, setting, func):
+    client.functions_post(body=daemon.Function(func_name=func.name, image=func.image, kernel=setting.kernel,
+                                               vcpu=params.vcpu, mem_size=func.mem))
+
+
 def clean_up(daemon_pipe):
     if daemon_pipe is not None:
-        subprocess.Popen(["sudo", "killall", "main"], stdout=open('/tmp/out', 'a+'), stderr=open('/tmp/out', 'a+'))
+        killall("main")
         daemon_pipe.terminate()
         daemon_pipe.wait()
-        time.sleep(1)
+        wait_until(lambda: not running("main"), "exit of the daemon", 1)
 
 
 def start_bpf(run_id):
@@ -98,9 +169,18 @@ def start_bpf(run_id):
         program = bpf_map[BPF]
         bpffile = open('%s/bpftrace' % (RESULT_DIR), 'a+')
         print('==== %s ====' % run_id, file=bpffile, flush=True)
+        offset = bpffile.tell()
         bpfpipe = subprocess.Popen(['sudo', 'bpftrace', '-e', program], cwd='/tmp/', stdout=bpffile,
                                    stderr=subprocess.STDOUT)
-        time.sleep(3)
+
+        def attached():
+            if bpfpipe.poll() is not None:
+                raise RuntimeError("bpftrace exited with %d" % bpfpipe.returncode)
+            with open(bpffile.name) as f:
+                f.seek(offset)
+                return "Attaching" in f.read()
+
+        wait_until(attached, "bpftrace", 3)
         return bpfpipe
     return None
 
@@ -120,7 +200,7 @@ def prepare_snap(params, setting, func, func_param):
     # create VM, the func_name use to define the image, kernel, and vcpu, these are submitted to the daemon when
     # creating the function. namespace is used to define the network.
     vm = client.vms_post(body={'func_name': func.name, 'namespace': 'fc%d' % 1})
-    time.sleep(5)
+    wait_vm_ready(1, 5)
 
     # define a invocation, specify the function name, vm_id, and the parameters
     invocation = daemon.Invocation(func_name=func.name, vm_id=vm.vm_id, params=func_param)
@@ -130,19 +210,19 @@ def prepare_snap(params, setting, func, func_param):
     print('prepare invocation ret:', ret)
 
     # make the snapshot request
-    body = daemon.Snapshot(vm_id=vm.vm_id, snapshot_type='Full', snapshot_path=params.test_dir + '/Full.snapshot',
-                           mem_file_path=params.test_dir + '/Full.memfile', version='0.23.0')
+    body = daemon.Snapshot(vm_id=vm.vm_id, snapshot_type='Full',
+                           snapshot_path='%s/%s.Full.snapshot' % (params.test_dir, func.id),
+                           mem_file_path='%s/%s.Full.memfile' % (params.test_dir, func.id), version='0.23.0')
 
     # create the snapshot
     snap = client.snapshots_post(body=body)
 
     # delete the VM
     client.vms_vm_id_delete(vm_id=vm.vm_id)
-    time.sleep(2)
+    wait_vm_gone(params, vm.vm_id, 2)
 
-    # Important!!! for snapshot-cache, we need to load the snapshot to the page cache
+    # Important!!! for snapshot-cache, we need to load the snapshot to the page cache, the daemon answers once it is
     client.snapshots_ss_id_patch(ss_id=snap.ss_id, body=vars(setting.patch_state))
-    time.sleep(1)
     return snap.ss_id
 
 
@@ -162,14 +242,14 @@ def invoke_snap(args):
     # delete the VM
     clients[idx].vms_vm_id_delete(vm_id=ret.vm_id)
     print('invoke', run_id, 'ret:', ret)
-    time.sleep(2)
+    wait_vm_gone(params, ret.vm_id, 2)
 
 
 def run_snap(params, setting, par, func):
     # invoke the function, and create snapshot
     func_param = func.params
+    # prepare_snap returns once the VM is gone and the snapshot patched
     snap_id = prepare_snap(params, setting, func, func_param)
-    time.sleep(1)
 
     # re-invoke the function with snapshot
     if PAUSE:
@@ -184,7 +264,7 @@ def invoke_warm(args):
     params, setting, func, func_param, idx, vm_id = args
     client = clients[idx]
     run_id = '%s_%s' % (setting.name, func.id)
-    time.sleep(1)
+    wait_vm_ready(idx, 1)
     invocation = daemon.Invocation(func_name=func.name, vm_id=vm_id, params=func_param)
 
     bpf_pipe = start_bpf(run_id)
@@ -193,7 +273,7 @@ def invoke_warm(args):
 
     print('2nd invocation ret:', ret)
     client.vms_vm_id_delete(vm_id=vm_id)
-    time.sleep(2)
+    wait_vm_gone(params, vm_id, 2)
 
 
 def run_warm(params, setting, par, func):
@@ -202,13 +282,14 @@ def run_warm(params, setting, par, func):
     vms = {}
     for idx in range(1, 1 + par):
         vms[idx] = clients[idx].vms_post(body={'func_name': func.name, 'namespace': 'fc%d' % idx})
-    time.sleep(5)
+    for idx in range(1, 1 + par):
+        wait_vm_ready(idx, 5 if idx == 1 else 0)
 
     for idx in range(1, 1 + par):
         invocation = daemon.Invocation(func_name=func.name, vm_id=vms[idx].vm_id, params=func_params)
         ret = clients[idx].invocations_post(body=invocation)
         print('1st invocation ret:', ret)
-    time.sleep(1)
+    # invoke_warm waits for each VM to serve again
 
     if PAUSE:
         input("Press Enter to start...")
@@ -248,7 +329,7 @@ def invoke_vertical(args):
     client = clients[1]
     params, setting, func, func_param, vm_id, method = args
     run_id = '%s_%s' % (setting.name, func.id)
-    time.sleep(1)
+    wait_vm_ready(1, 1)
 
     invocation = daemon.Invocation(func_name=func.name, params=func_param, vm_id=vm_id)
 
@@ -261,39 +342,213 @@ def invoke_vertical(args):
     print('1st invocation ret:', ret)
 
 
-def run_vertical(params, setting, par, func, method):
-    client: DefaultApi
-    client = clients[1]
-    func_params = func.params
+def measure_balloon(params, vm, size):
+    # deflate the balloon of the VM by `size` and inflate it back, as the daemon does around an invocation, with the
+    # same client as the scale benchmarks, so the numbers are comparable with the faascale ones. The VM boots with
+    # the balloon holding all but the function's memory, so it cannot grow further. The balloon is restored, so the
+    # daemon's view of it stays valid.
+    with FirecrackerAPI(os.path.join(vm_path(params, vm.vm_id), "firecracker.sock")) as api:
+        origin = api.balloon()["amount_mib"]
+        size = min(size, origin)
+        for source, target in [(origin, origin - size), (origin - size, origin)]:
+            print('balloon {}MB -> {}MB use {:.1f}ms'.format(source, target, api.scale_balloon(target)))
+
 
+def start_vertical_vm(params, func_name, method, memory, cpu, idx=1, replaces=5):
+    # a VM of the balloon or faascale kernel with `memory` MB and `cpu` vcpus, on namespace fc<idx>, `replaces` is the
+    # fixed sleep its readiness wait stands in for
     if method == "balloon":
         kernel = params.daemon.kernels.balloon
     else:
         kernel = params.daemon.kernels.faascale
 
-    memory = func.mem * par + params.mem
-    cpu = min(os.cpu_count(), params.vcpu + par)
-
-    vm = client.vms_post(
-        body={'func_name': func.name, 'namespace': 'fc%d' % 1,
+    vm = clients[idx].vms_post(
+        body={'func_name': func_name, 'namespace': 'fc%d' % idx,
               "kernel": kernel,
               "vcpu": cpu, "mem": memory,
               "enable_balloon": method == "balloon",
               "enable_faascale": method == "faascale"})
-    time.sleep(5)
+    wait_vm_ready(idx, replaces)
+    return vm
+
+
+def run_vertical(params, setting, par, func, method):
+    client: DefaultApi
+    client = clients[1]
+    func_params = func.params
+
+    memory = func.mem * par + params.mem
+    cpu = min(os.cpu_count(), params.vcpu + par)
+    vm = start_vertical_vm(params, func.name, method, memory, cpu)
+
+    if method == "balloon" and getattr(params, "measure_balloon", False):
+        measure_balloon(params, vm, func.mem * par)
 
     with Pool(par) as p:
-        vector = [(params, setting, func, func_params, vm.vm_id, method)]
+        vector = [(params, setting, func, func_params, vm.vm_id, method)] * par
         p.map(invoke_vertical, vector)
 
     client.vms_vm_id_delete(vm.vm_id)
 
 
+class VMMemory(threading.Thread):
+    # samples the host memory (Rss) of a VM's firecracker process every interval_ms until stopped, and the scale
+    # operations seen since the previous sample: the changes of the balloon's target for a balloon VM, the
+    # per-invocation cgroups the guest created or removed for a faascale VM. Operations closer together than
+    # interval_ms on the same balloon count once.
+
+    def __init__(self, params, vm, idx, label, start, method, interval_ms=50):
+        super().__init__(daemon=True)
+        # POST /vms answers with the VM id only, its directory comes from the daemon's base_path
+        path = vm_path(params, vm.vm_id)
+        name = os.path.basename(params.daemon.executables.faascale)
+        wait_until(lambda: find_pid(name, path) is not None, "%s process of VM %s" % (name, vm.vm_id), 0)
+        self.pid = find_pid(name, path)
+        self.api = FirecrackerAPI(os.path.join(path, "firecracker.sock")) if method == "balloon" else None
+        self.cgroups_url = 'http://%s:5000/faascale' % unique_addr(idx) if method == "faascale" else None
+        self.state = None
+        self.label = label
+        self.start_time = start
+        self.interval = interval_ms / 1000
+        self.samples = []
+        self.stopped = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                sample = dict(vm=self.label, time=(time.time() - self.start_time) * 1000,
+                              rss_mb=read_smaps_rollup(self.pid).get("Rss", 0) / 1024)
+                if self.api is not None:
+                    stats = self.api.balloon_statistics()
+                    sample["balloon_mb"] = stats["actual_mib"]
+                    state = stats["target_mib"]
+                    sample["scale_ops"] = int(self.state is not None and state != self.state)
+                else:
+                    resp = requests.get(self.cgroups_url, timeout=1)
+                    resp.raise_for_status()
+                    state = set(resp.json())
+                    sample["scale_ops"] = len(state ^ self.state) if self.state is not None else len(state)
+                self.state = state
+                self.samples.append(sample)
+                if self.stopped.wait(self.interval):
+                    return
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        # raises what ended the sampling early, rather than reporting the samples taken until then
+        self.stopped.set()
+        self.join()
+        if self.api is not None:
+            self.api.close()
+        if self.error is not None:
+            raise RuntimeError("sampling the memory of %s failed" % self.label) from self.error
+        return self.samples
+
+
+def invoke_tenant(args):
+    # one tenant of a density run, invoked `delay` seconds after `start`
+    func, vm_id, delay, start = args
+    time.sleep(max(0.0, start + delay - time.time()))
+    begin = time.time()
+    clients[1].invocations_post(body=daemon.Invocation(func_name=func.name, params=func.params, vm_id=vm_id))
+    print('{} tenant invoke time: {}ms'.format(func.id, (time.time() - begin) * 1000))
+    return dict(func=func.id, start=(begin - start) * 1000, latency_ms=(time.time() - begin) * 1000)
+
+
+def run_tenants(params, funcs, method, stagger, shared):
+    # the functions as tenants of one VM sized for all of them (shared) or of a VM each, tenant i starting
+    # i * stagger seconds in; returns the tenants and the memory samples
+    memory = sum(func.mem for func in funcs) + params.mem
+    if shared:
+        vm = start_vertical_vm(params, funcs[0].name, method, memory, min(os.cpu_count(), params.vcpu + len(funcs)),
+                               replaces=0)
+        vms = [vm] * len(funcs)
+    else:
+        vms = [start_vertical_vm(params, func.name, method, func.mem + params.mem, min(os.cpu_count(), params.vcpu + 1),
+                                 idx, replaces=0) for idx, func in enumerate(funcs, 1)]
+
+    start = time.time()
+    monitors = {vm.vm_id: VMMemory(params, vm, idx, "vm%d" % idx, start, method)
+                for idx, vm in enumerate(vms[:1] if shared else vms, 1)}
+    for monitor in monitors.values():
+        monitor.start()
+    with Pool(len(funcs)) as p:
+        tenants = p.map(invoke_tenant, [(func, vm.vm_id, i * stagger, start) for i, (func, vm) in
+                                        enumerate(zip(funcs, vms))])
+    samples = [sample for monitor in monitors.values() for sample in monitor.stop()]
+
+    for vm_id in monitors:
+        clients[1].vms_vm_id_delete(vm_id=vm_id)
+        wait_vm_gone(params, vm_id, 0)
+    return tenants, samples
+
+
+def density_summary(rows, samples):
+    # per function the latency in the shared VM over the one in its own VM, per run the scale operations the
+    # samples saw and the summed peak and mean Rss of its VMs
+    latency = {(r["stagger"], r["mode"], r["func"]): r["latency_ms"] for r in rows}
+    summary = []
+    for stagger, mode in dict.fromkeys((r["stagger"], r["mode"]) for r in rows):
+        by_vm, ops = {}, 0
+        for s in samples:
+            if s["stagger"] == stagger and s["mode"] == mode:
+                by_vm.setdefault(s["vm"], []).append(s["rss_mb"])
+                ops += s["scale_ops"]
+        summary.append(dict(stagger=stagger, mode=mode, func="all", scale_ops=ops, vms=len(by_vm),
+                            peak_rss_mb=sum(max(v) for v in by_vm.values()),
+                            mean_rss_mb=sum(sum(v) / len(v) for v in by_vm.values())))
+        if mode == "shared":
+            for r in rows:
+                if r["stagger"] == stagger and r["mode"] == mode:
+                    separate = latency.get((stagger, "separate", r["func"]))
+                    summary.append(dict(stagger=stagger, mode=mode, func=r["func"], latency_ms=r["latency_ms"],
+                                        separate_latency_ms=separate,
+                                        inflation=r["latency_ms"] / separate if separate else None))
+    return summary
+
+
+def run_density(params, setting, funcs):
+    # the functions of setting.mix as tenants of one balloon or faascale VM (setting.method), started together
+    # and staggered by each of setting.staggers seconds, against the same mix with a VM per function; setup created
+    # funcs[0] already
+    for func in funcs[1:]:
+        create_function(clients[1], params, setting, func)
+    rows, samples = [], []
+    for stagger in setting.staggers:
+        for mode in ("shared", "separate"):
+            tenants, memory = run_tenants(params, funcs, setting.method, stagger, mode == "shared")
+            rows += [dict(setting=setting.name, stagger=stagger, mode=mode, **t) for t in tenants]
+            samples += [dict(setting=setting.name, stagger=stagger, mode=mode, **m) for m in memory]
+
+    result_dir = os.path.join(RESULT_DIR, "density", setting.name)
+    os.makedirs(result_dir, exist_ok=True)
+    summary = density_summary(rows, samples)
+    write_csv(rows, os.path.join(result_dir, "tenants.csv"))
+    write_csv(samples, os.path.join(result_dir, "memory.csv"))
+    write_csv(summary, os.path.join(result_dir, "summary.csv"))
+    for row in summary:
+        if row["func"] == "all":
+            print("stagger {stagger}s {mode}: {vms} VMs, {scale_ops} scale ops, peak Rss {peak_rss_mb:.0f}MB, "
+                  "mean Rss {mean_rss_mb:.0f}MB".format(**row))
+        elif row["inflation"] is not None:
+            print("stagger {stagger}s {func}: {latency_ms:.1f}ms shared, {separate_latency_ms:.1f}ms alone, "
+                  "x{inflation:.2f}".format(**row))
+
+
 def run(params, setting, func, par, repeat):
     for r in range(repeat):
         print("\n=========%s %s: %d=========\n" % (setting.name, func.id, r))
-        # set up
-        daemon_pipe = setup(params, setting, par, func)
+        if hasattr(setting, "mix"):
+            # a density setting runs its own mix of functions, a client for each in the separate VMs
+            funcs = [vars(params.functions)[f] for f in setting.mix]
+            daemon_pipe = setup(params, setting, len(funcs), funcs[0])
+            run_density(params, setting, funcs)
+            clean_up(daemon_pipe)
+            continue
+        # set up, only one client for balloon and faascale
+        daemon_pipe = setup(params, setting, 1 if setting.name in ("balloon", "faascale") else par, func)
         if setting.name == 'warm':
             run_warm(params, setting, par, func)
         elif setting.name == 'cold':
@@ -308,10 +563,9 @@ def run(params, setting, func, par, repeat):
         clean_up(daemon_pipe)
 
 
-def main(config_file):
-    global conf
-    os.system("rm -rf %s" % RESULT_DIR)
-    os.makedirs(RESULT_DIR, mode=0o777, exist_ok=False)
+def load_params(config_file):
+    # the test.json as nested namespaces, also writes the daemon's config and points the clients at it
+    global conf, WAIT_TIMEOUT
     with open(config_file, 'r') as f:
         params = json.load(f, object_hook=lambda d: SimpleNamespace(**d))
 
@@ -319,6 +573,14 @@ def main(config_file):
         json.dump(params.daemon, f, default=lambda o: o.__dict__, sort_keys=False, indent=4)
     conf = Configuration()
     conf.host = params.host
+    WAIT_TIMEOUT = getattr(params, "wait_timeout", WAIT_TIMEOUT)
+    return params
+
+
+def main(config_file):
+    os.system("rm -rf %s" % RESULT_DIR)
+    os.makedirs(RESULT_DIR, mode=0o777, exist_ok=False)
+    params = load_params(config_file)
 
     print("repeat:", params.repeat)
     print("kernels:", params.daemon.kernels)
@@ -328,12 +590,14 @@ def main(config_file):
     # funcs = ["hello", "mmap", "read", "image"]
     # funcs = ['json', 'pyaes', 'compression', 'chameleon', 'matmul', 'pagerank', 'ffmpeg', 'recognition']
     funcs = ['hello']
-    settings = ["cold", "vanilla", "vanilla-cache", "warm", "balloon", "faascale"]
+    settings = ["cold", "vanilla", "vanilla-cache", "warm", "balloon", "faascale", "balloon-density",
+                "faascale-density"]
     settings = ["cold"]
     for func in funcs:
         for setting in settings:
+            # clean_up waits for the daemon to exit and setup for the VMs, no sleep between the runs
             run(params, vars(params.settings)[setting], vars(params.functions)[func], 1, 1)
-            time.sleep(3)
+    print("readiness waits saved %.1fs of wall time against fixed sleeps" % saved.value)
 
 
 if __name__ == '__main__':
@@ -1,37 +1,220 @@
 import json
+import math
+import mmap
+import multiprocessing
 import os
+import random
+import resource
+import threading
 from flask import Flask, request
 import time
 
 app = Flask(__name__)
 
+PHASES = ['size', 'touch', 'free']
+TOUCH_PATTERNS = ['sequential', 'random', 'stride4k', 'thp']
+
 
 @app.route('/')
 def invoke():
     size_mib = int(request.args['size'])
+    repeat = int(request.args.get('repeat', 100))
+    warmup = int(request.args.get('warmup', 0))
+    touch = request.args.get('touch', '0') == '1'
+    pattern = request.args.get('pattern', 'stride4k')
+
+    samples = scale_faascale_cgroup(cgroup_path, size_mib, repeat, warmup, touch, pattern)
+    summary = summarize(samples)
+    return json.dumps({'scale_up_uses': summary['size']['mean'],
+                       'scale_down_uses': summary['free']['mean'],
+                       'samples': samples,
+                       'summary': summary})
+
+
+@app.route('/touch')
+def invoke_touch():
+    # first touch of `size` MB outside of any faascale cgroup, e.g. after a balloon deflation or virtio-mem plug
+    size_mib = int(request.args['size'])
+    pattern = request.args.get('pattern', 'stride4k')
+    return json.dumps(first_touch(None, size_mib, pattern))
+
+
+@app.route('/concurrent')
+def invoke_concurrent():
+    # n cgroups scale up and down at the same time, on n threads or n processes
+    size_mib = int(request.args['size'])
+    n = int(request.args['n'])
+    repeat = int(request.args.get('repeat', 100))
+    warmup = int(request.args.get('warmup', 0))
+    touch = request.args.get('touch', '0') == '1'
+    mode = request.args.get('mode', 'process')
+
+    paths = [os.path.join(cgroup_path, 'c%d' % i) for i in range(n)]
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+    try:
+        if mode == 'thread':
+            results = run_threads(paths, size_mib, repeat, warmup, touch)
+        else:
+            results = run_processes(paths, size_mib, repeat, warmup, touch)
+    finally:
+        for path in paths:
+            os.rmdir(path)
+
+    workers = [{'samples': samples, 'summary': summarize(samples)} for samples, _ in results]
+    merged = {phase: [v for samples, _ in results for v in samples[phase]] for phase in PHASES}
+    wall_time = max(end for _, (_, end) in results) - min(start for _, (start, _) in results)
+    return json.dumps({'n': n, 'mode': mode,
+                       'wall_time': wall_time * 1000,
+                       # MB given to and taken back from the cgroups per second, over all workers
+                       'throughput_mb_s': 2 * n * repeat * size_mib / wall_time,
+                       'summary': summarize(merged),
+                       'workers': workers})
+
+
+def run_threads(paths, size_mib, repeat, warmup, touch):
+    barrier = threading.Barrier(len(paths))
+    results = [None] * len(paths)
+
+    def worker(i):
+        barrier.wait()
+        start = time.perf_counter()
+        samples = scale_faascale_cgroup(paths[i], size_mib, repeat, warmup, touch)
+        results[i] = (samples, (start, time.perf_counter()))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(paths))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
 
-    return create_faascale_cgroup(size_mib)
+def process_worker(barrier, queue, i, path, size_mib, repeat, warmup, touch):
+    barrier.wait()
+    start = time.perf_counter()
+    samples = scale_faascale_cgroup(path, size_mib, repeat, warmup, touch)
+    queue.put((i, samples, (start, time.perf_counter())))
 
 
-def create_faascale_cgroup(size_mib):
+def run_processes(paths, size_mib, repeat, warmup, touch):
+    barrier = multiprocessing.Barrier(len(paths))
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=process_worker,
+                                     args=(barrier, queue, i, path, size_mib, repeat, warmup, touch))
+             for i, path in enumerate(paths)]
+    for p in procs:
+        p.start()
+    results = [None] * len(paths)
+    for _ in procs:
+        i, samples, span = queue.get()
+        results[i] = (samples, span)
+    for p in procs:
+        p.join()
+    return results
+
+
+def read_vmstat(key):
+    with open('/proc/vmstat') as f:
+        for line in f:
+            name, value = line.split()
+            if name == key:
+                return int(value)
+    return 0
+
+
+def touch_memory(size_mib, pattern):
+    length = 1024 * 1024 * size_mib
+    mm = mmap.mmap(-1, length, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+    if pattern == 'thp':
+        mm.madvise(mmap.MADV_HUGEPAGE)
+    else:
+        mm.madvise(mmap.MADV_NOHUGEPAGE)
+    pages = range(0, length, mmap.PAGESIZE)
+    if pattern == 'random':
+        pages = list(pages)
+        random.shuffle(pages)
+    chunk = b'\1' * 1024 * 1024
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    thp = read_vmstat('thp_fault_alloc')
+    start = time.perf_counter()
+    if pattern == 'sequential':
+        for i in range(0, length, len(chunk)):
+            mm[i:i + len(chunk)] = chunk
+    else:
+        for i in pages:
+            mm[i] = 1
+    use_time = (time.perf_counter() - start) * 1000
+    usage_ = resource.getrusage(resource.RUSAGE_SELF)
+    return {'touch': use_time,
+            'minflt': usage_.ru_minflt - usage.ru_minflt,
+            'majflt': usage_.ru_majflt - usage.ru_majflt,
+            'thp_faults': read_vmstat('thp_fault_alloc') - thp}
+
+
+def first_touch(path, size_mib, pattern='stride4k'):
+    # touch `size_mib` from a child, running in the cgroup at `path` if given, returns the ms spent touching
+    # and the page faults it took
+    read_, write_ = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_)
+        if path is not None:
+            with open(os.path.join(path, 'cgroup.procs'), 'w') as f:
+                f.write(str(os.getpid()))
+        os.write(write_, json.dumps(touch_memory(size_mib, pattern)).encode())
+        os._exit(0)
+    os.close(write_)
+    with os.fdopen(read_, 'rb') as f:
+        result = json.loads(f.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def scale_faascale_cgroup(path, size_mib, repeat, warmup=0, touch=False, pattern='stride4k'):
     size = "{}M".format(size_mib)
 
-    scale_up_uses = []
-    scale_down_uses = []
-    for i in range(100):
-        start1 = time.time()
-        with open(os.path.join(cgroup_path, 'memory.faascale.size'), 'w') as f:
+    samples = {phase: [] for phase in PHASES + ['minflt', 'majflt', 'thp_faults']}
+    for i in range(warmup + repeat):
+        start1 = time.perf_counter()
+        with open(os.path.join(path, 'memory.faascale.size'), 'w') as f:
             f.write(size)
+        end1 = time.perf_counter()
 
-        start2 = time.time()
-        with open(os.path.join(cgroup_path, 'memory.faascale.free'), 'w') as f:
+        touched = first_touch(path, size_mib, pattern) if touch else {}
+
+        start2 = time.perf_counter()
+        with open(os.path.join(path, 'memory.faascale.free'), 'w') as f:
             f.write("1")
-        end = time.time()
-        scale_up_uses.append((start2 - start1) * 1000)
-        scale_down_uses.append((end - start2) * 1000)
+        end2 = time.perf_counter()
+        if i < warmup:
+            continue
+        samples['size'].append((end1 - start1) * 1000)
+        samples['free'].append((end2 - start2) * 1000)
+        for key in ['touch', 'minflt', 'majflt', 'thp_faults']:
+            samples[key].append(touched.get(key, 0))
+
+    return samples
+
+
+def percentile(sorted_values, p):
+    k = (len(sorted_values) - 1) * p / 100
+    f = math.floor(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
 
-    return json.dumps({'scale_up_uses': sum(scale_up_uses) / len(scale_up_uses),
-                       'scale_down_uses': sum(scale_down_uses) / len(scale_down_uses)})
+def summarize(samples):
+    summary = {}
+    for phase, values in samples.items():
+        values = sorted(values)
+        if not values:
+            continue
+        summary[phase] = {'n': len(values), 'mean': sum(values) / len(values), 'min': values[0],
+                          'p50': percentile(values, 50), 'p90': percentile(values, 90),
+                          'p99': percentile(values, 99), 'max': values[-1]}
+    return summary
 
 
 if __name__ == '__main__':
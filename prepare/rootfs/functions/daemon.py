@@ -1,3 +1,5 @@
+import array
+import collections
 import json
 import multiprocessing
 import os
@@ -6,6 +8,7 @@ import signal
 import string
 import subprocess
 import tempfile
+import threading
 
 from flask import Flask, request
 
@@ -17,6 +20,10 @@ from concurrent.futures import ThreadPoolExecutor
 
 executor = ThreadPoolExecutor(max_workers=2)
 MEMINFO = False
+MEMINFO_INTERVAL_MS = 1
+MEMINFO_CAPACITY = 65536  # samples kept per invocation, older ones are overwritten
+MEMINFO_PREALLOCATE = 1024  # samples the buffer starts with, doubled as needed up to MEMINFO_CAPACITY
+MEMINFO_KEEP = 64  # timelines kept for /meminfo
 ENABLE_TCPDUMP = False
 
 global_queue = multiprocessing.Queue()
@@ -29,6 +36,135 @@ if ENABLE_TCPDUMP:
                                     stdout=dumpfile, stderr=dumpfile, text=True)
 
 
+meminfo_timelines = collections.OrderedDict()
+
+
+class MemSampler(threading.Thread):
+    # one sample: [ts_us, MemFree, MemAvailable, cgroup usage, cgroup rss, child rss], all memory in KB
+    FIELDS = ['ts_us', 'mem_free_kb', 'mem_available_kb', 'cgroup_usage_kb', 'cgroup_rss_kb', 'child_rss_kb']
+
+    def __init__(self, invocation_id, pid=None, cgroup_path=None, interval_ms=MEMINFO_INTERVAL_MS,
+                 capacity=MEMINFO_CAPACITY):
+        super().__init__(daemon=True)
+        self.invocation_id = invocation_id
+        self.interval = interval_ms / 1000
+        self.capacity = capacity
+        # ring buffer, preallocated for a short invocation and doubled when full, so that most samples do not allocate
+        self.allocated = min(capacity, MEMINFO_PREALLOCATE)
+        self.buffer = array.array('q', bytes(8 * len(self.FIELDS) * self.allocated))
+        self.count = 0
+        self.stopped = threading.Event()
+        paths = {'meminfo': '/proc/meminfo'}
+        if pid is not None:
+            paths['statm'] = '/proc/%d/statm' % pid
+        if cgroup_path is not None:
+            paths['usage'] = os.path.join(cgroup_path, 'memory.usage_in_bytes')
+            paths['stat'] = os.path.join(cgroup_path, 'memory.stat')
+        self.fds = {}
+        try:
+            for name, path in paths.items():
+                self.fds[name] = os.open(path, os.O_RDONLY)
+        except OSError:
+            self.close()
+            raise
+        self.page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+        self.start_ns = time.monotonic_ns()
+
+    def watch(self, pid):
+        # the process to report the Rss of, for one forked after the sampling started
+        self.fds['statm'] = os.open('/proc/%d/statm' % pid, os.O_RDONLY)
+
+    def read(self, name):
+        fd = self.fds.get(name)
+        if fd is None:
+            return None
+        try:
+            return os.pread(fd, 8192, 0)
+        except OSError:
+            # the child has exited or the cgroup is gone
+            return None
+
+    def sample(self):
+        ts = (time.monotonic_ns() - self.start_ns) // 1000
+        mem_free = mem_available = cgroup_usage = cgroup_rss = child_rss = -1
+        for line in self.read('meminfo').split(b'\n', 3)[:3]:
+            if line.startswith(b'MemFree:'):
+                mem_free = int(line.split()[1])
+            elif line.startswith(b'MemAvailable:'):
+                mem_available = int(line.split()[1])
+        data = self.read('usage')
+        if data:
+            cgroup_usage = int(data) // 1024
+        data = self.read('stat')
+        if data:
+            for line in data.split(b'\n'):
+                if line.startswith(b'rss '):
+                    cgroup_rss = int(line.split()[1]) // 1024
+                    break
+        data = self.read('statm')
+        if data:
+            child_rss = int(data.split()[1]) * self.page_kb
+        if self.count == self.allocated < self.capacity:
+            grow = min(self.allocated, self.capacity - self.allocated)
+            self.buffer.frombytes(bytes(8 * len(self.FIELDS) * grow))
+            self.allocated += grow
+        offset = (self.count % self.capacity) * len(self.FIELDS)
+        self.buffer[offset:offset + len(self.FIELDS)] = array.array(
+            'q', (ts, mem_free, mem_available, cgroup_usage, cgroup_rss, child_rss))
+        self.count += 1
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+        # always record the final state
+        self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.close()
+        return self.timeline()
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    def timeline(self):
+        n = len(self.FIELDS)
+        kept = min(self.count, self.capacity)
+        first = self.count - kept
+        samples = []
+        for i in range(first, self.count):
+            offset = (i % self.capacity) * n
+            samples.append(self.buffer[offset:offset + n].tolist())
+        return {'invocation_id': self.invocation_id, 'interval_ms': self.interval * 1000,
+                'fields': self.FIELDS, 'dropped': first, 'samples': samples}
+
+
+def start_sampler(meminfo, pid=None, cgroup_path=None):
+    if meminfo is None:
+        return None
+    sampler = MemSampler(meminfo['invocation_id'], pid, cgroup_path, meminfo['interval_ms'])
+    sampler.start()
+    return sampler
+
+
+def stop_sampler(sampler):
+    if sampler is None:
+        return None
+    return sampler.stop()
+
+
+def save_timeline(timeline):
+    if timeline is None:
+        return
+    meminfo_timelines[timeline['invocation_id']] = timeline
+    while len(meminfo_timelines) > MEMINFO_KEEP:
+        meminfo_timelines.popitem(last=False)
+
+
 def invoke_function(*args):
     funcname, request_args, context = args
     if funcname == 'hello':
@@ -82,7 +218,7 @@ def invoke_function(*args):
 
 def function(*args):
     global global_queue
-    funcname, hostname, password, funcmem, request_args = args
+    funcname, hostname, password, funcmem, request_args, meminfo = args
     r = redis.Redis(host=hostname, port=6379, db=0, password=password)
 
     if funcname.endswith('-faascale'):
@@ -90,7 +226,13 @@ def function(*args):
     elif funcname.endswith('-balloon'):
         type_ = 'balloon'
     else:
-        return invoke_function(funcname, request_args, {'r': r})
+        sampler = start_sampler(meminfo, pid=os.getpid())
+        try:
+            result = invoke_function(funcname, request_args, {'r': r})
+        finally:
+            timeline = stop_sampler(sampler)
+        save_timeline(timeline)
+        return result
 
     pipe_path = tempfile.mktemp()
     os.mkfifo(pipe_path)
@@ -100,12 +242,14 @@ def function(*args):
             "funcname": funcname[0:(len(type_) + 1) * -1],
             "request_args": request_args,
             "funcmem": funcmem,
+            "meminfo": meminfo,
             "context": {'hostname': hostname, 'password': password}
         }))
     with open(pipe_path, 'r') as f:
-        data = f.read()
-        print(data)
-        result = json.loads(data)["result"]
+        data = json.loads(f.read())
+        print(data["result"])
+        result = data["result"]
+    save_timeline(data.get("meminfo"))
     os.remove(pipe_path)
     return result
 
@@ -121,11 +265,37 @@ def invoke():
     redishost = request.args['redishost']
     redispasswd = request.args['redispasswd']
     funcmem = request.args['funcmem']
+    meminfo = None
+    if MEMINFO:
+        meminfo = {'invocation_id': request.args.get('invocation_id', ''.join(random.choices(characters, k=8))),
+                   'interval_ms': float(request.args.get('meminfo_interval_ms', MEMINFO_INTERVAL_MS))}
 
     starttime = time.time()
-    result = function(funcname, redishost, redispasswd, funcmem, request.json)
+    result = function(funcname, redishost, redispasswd, funcmem, request.json, meminfo)
     finishtime = time.time()
-    return 'read %f\nprocess %f\nwrite %f' % (result[0] - starttime, result[1] - result[0], finishtime - result[1])
+    ret = 'read %f\nprocess %f\nwrite %f' % (result[0] - starttime, result[1] - result[0], finishtime - result[1])
+    if meminfo is not None:
+        ret += '\nmeminfo %s' % json.dumps(meminfo_timelines.get(meminfo['invocation_id']))
+    return ret
+
+
+@app.route('/meminfo')
+def meminfo_timeline():
+    invocation_id = request.args.get('invocation_id')
+    if invocation_id is None:
+        return json.dumps(list(meminfo_timelines.keys()))
+    if invocation_id not in meminfo_timelines:
+        return 'unknown invocation %s' % invocation_id, 404
+    return json.dumps(meminfo_timelines[invocation_id])
+
+
+@app.route('/faascale')
+def faascale_cgroups():
+    # the cgroups of the faascale invocations running, one per invocation from its scale up to its scale down
+    path = '/sys/fs/cgroup/memory/faascale'
+    if not os.path.isdir(path):
+        return json.dumps([])
+    return json.dumps([name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))])
 
 
 @app.route('/logs')
@@ -161,10 +331,15 @@ def zygote_balloon_handler(pipe_path):
         funcname = data['funcname']
         request_args = data['request_args']
         context = data['context']
+        meminfo = data['meminfo']
     r = redis.Redis(host=context['hostname'], port=6379, db=0, password=context['password'])
-    result = invoke_function(funcname, request_args, {'r': r})
+    sampler = start_sampler(meminfo, pid=os.getpid())
+    try:
+        result = invoke_function(funcname, request_args, {'r': r})
+    finally:
+        timeline = stop_sampler(sampler)
     with open(pipe_path, 'w') as f:
-        f.write(json.dumps({"result": result}))
+        f.write(json.dumps({"result": result, "meminfo": timeline}))
 
 
 def zygote_faascale_handler(pipe_path):
@@ -174,29 +349,37 @@ def zygote_faascale_handler(pipe_path):
         request_args = data['request_args']
         context = data['context']
         funcmem = data['funcmem']
+        meminfo = data['meminfo']
     r = redis.Redis(host=context['hostname'], port=6379, db=0, password=context['password'])
     random_string = ''.join(random.choices(characters, k=8))
     cgroup_path = '/sys/fs/cgroup/memory/faascale/%s' % random_string
     os.makedirs(cgroup_path, exist_ok=False)
-    size = "{}M".format(funcmem)
-    with open(os.path.join(cgroup_path, 'memory.faascale.size'), 'w') as f:
-        f.write(size)
-
-    read_, write_ = os.pipe()
-    pid = os.fork()
-    if pid == 0:
-        os.close(read_)
-        pid = os.getpid()
-        with open(os.path.join(cgroup_path, 'cgroup.procs'), 'w') as f:
-            f.write(str(pid))
-        result = invoke_function(funcname, request_args, {'r': r})
-        os.write(write_, json.dumps(result).encode())
+    # sampled from before the scale up, so that the timeline covers the memory.faascale.size write
+    sampler = start_sampler(meminfo, cgroup_path=cgroup_path)
+    try:
+        size = "{}M".format(funcmem)
+        with open(os.path.join(cgroup_path, 'memory.faascale.size'), 'w') as f:
+            f.write(size)
+
+        read_, write_ = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_)
+            pid = os.getpid()
+            with open(os.path.join(cgroup_path, 'cgroup.procs'), 'w') as f:
+                f.write(str(pid))
+            result = invoke_function(funcname, request_args, {'r': r})
+            os.write(write_, json.dumps(result).encode())
+            os.close(write_)
+            time.sleep(10)
         os.close(write_)
-        time.sleep(10)
-    os.close(write_)
-    result = os.read(read_, 1024)
+        if sampler is not None:
+            sampler.watch(pid)
+        result = os.read(read_, 1024)
+    finally:
+        timeline = stop_sampler(sampler)
     with open(pipe_path, 'w') as f:
-        f.write(json.dumps({"result": json.loads(result)}))
+        f.write(json.dumps({"result": json.loads(result), "meminfo": timeline}))
     os.close(read_)
     os.kill(pid, signal.SIGTERM)
     os.wait()
@@ -6,7 +6,7 @@ def lambda_handler(event, context):
     ts1 = time.time()
     size = int(event['size'])
     mm = mmap.mmap(-1, 1024 * 1024 * size, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
-    for i in range(0, 1024 * 1024 * 512, 4096):
+    for i in range(0, 1024 * 1024 * size, mmap.PAGESIZE):
         mm[i] = 1
     mm.close()
     ts2 = time.time()
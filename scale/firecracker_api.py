@@ -0,0 +1,73 @@
+import time
+
+import httpx
+
+# adaptive polling: start fast, back off exponentially while nothing changes
+MIN_POLL_INTERVAL_S = 0.0001
+MAX_POLL_INTERVAL_S = 0.01
+
+
+class FirecrackerAPI:
+    # a keep-alive client for the Firecracker API socket, reused for every request
+
+    def __init__(self, socket_location: str, timeout: float = 10):
+        self.socket_location = socket_location
+        self.client = httpx.Client(transport=httpx.HTTPTransport(uds=socket_location), base_url="http://localhost",
+                                   headers={'Accept': 'application/json'}, timeout=timeout)
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, method: str, path: str, expect: int, body=None):
+        # curl --unix-socket $socket_location -i -X $method "http://localhost$path" -d "$body"
+        resp = self.client.request(method, path, json=body)
+        if resp.status_code != expect:
+            raise RuntimeError("firecracker {} {} error: {}".format(method, path, resp.text))
+        return resp
+
+    def machine_config(self):
+        return self.request("GET", "/machine-config", 200).json()
+
+    def balloon(self):
+        return self.request("GET", "/balloon", 200).json()
+
+    def balloon_statistics(self):
+        return self.request("GET", "/balloon/statistics", 200).json()
+
+    def patch_balloon(self, amount_mib: int):
+        self.request("PATCH", "/balloon", 204, {"amount_mib": amount_mib})
+
+    def patch_balloon_statistics(self, stats_polling_interval_s: int):
+        self.request("PATCH", "/balloon/statistics", 204, {"stats_polling_interval_s": stats_polling_interval_s})
+
+    def wait_balloon(self, amount_mib: int, start: float = None, timeout: float = 60,
+                     min_interval: float = MIN_POLL_INTERVAL_S, max_interval: float = MAX_POLL_INTERVAL_S):
+        # wait until the balloon reaches amount_mib, returns the ms since `start` (a time.perf_counter() value)
+        if start is None:
+            start = time.perf_counter()
+        interval = min_interval
+        last_actual = None
+        while time.perf_counter() - start < timeout:
+            result = self.balloon_statistics()
+            if result["target_mib"] == amount_mib and result["actual_mib"] == amount_mib:
+                return (time.perf_counter() - start) * 1000
+            if result["actual_mib"] != last_actual:
+                # the balloon is moving, keep polling at the finest interval
+                last_actual = result["actual_mib"]
+                interval = min_interval
+            else:
+                interval = min(interval * 2, max_interval)
+            time.sleep(interval)
+        raise TimeoutError("balloon did not reach {}MB in {}s".format(amount_mib, timeout))
+
+    def scale_balloon(self, amount_mib: int, **kwargs):
+        # returns the ms from the PATCH request until the balloon reaches amount_mib
+        start = time.perf_counter()
+        self.patch_balloon(amount_mib)
+        return self.wait_balloon(amount_mib, start=start, **kwargs)
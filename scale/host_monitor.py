@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+
+def read_cpu_times():
+    # (busy, total) jiffies of all CPUs from /proc/stat
+    with open("/proc/stat") as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    idle = values[3] + values[4]
+    total = sum(values[:8])
+    return total - idle, total
+
+
+def read_meminfo(fields=("MemTotal", "MemFree", "MemAvailable", "AnonPages", "AnonHugePages")):
+    result = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in fields:
+                result[key] = int(value.split()[0])
+    return result
+
+
+class HostMonitor(threading.Thread):
+    # samples host CPU utilization and memory every interval_ms until stopped
+
+    def __init__(self, interval_ms: float = 50):
+        super().__init__(daemon=True)
+        self.interval = interval_ms / 1000
+        self.samples = []
+        self.stopped = threading.Event()
+        self.start_time = None
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        last_busy, last_total = read_cpu_times()
+        while not self.stopped.wait(self.interval):
+            busy, total = read_cpu_times()
+            memory = read_meminfo()
+            self.samples.append({
+                "time": (time.perf_counter() - self.start_time) * 1000,
+                "cpu_util": (busy - last_busy) / max(total - last_total, 1),
+                "mem_used_mb": (memory["MemTotal"] - memory["MemFree"]) / 1024,
+                "mem_available_mb": memory["MemAvailable"] / 1024,
+                "anon_mb": memory["AnonPages"] / 1024,
+                "anon_huge_mb": memory["AnonHugePages"] / 1024,
+            })
+            last_busy, last_total = busy, total
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+
+def find_pid(name: str, marker: str):
+    # pid of the process running executable `name` with an argument containing `marker`, sudo and ip netns exec
+    # wrappers carry the same arguments but a different executable
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/cmdline".format(entry), 'rb') as f:
+                args = f.read().decode().split("\0")
+        except OSError:
+            continue
+        if os.path.basename(args[0]) == name and any(marker in arg for arg in args[1:]):
+            return int(entry)
+    return None
+
+
+def read_smaps_rollup(pid: int):
+    # memory of a process in KB: Rss, Pss, AnonHugePages, Private_Hugetlb, Swap, SwapPss, ...
+    result = {}
+    with open("/proc/{}/smaps_rollup".format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                result[parts[0][:-1]] = int(parts[1])
+    return result
+
+
+class ReclaimMonitor(threading.Thread):
+    # samples the memory of the VMM process every interval_ms, to see when memory actually goes back to the host
+    FIELDS = ("Rss", "Pss", "AnonHugePages", "Private_Hugetlb", "Swap", "SwapPss")
+
+    def __init__(self, pid: int, interval_ms: float = 1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval_ms / 1000
+        self.samples = []
+        self.stopped = threading.Event()
+        self.sampled = threading.Event()
+        self.start_time = time.perf_counter()
+        self.error = None
+
+    def start(self):
+        # returns once the first sample, the memory before the operation, is taken
+        super().start()
+        self.sampled.wait()
+        self.check()
+
+    def run(self):
+        try:
+            while True:
+                memory = read_smaps_rollup(self.pid)
+                self.samples.append(dict(time=(time.perf_counter() - self.start_time) * 1000,
+                                         **{k: memory.get(k, 0) for k in self.FIELDS}))
+                self.sampled.set()
+                if self.stopped.wait(self.interval):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            # start() must not wait forever when the first sample fails
+            self.sampled.set()
+
+    def check(self):
+        # raises what ended the sampling early
+        if self.error is not None:
+            raise RuntimeError("sampling the memory of pid %d failed" % self.pid) from self.error
+
+    def wait_stable(self, stable_ms: float = 200, timeout_ms: float = 5000):
+        # keep sampling until Rss has not moved by more than 1MB for stable_ms
+        deadline = time.perf_counter() + timeout_ms / 1000
+        while time.perf_counter() < deadline and self.error is None:
+            time.sleep(stable_ms / 4000)
+            if not self.samples:
+                continue
+            last = self.samples[-1]
+            recent = [s for s in self.samples if s["time"] >= last["time"] - stable_ms]
+            rss = [s["Rss"] for s in recent]
+            if recent[0]["time"] <= last["time"] - stable_ms * 0.9 and max(rss) - min(rss) <= 1024:
+                break
+        self.stopped.set()
+        self.join()
+        self.check()
+        return self.samples
+
+
+def reclaim_stats(samples: list):
+    # bytes given back to the host, from the peak Rss (the start of a reclaim) to the final one, and the time from
+    # the peak until Rss is within 1% (at least 1MB) of its final value
+    peak = max(samples, key=lambda s: s["Rss"])
+    final = samples[-1]
+    returned = peak["Rss"] - final["Rss"]
+    tolerance = max(returned * 0.01, 1024)
+    reclaimed = next(s for s in samples if s["time"] >= peak["time"] and s["Rss"] <= final["Rss"] + tolerance)
+    return {
+        "host_returned_mb": returned / 1024,
+        "time_to_host_reclaim": reclaimed["time"] - peak["time"],
+        "rss_peak_mb": peak["Rss"] / 1024,
+        "rss_after_mb": final["Rss"] / 1024,
+        "pss_returned_mb": (peak["Pss"] - final["Pss"]) / 1024,
+        "huge_returned_mb": (peak["AnonHugePages"] + peak["Private_Hugetlb"] - final["AnonHugePages"] -
+                             final["Private_Hugetlb"]) / 1024,
+        "swap_change_mb": (final["Swap"] - peak["Swap"]) / 1024,
+        "host_samples": len(samples),
+    }
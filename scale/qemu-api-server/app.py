@@ -1,84 +1,249 @@
 import asyncio
+import collections
+import itertools
 import json
+import threading
 import time
 import os
 
-from flask import Flask, request
-
-from qemu.qmp import QMPClient
-
-
-async def current_balloon_size():
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
-    origin_size = (await qmp.execute('query-balloon'))['actual']
-    await qmp.disconnect()
-    return origin_size
-
-
-async def change_balloon(target):
-    # command docs: https://qemu-project.gitlab.io/qemu/interop/qemu-qmp-ref.html
-    # qmp docs:https://qemu.readthedocs.io/projects/python-qemu-qmp/en/latest/main.html
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
-
+from flask import Flask, Response, request
+
+from qemu.qmp import QMPClient, Runstate
+
+QMP_SOCKET = os.environ.get('QMP_SOCKET', '/tmp/qmp.sock')
+# BALLOON_CHANGE and MEMORY_DEVICE_SIZE_CHANGE are throttled by qemu, so we fall back to polling when no event
+# arrives within this interval
+POLL_INTERVAL_S = float(os.environ.get('QMP_POLL_INTERVAL_S', 0.005))
+SCALE_TIMEOUT_S = float(os.environ.get('QMP_SCALE_TIMEOUT_S', 60))
+# json file with a list of {"name", "qmp_socket", "virtio_mem_id"} registered at start up
+VMS_FILE = os.environ.get('QEMU_VMS')
+JOBS_KEEP = 4096
+# progress updates kept per job, the older ones are dropped
+PROGRESS_KEEP = 1024
+
+# every VM keeps one long-lived QMP connection, all of them owned by this event loop
+loop = asyncio.new_event_loop()
+threading.Thread(target=loop.run_forever, daemon=True).start()
+
+
+def run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+class QMPSession:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.qmp = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.qmp is not None and self.qmp.runstate == Runstate.RUNNING:
+                return self.qmp
+            if self.qmp is not None:
+                await self.qmp.disconnect()
+            # command docs: https://qemu-project.gitlab.io/qemu/interop/qemu-qmp-ref.html
+            # qmp docs:https://qemu.readthedocs.io/projects/python-qemu-qmp/en/latest/main.html
+            self.qmp = QMPClient('my-vm-nickname')
+            await self.qmp.connect(self.socket_path)
+            return self.qmp
+
+    async def execute(self, cmd, arguments=None):
+        qmp = await self.connect()
+        return await qmp.execute(cmd, arguments)
+
+    async def listener(self, *names):
+        qmp = await self.connect()
+        return qmp.listener(names)
+
+
+class VM:
+    def __init__(self, name, qmp_socket, virtio_mem_id='vm0'):
+        self.name = name
+        self.qmp_socket = qmp_socket
+        self.virtio_mem_id = virtio_mem_id
+        self.session = QMPSession(qmp_socket)
+        # one scaling operation at a time per VM, different VMs scale concurrently
+        self.scale_lock = asyncio.Lock()
+
+    def to_dict(self):
+        return {'name': self.name, 'qmp_socket': self.qmp_socket, 'virtio_mem_id': self.virtio_mem_id}
+
+
+class Job:
+    def __init__(self, vm, kind, target):
+        self.job_id = next(job_ids)
+        self.vm = vm
+        self.kind = kind
+        self.target = target
+        self.state = 'pending'
+        self.origin = None
+        self.use_time = None
+        self.error = None
+        self.submit_time = time.monotonic()
+        # [ms since the scaling command, size in MB], the latest PROGRESS_KEEP of `reports` updates
+        self.progress = []
+        self.reports = 0
+        self.changed = threading.Condition()
+
+    def update(self, **kwargs):
+        with self.changed:
+            for k, v in kwargs.items():
+                setattr(self, k, v)
+            self.changed.notify_all()
+
+    def report(self, start_time, size_byte):
+        with self.changed:
+            self.progress.append([(time.perf_counter() - start_time) * 1000, size_byte / 1024 / 1024])
+            del self.progress[:-PROGRESS_KEEP]
+            self.reports += 1
+            self.changed.notify_all()
+
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def to_dict(self):
+        return {'job_id': self.job_id, 'vm': self.vm.name, 'kind': self.kind, 'target': self.target,
+                'state': self.state, 'origin': self.origin, 'use_time': self.use_time, 'error': self.error,
+                'progress': self.progress}
+
+
+vms = {}
+jobs = collections.OrderedDict()
+job_ids = itertools.count(1)
+
+
+async def create_vm(name, qmp_socket, virtio_mem_id):
+    # before Python 3.10 an asyncio.Lock binds to the loop current when it is created, so the VM and its session are
+    # built inside the loop that awaits their locks
+    return VM(name, qmp_socket, virtio_mem_id)
+
+
+def register_vm(name, qmp_socket, virtio_mem_id='vm0'):
+    # a name is registered once, replacing its VM would leave the old QMP connection open
+    if name in vms:
+        raise ValueError('vm {} already registered'.format(name))
+    vms[name] = run(create_vm(name, qmp_socket, virtio_mem_id))
+    return vms[name]
+
+
+register_vm('default', QMP_SOCKET)
+if VMS_FILE is not None:
+    with open(VMS_FILE) as f:
+        for vm_ in json.load(f):
+            register_vm(**vm_)
+
+
+async def wait_for(listener, reached, poll):
+    # wait for an event saying the target is reached, check with `poll` whenever the events are quiet
+    deadline = time.monotonic() + SCALE_TIMEOUT_S
+    if await poll():
+        return
+    while time.monotonic() < deadline:
+        try:
+            event = await asyncio.wait_for(listener.get(), POLL_INTERVAL_S)
+            if reached(event['data']):
+                return
+        except asyncio.TimeoutError:
+            if await poll():
+                return
+    raise TimeoutError('memory scaling did not finish in {}s'.format(SCALE_TIMEOUT_S))
+
+
+async def current_balloon_size(vm):
+    return (await vm.session.execute('query-balloon'))['actual']
+
+
+async def change_balloon(vm, target, job=None):
     target_byte = target * 1024 * 1024
 
-    origin_size = int((await qmp.execute('query-balloon'))['actual'] / 1024 / 1024)
+    async with vm.scale_lock:
+        origin_size = int(await current_balloon_size(vm) / 1024 / 1024)
+        if job is not None:
+            job.update(state='running', origin=origin_size)
 
-    start_time = time.time()
-    res = await qmp.execute('balloon', {"value": target_byte})
-    assert len(res) == 0
-    while True:
-        res = await qmp.execute('query-balloon')
-        current_size = int(res['actual'])
-        if current_size == target_byte:
-            # time.sleep(0.01)  # sleep 10ms
-            break
-    end_time = time.time()
-    print("scale balloon {}MB to {}MB uses {:.1f}ms".format(origin_size, target, (end_time - start_time) * 1000))
+        async def poll():
+            current_size = int(await current_balloon_size(vm))
+            if job is not None:
+                job.report(start_time, current_size)
+            return current_size == target_byte
 
-    await qmp.disconnect()
+        def reached(data):
+            if job is not None:
+                job.report(start_time, data['actual'])
+            return data['actual'] == target_byte
 
+        with await vm.session.listener('BALLOON_CHANGE') as listener:
+            start_time = time.perf_counter()
+            res = await vm.session.execute('balloon', {"value": target_byte})
+            assert len(res) == 0
+            await wait_for(listener, reached, poll)
+            end_time = time.perf_counter()
+    use_time = (end_time - start_time) * 1000
+    print("{}: scale balloon {}MB to {}MB uses {:.1f}ms".format(vm.name, origin_size, target, use_time))
+    return use_time
 
-async def current_virtio_mem_block_size():
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
-    size = await qmp.execute('qom-get', {"path": "vm0", "property": "block-size"})
-    await qmp.disconnect()
-    return size
 
+async def current_virtio_mem_block_size(vm):
+    return await vm.session.execute('qom-get', {"path": vm.virtio_mem_id, "property": "block-size"})
 
-async def current_virtio_mem_size():
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
-    size = await qmp.execute('qom-get', {"path": "vm0", "property": "size"})
-    await qmp.disconnect()
-    return size
 
+async def current_virtio_mem_size(vm):
+    return await vm.session.execute('qom-get', {"path": vm.virtio_mem_id, "property": "size"})
 
-async def change_virtio_mem(requested_size):
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
 
+async def change_virtio_mem(vm, requested_size, job=None):
     requested_size_byte = requested_size * 1024 * 1024
 
-    origin_size = int(await qmp.execute('qom-get', {"path": "vm0", "property": "size"}) / 1024 / 1024)
-
-    start_time = time.time()
-    res = await qmp.execute('qom-set', {"path": "vm0", "property": "requested-size", "value": requested_size_byte})
-    assert len(res) == 0
-    while True:
-        current_size = int(await qmp.execute('qom-get', {"path": "vm0", "property": "size"}))
-        if current_size == requested_size_byte:
-            # time.sleep(0.1)  # sleep 100ms
-            break
-    end_time = time.time()
-    print(
-        "change virtio_mem {}MB to {}MB uses {:.1f}ms".format(origin_size, requested_size,
-                                                              (end_time - start_time) * 1000))
-
-    await qmp.disconnect()
+    async with vm.scale_lock:
+        origin_size = int(await current_virtio_mem_size(vm) / 1024 / 1024)
+        if job is not None:
+            job.update(state='running', origin=origin_size)
+
+        async def poll():
+            current_size = int(await current_virtio_mem_size(vm))
+            if job is not None:
+                job.report(start_time, current_size)
+            return current_size == requested_size_byte
+
+        def reached(data):
+            if data.get('id') != vm.virtio_mem_id:
+                return False
+            if job is not None:
+                job.report(start_time, data['size'])
+            return data['size'] == requested_size_byte
+
+        with await vm.session.listener('MEMORY_DEVICE_SIZE_CHANGE') as listener:
+            start_time = time.perf_counter()
+            res = await vm.session.execute('qom-set', {"path": vm.virtio_mem_id, "property": "requested-size",
+                                                       "value": requested_size_byte})
+            assert len(res) == 0
+            await wait_for(listener, reached, poll)
+            end_time = time.perf_counter()
+    use_time = (end_time - start_time) * 1000
+    print("{}: change virtio_mem {}MB to {}MB uses {:.1f}ms".format(vm.name, origin_size, requested_size,
+                                                                    use_time))
+    return use_time
+
+
+async def run_job(job):
+    try:
+        if job.kind == 'balloon':
+            use_time = await change_balloon(job.vm, job.target, job)
+        else:
+            use_time = await change_virtio_mem(job.vm, job.target, job)
+        job.update(state='done', use_time=use_time)
+    except Exception as e:
+        job.update(state='failed', error=repr(e))
+
+
+def submit_job(vm, kind, target):
+    job = Job(vm, kind, target)
+    jobs[job.job_id] = job
+    while len(jobs) > JOBS_KEEP:
+        jobs.popitem(last=False)
+    asyncio.run_coroutine_threadsafe(run_job(job), loop)
+    return job
 
 
 app = Flask(__name__)
@@ -92,41 +257,120 @@ def hello_world():
 
 @app.route('/change_balloon_to')
 def change_to():
-    start_time = time.time()
-    asyncio.run(change_balloon(target=int(request.args.get('value'))))
-    use_time = (time.time() - start_time) * 1000
-    print("change_to req use {:.1f}ms".format(use_time))
-    return json.dumps({'use_time': use_time})
+    start_time = time.perf_counter()
+    use_time = run(change_balloon(vms['default'], target=int(request.args.get('value'))))
+    req_time = (time.perf_counter() - start_time) * 1000
+    print("change_to req use {:.1f}ms".format(req_time))
+    return json.dumps({'use_time': use_time, 'req_time': req_time})
 
 
 @app.route('/current_balloon_size')
 def current_size():
-    start_time = time.time()
-    current = asyncio.run(current_balloon_size())
-    use_time = (time.time() - start_time) * 1000
+    start_time = time.perf_counter()
+    current = run(current_balloon_size(vms['default']))
+    use_time = (time.perf_counter() - start_time) * 1000
     print("current_size req use {:.1f}ms".format(use_time))
     return json.dumps({'current_size': current, 'use_time': use_time})
 
 
 @app.route('/current_virtio_mem_size')
 def current_virtio_size():
-    start_time = time.time()
-    current = asyncio.run(current_virtio_mem_size())
-    use_time = (time.time() - start_time) * 1000
+    start_time = time.perf_counter()
+    current = run(current_virtio_mem_size(vms['default']))
+    use_time = (time.perf_counter() - start_time) * 1000
     print("current_virtio_mem_size req use {:.1f}ms".format(use_time))
-    return json.dumps({'block_size': "{}MB".format(asyncio.run(current_virtio_mem_block_size()) / 1024 / 1024),
+    return json.dumps({'block_size': "{}MB".format(run(current_virtio_mem_block_size(vms['default'])) / 1024 / 1024),
                        'size': "{}MB".format(current / 1024 / 1024),
                        'use_time': use_time})
 
 
 @app.route('/change_virtio_mem_to')
 def change_virtio_to():
-    start_time = time.time()
+    start_time = time.perf_counter()
     value = int(request.args.get('value'))
-    asyncio.run(change_virtio_mem(requested_size=value))
-    use_time = (time.time() - start_time) * 1000
-    print("change_virtio_mem_to req use {:.1f}ms".format(use_time))
-    return json.dumps({'use_time': use_time})
+    use_time = run(change_virtio_mem(vms['default'], requested_size=value))
+    req_time = (time.perf_counter() - start_time) * 1000
+    print("change_virtio_mem_to req use {:.1f}ms".format(req_time))
+    return json.dumps({'use_time': use_time, 'req_time': req_time})
+
+
+@app.route('/vms', methods=['GET'])
+def list_vms():
+    return json.dumps([vm.to_dict() for vm in vms.values()])
+
+
+@app.route('/vms', methods=['POST'])
+def add_vm():
+    body = request.json
+    if 'name' not in body or 'qmp_socket' not in body:
+        return json.dumps({'message': 'name and qmp_socket are required'}), 400
+    if body['name'] in vms:
+        return json.dumps({'message': 'vm {} already registered'.format(body['name'])}), 409
+    vm = register_vm(body['name'], body['qmp_socket'], body.get('virtio_mem_id', 'vm0'))
+    return json.dumps(vm.to_dict())
+
+
+@app.route('/vms/<name>', methods=['DELETE'])
+def remove_vm(name):
+    vm = vms.pop(name, None)
+    if vm is None:
+        return json.dumps({'message': 'unknown vm {}'.format(name)}), 404
+    if vm.session.qmp is not None:
+        run(vm.session.qmp.disconnect())
+    return json.dumps(vm.to_dict())
+
+
+@app.route('/vms/<name>/<kind>', methods=['POST'])
+def scale_vm(name, kind):
+    if name not in vms:
+        return json.dumps({'message': 'unknown vm {}'.format(name)}), 404
+    if kind not in ('balloon', 'virtio_mem'):
+        return json.dumps({'message': 'unknown scaling mechanism {}'.format(kind)}), 400
+    job = submit_job(vms[name], kind, int(request.args.get('value')))
+    return json.dumps({'job_id': job.job_id})
+
+
+@app.route('/jobs')
+def list_jobs():
+    return json.dumps([job.to_dict() for job in jobs.values()])
+
+
+@app.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return json.dumps({'message': 'unknown job {}'.format(job_id)}), 404
+    # ?wait=1 blocks until the job is finished
+    if request.args.get('wait'):
+        with job.changed:
+            job.changed.wait_for(job.finished, timeout=SCALE_TIMEOUT_S)
+    return json.dumps(job.to_dict())
+
+
+@app.route('/jobs/<int:job_id>/stream')
+def stream_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return json.dumps({'message': 'unknown job {}'.format(job_id)}), 404
+
+    def generate():
+        # one json line per progress update, the last line is the finished job; a slow reader skips the updates
+        # dropped before it got them
+        sent = 0
+        while True:
+            with job.changed:
+                job.changed.wait_for(lambda: job.finished() or job.reports > sent, timeout=SCALE_TIMEOUT_S)
+                new = min(job.reports - sent, len(job.progress))
+                progress = job.progress[len(job.progress) - new:]
+                sent = job.reports
+                finished = job.finished()
+            for p in progress:
+                yield json.dumps({'job_id': job.job_id, 'progress': p}) + '\n'
+            if finished:
+                yield json.dumps(job.to_dict()) + '\n'
+                return
+
+    return Response(generate(), mimetype='application/x-ndjson')
 
 
 async def test():
@@ -138,15 +382,14 @@ async def test():
     # block - size: 2097152
     # memdev: / objects / vmem0
 
-    qmp = QMPClient('my-vm-nickname')
-    await qmp.connect('/tmp/qmp.sock')
-    memaddr = await qmp.execute('qom-get', {"path": "vm0", "property": "memaddr"})
-    size = await qmp.execute('qom-get', {"path": "vm0", "property": "size"})
+    session = vms['default'].session
+    memaddr = await session.execute('qom-get', {"path": "vm0", "property": "memaddr"})
+    size = await session.execute('qom-get', {"path": "vm0", "property": "size"})
     print(hex(memaddr))
     print(type(size))
 
 
 if __name__ == "__main__":
-    # asyncio.run(test())
-    # print(asyncio.run(current_virtio_mem_size()))
+    # run(test())
+    # print(run(current_virtio_mem_size(vms['default'])))
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8081)))
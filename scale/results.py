@@ -0,0 +1,135 @@
+import csv
+import json
+import math
+import os
+import statistics
+
+MECHANISMS = ["qemu-balloon", "qemu-virtio_mem", "firecracker-balloon", "firecracker-faascale"]
+
+# two-sided 95% t critical values, larger samples use the normal approximation
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+
+def sample(setting: str, direction: str, size: int, boot: int, rep: int, use_time: float, **extra):
+    # one measurement, `direction` is seen from the guest: "up" gives it memory, "down" takes memory away
+    return dict(setting=setting, direction=direction, size=size, boot=boot, rep=rep, use_time=use_time, **extra)
+
+
+def percentile(sorted_values: list, p: float):
+    # linear interpolation between the closest ranks, same as numpy's default
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    k = (len(sorted_values) - 1) * p / 100
+    f = math.floor(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+def t_critical(df: int):
+    if df > 30:
+        return 1.96
+    return T_95[max(k for k in T_95 if k <= df)]
+
+
+def summarize(values: list):
+    values = sorted(values)
+    n = len(values)
+    mean = statistics.fmean(values)
+    stdev = statistics.stdev(values) if n > 1 else 0.0
+    half = t_critical(n - 1) * stdev / math.sqrt(n) if n > 1 else 0.0
+    # distribution-free 95% CI of the median from the binomial order statistics
+    lo = max(0, math.floor(n / 2 - 0.98 * math.sqrt(n)))
+    hi = min(n - 1, math.ceil(n / 2 + 0.98 * math.sqrt(n)))
+    return {
+        "n": n, "mean": mean, "stdev": stdev,
+        "mean_ci95_low": mean - half, "mean_ci95_high": mean + half,
+        "min": values[0], "p50": percentile(values, 50), "p90": percentile(values, 90),
+        "p99": percentile(values, 99), "max": values[-1],
+        "p50_ci95_low": values[lo], "p50_ci95_high": values[hi],
+    }
+
+
+def summarize_samples(samples: list):
+    groups = {}
+    for s in samples:
+        groups.setdefault((s["setting"], s["direction"], s["size"]), []).append(s["use_time"])
+    summary = []
+    for (setting, direction, size), values in sorted(groups.items()):
+        summary.append(dict(setting=setting, direction=direction, size=size, **summarize(values)))
+    return summary
+
+
+def reclaim_summary(samples: list):
+    # guest-side latency next to the time until the host got the memory back and how much it got, for the samples
+    # measured with host_reclaim
+    groups = {}
+    for s in samples:
+        if "host_returned_mb" in s:
+            groups.setdefault((s["setting"], s["size"]), []).append(s)
+    rows = []
+    for (setting, size), group in sorted(groups.items()):
+        row = dict(setting=setting, size=size, n=len(group))
+        for key in ["use_time", "time_to_host_reclaim", "host_returned_mb", "pss_returned_mb", "huge_returned_mb",
+                    "swap_change_mb"]:
+            values = sorted(s[key] for s in group)
+            row[key + "_p50"] = percentile(values, 50)
+            row[key + "_p99"] = percentile(values, 99)
+        rows.append(row)
+    return rows
+
+
+def write_csv(rows: list, path: str):
+    if not rows:
+        return
+    # rows may carry different extra fields
+    fieldnames = list(dict.fromkeys(k for row in rows for k in row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def comparison_report(summary: list):
+    # one table per direction (or measured phase), a row per size, a column per mechanism: p50 [p90, p99] and the
+    # p50 ratio to faascale
+    by_key = {(s["setting"], s["direction"], s["size"]): s for s in summary}
+    settings = [m for m in MECHANISMS if any(s["setting"] == m for s in summary)]
+    settings += sorted({s["setting"] for s in summary} - set(settings))
+    lines = []
+    directions = ["up", "down"] + sorted({s["direction"] for s in summary} - {"up", "down"})
+    for direction in directions:
+        sizes = sorted({s["size"] for s in summary if s["direction"] == direction})
+        if not sizes:
+            continue
+        lines.append("{} (ms, p50 [p90 p99] x faascale p50)".format(
+            "scale " + direction if direction in ("up", "down") else direction))
+        lines.append("{:>8}".format("size") + "".join("{:>36}".format(m) for m in settings))
+        for size in sizes:
+            base = by_key.get(("firecracker-faascale", direction, size))
+            row = "{:>6}MB".format(size)
+            for m in settings:
+                s = by_key.get((m, direction, size))
+                if s is None:
+                    row += "{:>36}".format("-")
+                    continue
+                cell = "{:.1f} [{:.1f} {:.1f}]".format(s["p50"], s["p90"], s["p99"])
+                if base is not None and base["p50"] > 0:
+                    cell += " x{:.1f}".format(s["p50"] / base["p50"])
+                row += "{:>36}".format(cell)
+            lines.append(row)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_results(samples: list, result_dir: str):
+    os.makedirs(result_dir, exist_ok=True)
+    summary = summarize_samples(samples)
+    write_csv(samples, os.path.join(result_dir, "samples.csv"))
+    write_csv(summary, os.path.join(result_dir, "summary.csv"))
+    with open(os.path.join(result_dir, "results.json"), 'w') as f:
+        json.dump({"samples": samples, "summary": summary}, f, indent=2)
+    report = comparison_report(summary)
+    with open(os.path.join(result_dir, "report.txt"), 'w') as f:
+        f.write(report)
+    return summary, report
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# a stand-in for the Firecracker API socket: takes the same arguments as firecracker, serves /balloon,
+# /balloon/statistics and /machine-config, and inflates or deflates the balloon following the latency model
+import argparse
+import json
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+
+from latency import LatencyModel, Ramp
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency-model.json")
+
+
+class VM:
+
+    def __init__(self, config: dict, model: LatencyModel):
+        self.model = model
+        self.machine_config = config["machine-config"]
+        self.balloon_config = config.get("balloon")
+        amount = self.balloon_config["amount_mib"] if self.balloon_config else 0
+        self.balloon = Ramp(amount)
+        self.lock = threading.Lock()
+
+    def patch_balloon(self, amount_mib: int):
+        with self.lock:
+            actual = self.balloon.value()
+            # inflating the balloon takes memory from the guest
+            direction = "down" if amount_mib > actual else "up"
+            duration = self.model.duration("firecracker-balloon", direction, abs(amount_mib - actual))
+            self.balloon.move(amount_mib, duration)
+            self.balloon_config["amount_mib"] = amount_mib
+
+    def statistics(self):
+        actual = self.balloon.value()
+        total = self.machine_config["mem_size_mib"] * 1024 * 1024
+        return {"target_pages": self.balloon.target * 256, "actual_pages": actual * 256,
+                "target_mib": self.balloon.target, "actual_mib": actual,
+                "total_memory": total, "free_memory": total - actual * 1024 * 1024}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    vm = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def fault(self, message: str):
+        self.reply(400, {"fault_message": message})
+
+    def body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        balloon = self.vm.balloon_config
+        if self.path == "/machine-config":
+            self.reply(200, self.vm.machine_config)
+        elif self.path == "/balloon" and balloon:
+            self.reply(200, balloon)
+        elif self.path == "/balloon/statistics" and balloon:
+            if not balloon["stats_polling_interval_s"]:
+                return self.fault("Statistics for the balloon device are not enabled")
+            self.reply(200, self.vm.statistics())
+        elif self.path.startswith("/balloon"):
+            self.fault("No balloon device found")
+        else:
+            self.fault("Invalid request method and/or path: GET {}".format(self.path))
+
+    def do_PATCH(self):
+        body = self.body()
+        balloon = self.vm.balloon_config
+        if not balloon:
+            return self.fault("No balloon device found")
+        if self.path == "/balloon":
+            if body["amount_mib"] > self.vm.machine_config["mem_size_mib"]:
+                return self.fault("Amount of pages requested is too large")
+            self.vm.patch_balloon(body["amount_mib"])
+            self.reply(204)
+        elif self.path == "/balloon/statistics":
+            if not balloon["stats_polling_interval_s"] or not body["stats_polling_interval_s"]:
+                # like firecracker, statistics can not be turned on or off after boot
+                return self.fault("Cannot enable or disable the statistics after boot")
+            balloon["stats_polling_interval_s"] = body["stats_polling_interval_s"]
+            self.reply(204)
+        else:
+            self.fault("Invalid request method and/or path: PATCH {}".format(self.path))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--api-sock", required=True)
+    parser.add_argument("--config-file", required=True)
+    parser.add_argument("--log-path")
+    parser.add_argument("--model", default=MODEL_FILE)
+    args = parser.parse_args()
+
+    with open(args.config_file) as f:
+        config = json.load(f)
+    Handler.vm = VM(config, LatencyModel(args.model))
+    if os.path.exists(args.api_sock):
+        os.remove(args.api_sock)
+    with Server(args.api_sock, Handler) as server:
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import json
+import math
+import random
+import statistics
+import sys
+import time
+
+# a scaling of `size` MB takes (base_ms + ms_per_mb * size) * lognormal(0, sigma), the memory moves linearly over it
+DEFAULT_MODEL = {"base_ms": 1.0, "ms_per_mb": 0.1, "sigma": 0.1}
+
+
+class LatencyModel:
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            model = json.load(f)
+        self.mechanisms = model["mechanisms"]
+        self.qemu_event_interval_ms = model.get("qemu_event_interval_ms", 1000)
+        self.random = random.Random(model.get("seed"))
+
+    def duration(self, setting: str, direction: str, size_mib: float):
+        # seconds a scaling of size_mib takes, `direction` is seen from the guest
+        m = self.mechanisms.get(setting, {}).get(direction, DEFAULT_MODEL)
+        ms = (m["base_ms"] + m["ms_per_mb"] * size_mib) * self.random.lognormvariate(0, m["sigma"])
+        return ms / 1000
+
+
+class Ramp:
+    # the memory moving from `origin` to `target` over `duration` seconds, in steps of `step`
+
+    def __init__(self, value: int, step: int = 1):
+        self.origin = self.target = value
+        self.step = step
+        self.start = 0
+        self.duration = 0
+
+    def value(self):
+        if self.duration <= 0:
+            return self.target
+        done = min(1.0, (time.perf_counter() - self.start) / self.duration)
+        steps = int((self.target - self.origin) * done / self.step)
+        return self.origin + steps * self.step
+
+    def move(self, target: int, duration: float):
+        self.origin = self.value()
+        self.target = target
+        self.start = time.perf_counter()
+        self.duration = duration
+
+    def finished(self):
+        return self.value() == self.target
+
+
+def fit_one(points: list):
+    # least squares use_time = base_ms + ms_per_mb * size, sigma of the log residuals
+    sizes = [x for x, _ in points]
+    times = [y for _, y in points]
+    if len(set(sizes)) > 1:
+        slope = statistics.covariance(sizes, times) / statistics.variance(sizes)
+        base = statistics.fmean(times) - slope * statistics.fmean(sizes)
+    else:
+        slope, base = 0.0, statistics.fmean(times)
+    if base < 0:
+        base = 0.0
+        slope = sum(x * y for x, y in points) / sum(x * x for x in sizes)
+    residuals = [math.log(y / (base + slope * x)) for x, y in points if y > 0 and base + slope * x > 0]
+    sigma = statistics.stdev(residuals) if len(residuals) > 1 else 0.0
+    return {"base_ms": base, "ms_per_mb": slope, "sigma": sigma}
+
+
+def fit(samples: list):
+    # a model per setting and direction from the samples of scale/results.py
+    groups = {}
+    for s in samples:
+        if s["direction"] in ("up", "down"):
+            groups.setdefault(s["setting"], {}).setdefault(s["direction"], []).append((s["size"], s["use_time"]))
+    return {setting: {direction: fit_one(points) for direction, points in directions.items()}
+            for setting, directions in groups.items()}
+
+
+def main(results_file: str, model_file: str):
+    # fits the model to a results.json of test.py and updates model_file with it
+    with open(results_file) as f:
+        samples = json.load(f)["samples"]
+    try:
+        with open(model_file) as f:
+            model = json.load(f)
+    except FileNotFoundError:
+        model = {"seed": None, "qemu_event_interval_ms": 1000, "mechanisms": {}}
+    model["mechanisms"].update(fit(samples))
+    with open(model_file, 'w') as f:
+        json.dump(model, f, indent=2)
+    for setting, directions in sorted(model["mechanisms"].items()):
+        for direction, m in sorted(directions.items()):
+            print("{:>24} {:>5}: {:.2f}ms + {:.4f}ms/MB, sigma {:.2f}".format(
+                setting, direction, m["base_ms"], m["ms_per_mb"], m["sigma"]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: %s <results.json> <latency-model.json>" % sys.argv[0])
+        exit(1)
+    main(sys.argv[1], sys.argv[2])
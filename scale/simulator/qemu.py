@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# a stand-in for qemu's QMP socket: takes the qemu arguments of scale/test.py, implements balloon, query-balloon and
+# qom-get/qom-set of the virtio-mem device following the latency model, and emits BALLOON_CHANGE and
+# MEMORY_DEVICE_SIZE_CHANGE throttled like qemu does
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from latency import LatencyModel, Ramp
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency-model.json")
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+PAGE_SIZE = 4096
+VIRTIO_MEM_ADDR = 0x140000000
+
+
+def parse_size(value: str, unit: int = 1):
+    # "2M", "8G" or a plain number of `unit`
+    if value[-1].upper() in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1].upper()])
+    return int(value) * unit
+
+
+def parse_options(value: str):
+    # "virtio-mem-pci,id=vm0,block-size=2M" -> ("virtio-mem-pci", {"id": "vm0", "block-size": "2M"})
+    name, *options = value.split(",")
+    return name, dict(option.split("=", 1) for option in options if "=" in option)
+
+
+def parse_qemu_args(args: list):
+    machine = {"qmp": None, "ram_size": 128 << 20, "balloon": False, "virtio_mem": None}
+    backends = {}
+    for option, value in zip(args, args[1:]):
+        if option == "-qmp":
+            machine["qmp"] = value.split(",")[0][len("unix:"):]
+        elif option == "-m":
+            machine["ram_size"] = parse_size(value.split(",")[0], 1 << 20)
+        elif option == "-object":
+            _, properties = parse_options(value)
+            backends[properties["id"]] = parse_size(properties["size"])
+        elif option == "-device":
+            driver, properties = parse_options(value)
+            if driver.startswith("virtio-balloon"):
+                machine["balloon"] = True
+            elif driver.startswith("virtio-mem"):
+                machine["virtio_mem"] = properties
+    if machine["virtio_mem"] is not None:
+        properties = machine["virtio_mem"]
+        machine["virtio_mem"] = {"id": properties["id"], "memdev": properties["memdev"],
+                                 "block-size": parse_size(properties.get("block-size", "2M")),
+                                 "max-size": backends[properties["memdev"]]}
+    return machine
+
+
+class QMPError(Exception):
+
+    def __init__(self, class_: str, desc: str):
+        super().__init__(desc)
+        self.error = {"class": class_, "desc": desc}
+
+
+class Machine:
+
+    def __init__(self, config: dict, model: LatencyModel):
+        self.config = config
+        self.model = model
+        self.balloon = Ramp(config["ram_size"], PAGE_SIZE) if config["balloon"] else None
+        self.virtio_mem = config["virtio_mem"]
+        self.plugged = Ramp(0, self.virtio_mem["block-size"]) if self.virtio_mem else None
+        self.clients = []
+
+    def event(self, name: str, data: dict):
+        now = time.time()
+        message = {"event": name, "data": data,
+                   "timestamp": {"seconds": int(now), "microseconds": int(now % 1 * 1000000)}}
+        for writer in self.clients:
+            writer.write(json.dumps(message).encode() + b"\r\n")
+
+    async def emit_events(self):
+        # qemu sends the first change at once and then at most one event (with the latest value) per interval
+        interval = self.model.qemu_event_interval_ms / 1000
+        sources = []
+        if self.balloon:
+            sources.append(("BALLOON_CHANGE", self.balloon, lambda v: {"actual": v}))
+        if self.plugged:
+            id_ = self.virtio_mem["id"]
+            sources.append(("MEMORY_DEVICE_SIZE_CHANGE", self.plugged,
+                            lambda v: {"id": id_, "size": v, "qom-path": "/machine/peripheral/" + id_}))
+        emitted = {name: (ramp.value(), 0) for name, ramp, _ in sources}
+        while True:
+            now = time.perf_counter()
+            for name, ramp, data in sources:
+                value = ramp.value()
+                last, at = emitted[name]
+                if value != last and now - at >= interval:
+                    self.event(name, data(value))
+                    emitted[name] = (value, now)
+            await asyncio.sleep(0.001)
+
+    def device(self, path: str):
+        if self.virtio_mem is None or path.split("/")[-1] != self.virtio_mem["id"]:
+            raise QMPError("DeviceNotFound", "Device '{}' not found".format(path))
+
+    def execute(self, command: str, arguments: dict):
+        if command == "qmp_capabilities":
+            return {}
+        if command == "query-status":
+            return {"running": True, "singlestep": False, "status": "running"}
+        if command in ("balloon", "query-balloon") and self.balloon is None:
+            raise QMPError("DeviceNotActive", "No balloon device has been activated")
+        if command == "query-balloon":
+            return {"actual": self.balloon.value()}
+        if command == "balloon":
+            value = min(arguments["value"], self.config["ram_size"]) // PAGE_SIZE * PAGE_SIZE
+            actual = self.balloon.value()
+            # a smaller target inflates the balloon and takes memory from the guest
+            direction = "down" if value < actual else "up"
+            self.balloon.move(value, self.model.duration("qemu-balloon", direction, abs(value - actual) / (1 << 20)))
+            return {}
+        if command == "qom-get":
+            self.device(arguments["path"])
+            values = {"size": self.plugged.value(), "requested-size": self.plugged.target,
+                      "block-size": self.virtio_mem["block-size"], "max-size": self.virtio_mem["max-size"],
+                      "memaddr": VIRTIO_MEM_ADDR, "node": 0, "memdev": "/objects/" + self.virtio_mem["memdev"]}
+            if arguments["property"] not in values:
+                raise QMPError("GenericError", "Property '{}' not found".format(arguments["property"]))
+            return values[arguments["property"]]
+        if command == "qom-set":
+            self.device(arguments["path"])
+            if arguments["property"] != "requested-size":
+                raise QMPError("GenericError", "Property '{}' can not be set".format(arguments["property"]))
+            value = arguments["value"]
+            if value % self.virtio_mem["block-size"] or value > self.virtio_mem["max-size"]:
+                raise QMPError("GenericError", "'requested-size' must be a multiple of 'block-size' and not "
+                                               "exceed 'max-size'")
+            size = self.plugged.value()
+            direction = "up" if value > size else "down"
+            self.plugged.move(value, self.model.duration("qemu-virtio_mem", direction, abs(value - size) / (1 << 20)))
+            return {}
+        raise QMPError("CommandNotFound", "The command {} has not been found".format(command))
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        greeting = {"QMP": {"version": {"qemu": {"micro": 0, "minor": 2, "major": 8}, "package": "simulator"},
+                            "capabilities": []}}
+        writer.write(json.dumps(greeting).encode() + b"\r\n")
+        decoder = json.JSONDecoder()
+        buffer = ""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                buffer += data.decode()
+                # qmp clients do not have to end a message with a newline
+                while buffer.strip():
+                    try:
+                        message, end = decoder.raw_decode(buffer.lstrip())
+                    except json.JSONDecodeError:
+                        break
+                    buffer = buffer.lstrip()[end:]
+                    writer.write(json.dumps(self.reply(message, writer)).encode() + b"\r\n")
+                await writer.drain()
+        finally:
+            if writer in self.clients:
+                self.clients.remove(writer)
+            writer.close()
+
+    def reply(self, message: dict, writer: asyncio.StreamWriter):
+        try:
+            reply = {"return": self.execute(message["execute"], message.get("arguments", {}))}
+            if message["execute"] == "qmp_capabilities" and writer not in self.clients:
+                # events are only sent after the capabilities negotiation
+                self.clients.append(writer)
+        except QMPError as e:
+            reply = {"error": e.error}
+        if "id" in message:
+            reply["id"] = message["id"]
+        return reply
+
+
+async def serve(machine: Machine):
+    path = machine.config["qmp"]
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(machine.serve, path)
+    async with server:
+        await asyncio.gather(server.serve_forever(), machine.emit_events())
+
+
+def main():
+    # everything but --model is a qemu argument
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--model", default=MODEL_FILE)
+    args, qemu_args = parser.parse_known_args()
+    machine = Machine(parse_qemu_args(qemu_args), LatencyModel(args.model))
+    asyncio.run(serve(machine))
+
+
+if __name__ == '__main__':
+    main()
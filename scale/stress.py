@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import requests
+
+from firecracker_api import FirecrackerAPI
+from host_monitor import HostMonitor
+from results import sample, write_csv, write_results
+from test import (firecracker_socket, guest_addr, root, start_firecracker, start_qemu, start_qemu_api_server,
+                  stop_vmm)
+
+QEMU_API = "http://localhost:8081"
+
+
+def qmp_socket(idx: int):
+    return "/tmp/qmp-{}.sock".format(idx)
+
+
+def firecracker_balloon_cycle(params, k: int):
+    apis = {idx: FirecrackerAPI(firecracker_socket(params, idx)) for idx in range(1, k + 1)}
+
+    def cycle(idx, size):
+        down = apis[idx].scale_balloon(size)
+        up = apis[idx].scale_balloon(0)
+        return up, down
+
+    def close():
+        for api in apis.values():
+            api.close()
+
+    return cycle, close
+
+
+def firecracker_faascale_cycle(params, k: int):
+    sessions = {idx: requests.Session() for idx in range(1, k + 1)}
+
+    def cycle(idx, size):
+        results = sessions[idx].get(f"http://{guest_addr(idx)}:5000/?size={size}&repeat=1").json()
+        return results['samples']['size'][0], results['samples']['free'][0]
+
+    def close():
+        for session in sessions.values():
+            session.close()
+
+    return cycle, close
+
+
+def qemu_cycle(params, type_: str):
+    # balloon inflates `size` out of the VM memory and deflates back, virtio-mem plugs `size` and unplugs it
+    max_size = 0 if type_ == "virtio_mem" else params.qemu_config.mem_size_mib
+    session = requests.Session()
+
+    def scale(idx, value):
+        job_id = session.post(f"{QEMU_API}/vms/vm{idx}/{type_}?value={value}").json()['job_id']
+        job = session.get(f"{QEMU_API}/jobs/{job_id}?wait=1").json()
+        if job['state'] != 'done':
+            raise RuntimeError("qemu scaling job failed: {}".format(job['error']))
+        return job['use_time']
+
+    def cycle(idx, size):
+        first = scale(idx, abs(size - max_size))
+        second = scale(idx, max_size)
+        return (first, second) if type_ == "virtio_mem" else (second, first)
+
+    return cycle, session.close
+
+
+def boot_vms(params, setting: str, k: int):
+    stop_vmm()
+    if setting.startswith("firecracker"):
+        type_ = setting[12:]
+        pipes = [start_firecracker(params, type_, idx, params.stress.vm_mem) for idx in range(1, k + 1)]
+        time.sleep(5)
+        for idx in range(1, k + 1):
+            subprocess.run(root(params) + ["chmod", "777", firecracker_socket(params, idx)])
+        time.sleep(1)
+        if type_ == "faascale":
+            return pipes, firecracker_faascale_cycle(params, k)
+        return pipes, firecracker_balloon_cycle(params, k)
+
+    type_ = setting[5:]
+    pipes = [start_qemu(params, type_, qmp_socket(idx), "{}-{}".format(type_, idx)) for idx in range(1, k + 1)]
+    time.sleep(5)
+    start_qemu_api_server(params, type_)
+    for idx in range(1, k + 1):
+        requests.post(f"{QEMU_API}/vms", json={"name": "vm{}".format(idx), "qmp_socket": qmp_socket(idx)})
+    return pipes, qemu_cycle(params, type_)
+
+
+def storm(cycle, k: int, size: int, staggered: bool, stagger_ms: float):
+    # all k VMs scale up and down at once (or one stagger_ms after the other), returns per VM results
+    barrier = threading.Barrier(k)
+    results = [None] * k
+
+    def worker(i):
+        barrier.wait()
+        if staggered:
+            time.sleep(i * stagger_ms / 1000)
+        start = time.perf_counter()
+        up, down = cycle(i + 1, size)
+        results[i] = (up, down, start, time.perf_counter())
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(k)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run_stress(params, setting: str, k: int, result_dir: str):
+    stress = params.stress
+    staggered = stress.mode == "staggered"
+    pipes, (cycle, close) = boot_vms(params, setting, k)
+
+    samples, throughput = [], []
+    monitor = HostMonitor(stress.monitor_interval_ms)
+    monitor.start()
+    for r in range(-stress.warmup, stress.rounds):
+        results = storm(cycle, k, stress.size, staggered, stress.stagger_ms)
+        if r < 0:
+            continue
+        wall_time = max(end for _, _, _, end in results) - min(start for _, _, start, _ in results)
+        # every VM plugs and reclaims `size`
+        gb_s = 2 * k * stress.size / 1024 / wall_time
+        throughput.append({"setting": setting, "vms": k, "size": stress.size, "round": r,
+                           "wall_time": wall_time * 1000, "gb_s": gb_s})
+        for vm, (up, down, _, _) in enumerate(results):
+            samples.append(sample("{}-k{}".format(setting, k), "up", stress.size, 0, r, up, vm=vm + 1))
+            samples.append(sample("{}-k{}".format(setting, k), "down", stress.size, 0, r, down, vm=vm + 1))
+        print("{} {} VMs round {}: {:.1f}ms, {:.2f}GB/s".format(setting, k, r, wall_time * 1000, gb_s))
+    write_csv(monitor.stop(), os.path.join(result_dir, "host-{}-k{}.csv".format(setting, k)))
+
+    close()
+    stop_vmm()
+    for pipe in pipes:
+        pipe.wait()
+    return samples, throughput
+
+
+def main(config_file):
+    with open(config_file, 'r') as f:
+        params = json.load(f, object_hook=lambda d: SimpleNamespace(**d))
+
+    subprocess.run(" ".join(root(params) + ["rm", "-rf", "logs/*"]), shell=True, cwd=params.home_dir)
+    result_dir = os.path.join(params.home_dir, params.result_dir, "stress-" + time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(result_dir)
+
+    samples, throughput = [], []
+    for setting in params.stress.settings:
+        for k in params.stress.vms:
+            print("\n=========%s stress: %d VMs=========\n" % (setting, k))
+            s, t = run_stress(params, setting, k, result_dir)
+            samples += s
+            throughput += t
+
+    write_csv(throughput, os.path.join(result_dir, "throughput.csv"))
+    _, report = write_results(samples, result_dir)
+    print("\n" + report)
+    print("scaling throughput (GB/s, median of rounds)")
+    print("{:>6}".format("VMs") + "".join("{:>24}".format(s) for s in params.stress.settings))
+    for k in params.stress.vms:
+        row = "{:>6}".format(k)
+        for setting in params.stress.settings:
+            values = [t["gb_s"] for t in throughput if t["setting"] == setting and t["vms"] == k]
+            row += "{:>24}".format("{:.2f}".format(statistics.median(values)) if values else "-")
+        print(row)
+    print("results are written to", result_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: %s <test-scale.json>" % sys.argv[0])
+        exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print("File not found:", sys.argv[1])
+        exit(1)
+    main(sys.argv[1])
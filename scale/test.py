@@ -1,66 +1,125 @@
 #!/usr/bin/env python3
+import copy
+import itertools
 import json
 import os
+import statistics
 import subprocess
 import sys
 import time
 from types import SimpleNamespace
 
 import requests
-import httpx
-
-
-def test_balloon(sizes: list, socket_location: str):
-    for size_ in sizes:
-        for size in [size_, 0]:
-            start = time.time()
-            # curl --unix-socket $socket_location -i \
-            #     -X PATCH 'http://localhost/balloon' \
-            #     -H 'Accept: application/json' \
-            #     -H 'Content-Type: application/json' \
-            #     -d "{
-            #         \"amount_mib\": $amount_mib, \
-            #         \"stats_polling_interval_s\": $polling_interval \
-            #     }"
-
-            client = httpx.Client(transport=httpx.HTTPTransport(uds=socket_location))
-            headers = {
-                'Accept': 'application/json',
-                'Content-Type': 'application/json'
-            }
-            data = {
-                "amount_mib": size,
-            }
-            resp = client.patch("http://localhost/balloon", headers=headers, json=data)
-            if resp.status_code != 204:
-                raise "balloon statistics error: " + resp.text
 
-            # curl --unix-socket $socket_location -i \
-            #     -X GET 'http://localhost/balloon/statistics' \
-            #     -H 'Accept: application/json'
+from firecracker_api import FirecrackerAPI
+from host_monitor import ReclaimMonitor, find_pid, reclaim_stats
+from results import reclaim_summary, sample, summarize_samples, write_csv, write_results
 
-            headers = {
-                'Accept': 'application/json'
-            }
-            for i in range(1000):
-                resp = client.get("http://localhost/balloon/statistics", headers=headers)
-                if resp.status_code != 200:
-                    raise "balloon statistics error: " + resp.text
-                result = resp.json()
-                if result["target_mib"] != size or result["actual_mib"] != size:
-                    time.sleep(0.01)
+SIMULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator")
+
+
+def root(params):
+    # the simulated VMMs run as the current user, no sudo needed
+    return [] if params.simulate.enabled else ["sudo"]
+
+
+def vmm_command(params, vmm: str):
+    # the command running firecracker or qemu, or the simulator taking the same arguments
+    if params.simulate.enabled:
+        return [sys.executable, os.path.join(SIMULATOR_DIR, vmm + ".py"), "--model", params.simulate.model]
+    return ["sudo", getattr(params.executables, vmm)]
+
+
+def reclaim_measurer(params, executable: str, marker: str):
+    # with host_reclaim enabled, returns measure(scale_down) which runs scale_down() while sampling the VMM
+    # process, and returns its result together with what the host got back
+    if not params.host_reclaim.enabled or params.simulate.enabled:
+        return None
+    pid = find_pid(os.path.basename(executable), marker)
+    if pid is None:
+        raise RuntimeError("no {} process running with {}".format(executable, marker))
+
+    def measure(scale_down):
+        monitor = ReclaimMonitor(pid, params.host_reclaim.interval_ms)
+        monitor.start()
+        result = scale_down()
+        samples = monitor.wait_stable(params.host_reclaim.stable_ms, params.host_reclaim.timeout_ms)
+        return result, reclaim_stats(samples)
+
+    return measure
+
+
+def touch_guest(guest_url: str, size: int):
+    # the guest touches and frees `size`, so that the host has it backed before it is taken away
+    requests.get(f"{guest_url}/touch?size={size}&pattern=sequential")
+
+
+def test_balloon(sizes: list, socket_location: str, boot: int, warmup: int, repetitions: int, reclaim=None):
+    samples = []
+    with FirecrackerAPI(socket_location) as api:
+        for size in sizes:
+            for rep in range(-warmup, repetitions):
+                # inflating the balloon takes memory from the guest
+                if reclaim:
+                    touch_guest(f"http://{guest_addr(1)}:5000", size)
+                    down, returned = reclaim(lambda: api.scale_balloon(size))
                 else:
-                    print("Firecracker-balloon scale {} {}MB use {:.1f}ms".format("down" if size == 0 else "up", size_,
-                                                                                  (time.time() - start) * 1000))
-                    break
+                    down, returned = api.scale_balloon(size), {}
+                up = api.scale_balloon(0)
+                if rep < 0:
+                    continue
+                samples.append(sample("firecracker-balloon", "down", size, boot, rep, down, **returned))
+                samples.append(sample("firecracker-balloon", "up", size, boot, rep, up))
+                print("Firecracker-balloon scale down {}MB use {:.1f}ms".format(size, down))
+                print("Firecracker-balloon scale up {}MB use {:.1f}ms".format(size, up))
+    return samples
+
+
+def test_faascale_reclaim(size: int, boot: int, warmup: int, repetitions: int, reclaim):
+    # one scale up, touch and free per request, so that every free is sampled on the host on its own
+    samples = []
+    url = f"http://{guest_addr(1)}:5000/?size={size}&repeat=1&touch=1&pattern=sequential"
+    for rep in range(-warmup, repetitions):
+        results, returned = reclaim(lambda: requests.get(url).json()['samples'])
+        if rep < 0:
+            continue
+        samples.append(sample("firecracker-faascale", "up", size, boot, rep, results['size'][0]))
+        samples.append(sample("firecracker-faascale", "down", size, boot, rep, results['free'][0], **returned))
+        print("Firecracker-faascale scale down {}MB use {:.1f}ms, host got {:.0f}MB back after {:.1f}ms".format(
+            size, results['free'][0], returned['host_returned_mb'], returned['time_to_host_reclaim']))
+    return samples
 
 
-def test_faaascale(sizes: list, socket_location: str):
+def test_faaascale(sizes: list, boot: int, warmup: int, repetitions: int, concurrency: list, reclaim=None):
+    samples = []
     for size in sizes:
-        url = f"http://192.168.0.3:5000/?size={size}"
+        if reclaim:
+            samples += test_faascale_reclaim(size, boot, warmup, repetitions, reclaim)
+            continue
+        url = f"http://{guest_addr(1)}:5000/?size={size}&repeat={repetitions}&warmup={warmup}"
         results = requests.get(url).json()
-        print("Firecracker-faascale scale {} {}MB use {:.1f}ms".format("up", size, results['scale_up_uses']))
-        print("Firecracker-faascale scale {} {}MB use {:.1f}ms".format("down", size, results['scale_down_uses']))
+        for rep, (up, down) in enumerate(zip(results['samples']['size'], results['samples']['free'])):
+            samples.append(sample("firecracker-faascale", "up", size, boot, rep, up))
+            samples.append(sample("firecracker-faascale", "down", size, boot, rep, down))
+        summary = results['summary']
+        print("Firecracker-faascale scale {} {}MB use {:.1f}ms (p99 {:.1f}ms)".format(
+            "up", size, summary['size']['p50'], summary['size']['p99']))
+        print("Firecracker-faascale scale {} {}MB use {:.1f}ms (p99 {:.1f}ms)".format(
+            "down", size, summary['free']['p50'], summary['free']['p99']))
+
+        # n cgroups scaling at the same time
+        for n in concurrency:
+            url = f"http://{guest_addr(1)}:5000/concurrent?size={size}&n={n}&repeat={repetitions}&warmup={warmup}"
+            results = requests.get(url).json()
+            setting = "firecracker-faascale-x{}".format(n)
+            for worker, result in enumerate(results['workers']):
+                for rep, (up, down) in enumerate(zip(result['samples']['size'], result['samples']['free'])):
+                    samples.append(sample(setting, "up", size, boot, rep, up, worker=worker))
+                    samples.append(sample(setting, "down", size, boot, rep, down, worker=worker))
+            print("Firecracker-faascale {} cgroups scale {}MB: up p50 {:.1f}ms, down p50 {:.1f}ms, {:.0f}MB/s".format(
+                n, size, results['summary']['size']['p50'], results['summary']['free']['p50'],
+                results['throughput_mb_s']))
+    return samples
 
 
 def stop_vmm():
@@ -68,11 +127,20 @@ def stop_vmm():
                    stderr=open("/dev/null", "w"), stdout=open("/dev/null", "w"), shell=True)
     subprocess.run("sudo killall qemu-system-x86_64",
                    stderr=open("/dev/null", "w"), stdout=open("/dev/null", "w"), shell=True)
+    subprocess.run(["pkill", "-f", SIMULATOR_DIR], stderr=open("/dev/null", "w"), stdout=open("/dev/null", "w"))
     time.sleep(1)
 
 
-def run_firecracker(params, sizes: list, type_: str):
-    executer = params.executables.firecracker
+def guest_addr(idx: int):
+    # the address of the guest in namespace fc<idx>, see prepare/network/network.sh
+    return "192.168.0.{}".format(idx + 2)
+
+
+def firecracker_socket(params, idx: int):
+    return os.path.join(params.home_dir, "firecracker-{}.sock".format(idx))
+
+
+def start_firecracker(params, type_: str, idx: int = 1, mem_size_mib: int = None, vcpu_count: int = None):
     if type_ == "balloon":
         kernel = params.kernels.firecracker_balloon
     else:
@@ -92,8 +160,8 @@ def run_firecracker(params, sizes: list, type_: str):
             }
         ],
         "machine-config": {
-            "vcpu_count": 2,
-            "mem_size_mib": 8192,
+            "vcpu_count": vcpu_count or params.firecracker_config.vcpu_count,
+            "mem_size_mib": mem_size_mib or params.firecracker_config.mem_size_mib,
             "track_dirty_pages": False
         },
         "network-interfaces": [
@@ -106,135 +174,316 @@ def run_firecracker(params, sizes: list, type_: str):
     }
 
     if type_ == "faascale":
-        config["faascale-mem"] = {
-            "pre_alloc_mem": False,
-            "pre_tdp_fault": False,
-            "stats_polling_interval_s": 0
-        }
+        config["faascale-mem"] = dict(vars(params.faascale_mem_config))
     else:
-        config["balloon"] = {
-            "amount_mib": 0,
-            "deflate_on_oom": False,
-            "stats_polling_interval_s": 1
-        }
+        config["balloon"] = dict(amount_mib=0, **vars(params.balloon_config))
 
-    with open("firecracker-configs/{}.json".format(type_), 'w') as f:
+    name = "{}-fc{}".format(type_, idx)
+    with open("firecracker-configs/{}.json".format(name), 'w') as f:
         json.dump(config, f)
 
-    stop_vmm()
-    subprocess.run("sudo rm -rf firecracker.sock", cwd=os.path.join(params.home_dir), shell=True)
-    firecracker_pipe = subprocess.Popen(
-        ["sudo", "/bin/ip", "netns", "exec", "fc1", executer, "--api-sock", "firecracker.sock",
-         "--log-path", 'logs/firecracker-{}'.format(type_), "--config-file",
-         "firecracker-configs/{}.json".format(type_)],
-        stdout=open('logs/firecracker-{}'.format(type_), 'a+'),
-        stderr=open('logs/firecracker-{}'.format(type_), 'a+'),
+    socket = firecracker_socket(params, idx)
+    subprocess.run(root(params) + ["rm", "-rf", socket])
+    if params.simulate.enabled:
+        command = vmm_command(params, "firecracker")
+    else:
+        command = ["sudo", "/bin/ip", "netns", "exec", "fc{}".format(idx), params.executables.firecracker]
+    return subprocess.Popen(
+        command + ["--api-sock", socket, "--log-path", 'logs/firecracker-{}'.format(name), "--config-file",
+         "firecracker-configs/{}.json".format(name)],
+        stdout=open('logs/firecracker-{}'.format(name), 'a+'),
+        stderr=open('logs/firecracker-{}'.format(name), 'a+'),
         cwd=os.path.join(params.home_dir))
 
+
+def run_firecracker(params, sizes: list, type_: str, boot: int):
+    stop_vmm()
+    firecracker_pipe = start_firecracker(params, type_)
+
     time.sleep(5)
-    subprocess.run("sudo chmod 777 firecracker.sock", cwd=os.path.join(params.home_dir), shell=True)
+    socket = firecracker_socket(params, 1)
+    subprocess.run(root(params) + ["chmod", "777", socket])
     time.sleep(1)
 
+    reclaim = reclaim_measurer(params, params.executables.firecracker, socket)
     if type_ == "faascale":
-        test_faaascale(sizes, os.path.join(params.home_dir, "firecracker.sock"))
+        samples = test_faaascale(sizes, boot, params.warmup, params.repetitions, params.faascale_concurrency,
+                                 reclaim)
     else:
-        test_balloon(sizes, os.path.join(params.home_dir, "firecracker.sock"))
+        samples = test_balloon(sizes, socket, boot, params.warmup, params.repetitions, reclaim)
 
-    subprocess.run("sudo rm -rf firecracker.sock", cwd=os.path.join(params.home_dir), shell=True)
+    subprocess.run(root(params) + ["rm", "-rf", socket])
     stop_vmm()
     firecracker_pipe.wait()
+    return samples
 
 
-def run_qemu(params, sizes: list, type_: str):
-    executer = params.executables.qemu
+def start_qemu(params, type_: str, qmp_socket: str = "/tmp/qmp.sock", name: str = None):
     kernel = params.kernels.qemu
     rootfs = params.images.debian
+    name = name or type_
 
-    qemu_cmd_args = ["sudo", executer, "-nographic", "-kernel", kernel,
+    qemu_cmd_args = vmm_command(params, "qemu") + ["-nographic", "-kernel", kernel,
                      "-append", "noinintr console=ttyS0 root=/dev/vda r loglevel=8 nokaslr",
-                     "-drive", f"if=none,file={rootfs},id=hd0,format=raw", "-device", "virtio-blk-pci,drive=hd0",
-                     "-qmp", "unix:/tmp/qmp.sock,server=on,wait=off",
+                     "-drive", f"if=none,file={rootfs},id=hd0,format=raw,readonly=on",
+                     "-device", "virtio-blk-pci,drive=hd0",
+                     "-qmp", f"unix:{qmp_socket},server=on,wait=off",
                      "--enable-kvm", "-cpu", "host"]
 
+    config = params.qemu_config
     if type_ == "virtio_mem":
-        qemu_cmd_args += ["-m", "2G,maxmem=10G", "-smp", "4",
-                          "-object", "memory-backend-ram,id=vmem0,size=8G,prealloc=off",
+        # 2G of boot memory, mem_size_mib can be plugged
+        qemu_cmd_args += ["-m", "2G,maxmem={}M".format(2048 + config.mem_size_mib), "-smp", str(config.vcpu_count),
+                          "-object", "memory-backend-ram,id=vmem0,size={}M,prealloc=off".format(config.mem_size_mib),
                           "-device",
-                          "virtio-mem-pci,id=vm0,memdev=vmem0,node=0,block-size=2M,prealloc=off",
-                          "-qmp", "unix:/tmp/qmp.sock,server=on,wait=off"]
+                          "virtio-mem-pci,id=vm0,memdev=vmem0,node=0,block-size={},prealloc=off".format(
+                              config.virtio_mem_block_size)]
     elif type_ == "balloon":
-        qemu_cmd_args += ["-m", "8G", "-smp", "4", "-device", "virtio-balloon"]
+        qemu_cmd_args += ["-m", "{}M".format(config.mem_size_mib), "-smp", str(config.vcpu_count),
+                          "-device", "virtio-balloon"]
+
+    return subprocess.Popen(qemu_cmd_args,
+                            stdout=open('logs/qemu-{}'.format(name), 'a+'),
+                            stderr=open('logs/qemu-{}'.format(name), 'a+'),
+                            cwd=params.home_dir)
+
+
+def start_qemu_api_server(params, type_: str):
+    if params.simulate.enabled:
+        # run.sh without handing the QMP socket to another user
+        subprocess.run(["pkill", "-9", "-f", "gunicorn --bind :8081"])
+        command = ["gunicorn", "--bind", ":8081", "--workers", "1", "--threads", "8", "--timeout", "0", "app:app"]
+    else:
+        command = ["sudo", "-E", "./run.sh"]
+    pipe = subprocess.Popen(command,
+                            stdout=open('logs/qemu-api-server-{}'.format(type_), 'a+'),
+                            stderr=open('logs/qemu-api-server-{}'.format(type_), 'a+'),
+                            cwd=os.path.join(params.home_dir, "qemu-api-server"))
+    time.sleep(3)
+    return pipe
+
 
+def run_qemu(params, sizes: list, type_: str, boot: int):
     stop_vmm()
-    qemu_pipe = subprocess.Popen(qemu_cmd_args,
-                                 stdout=open('logs/qemu-{}'.format(type_), 'a+'),
-                                 stderr=open('logs/qemu-{}'.format(type_), 'a+'),
-                                 cwd=params.home_dir)
+    qemu_pipe = start_qemu(params, type_)
     time.sleep(5)
 
-    subprocess.Popen(["sudo", "-E", "./run.sh"],
-                     stdout=open('logs/qemu-api-server-{}'.format(type_), 'a+'),
-                     stderr=open('logs/qemu-api-server-{}'.format(type_), 'a+'),
-                     cwd=os.path.join(params.home_dir, "qemu-api-server"))
-    time.sleep(3)
+    start_qemu_api_server(params, type_)
+    reclaim = reclaim_measurer(params, params.executables.qemu, "/tmp/qmp.sock")
 
     if type_ == "virtio_mem":
         max_size = 0
     else:
-        max_size = 8192
-
-    for size in sizes:
-        url = f"http://localhost:8081/change_{type_}_to?value={abs(size - max_size)}"
-        resp = requests.get(url, headers={'Content-Type': 'application/json'})
+        max_size = params.qemu_config.mem_size_mib
 
-        print("Qemu-{} scale {} {}MB use {:.1f}ms".format(type_, "down" if type_ == "balloon" else "up", size,
-                                                          resp.json()['use_time']))
+    def change(value):
+        url = f"http://localhost:8081/change_{type_}_to?value={value}"
+        return requests.get(url, headers={'Content-Type': 'application/json'}).json()['use_time']
 
-        url = f"http://localhost:8081/change_{type_}_to?value={max_size}"
-        resp = requests.get(url, headers={'Content-Type': 'application/json'})
-        print("Qemu-{} scale {} {}MB use {:.1f}ms".format(type_, "up" if type_ == "balloon" else "down", size,
-                                                          resp.json()['use_time']))
+    # virtio-mem plugs `size` into the guest, the balloon takes `size` from it
+    directions = ["up", "down"] if type_ == "virtio_mem" else ["down", "up"]
+    samples = []
+    for size in sizes:
+        for rep in range(-params.warmup, params.repetitions):
+            use_times, returned = [], []
+            for direction, value in zip(directions, [abs(size - max_size), max_size]):
+                if reclaim and direction == "down":
+                    # the Qemu guest is only reachable when usable.qemu_guest_url is set, otherwise only memory
+                    # the guest touched on its own can be returned
+                    if params.usable.qemu_guest_url:
+                        touch_guest(params.usable.qemu_guest_url, size)
+                    use_time, extra = reclaim(lambda: change(value))
+                else:
+                    use_time, extra = change(value), {}
+                use_times.append(use_time)
+                returned.append(extra)
+            if rep < 0:
+                continue
+            for direction, use_time, extra in zip(directions, use_times, returned):
+                samples.append(sample("qemu-" + type_, direction, size, boot, rep, use_time, **extra))
+                print("Qemu-{} scale {} {}MB use {:.1f}ms".format(type_, direction, size, use_time))
 
     stop_vmm()
     qemu_pipe.wait()
+    return samples
 
 
 def run(params, setting: str, sizes: list, repeat: int):
+    samples = []
     for r in range(repeat):
         print("\n=========%s scale: %d=========\n" % (setting, r))
         if setting.startswith("qemu"):
-            run_qemu(params, sizes, setting[5:])
+            samples += run_qemu(params, sizes, setting[5:], r)
+        elif params.simulate.enabled and setting == "firecracker-faascale":
+            # faascale is driven from inside the guest, which is not simulated
+            print("firecracker-faascale can not be simulated, skipped")
         else:
-            run_firecracker(params, sizes, setting[12:])
-
-
-def main(config_file):
+            samples += run_firecracker(params, sizes, setting[12:], r)
+    return samples
+
+
+# the settings a sweep key applies to, by key or by its section
+SWEEP_KEYS = {
+    "faascale_mem_config": ["firecracker-faascale"],
+    "balloon_config": ["firecracker-balloon"],
+    "firecracker_config": ["firecracker-balloon", "firecracker-faascale"],
+    "qemu_config": ["qemu-balloon", "qemu-virtio_mem"],
+    "qemu_config.virtio_mem_block_size": ["qemu-virtio_mem"],
+}
+
+
+def sweep_applies(key: str, setting: str):
+    settings = SWEEP_KEYS.get(key, SWEEP_KEYS.get(key.split(".")[0], []))
+    return setting in settings
+
+
+def sweep_configs(grid: dict, setting: str):
+    # every combination of the grid keys that apply to `setting`, as {"section.key": value}
+    keys = [k for k in grid if sweep_applies(k, setting)]
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def configure(params, config: dict):
+    params = copy.deepcopy(params)
+    for key, value in config.items():
+        section, name = key.split(".")
+        setattr(getattr(params, section), name, value)
+    return params
+
+
+def vm_memory(params, setting: str):
+    if setting.startswith("qemu"):
+        return params.qemu_config.mem_size_mib
+    return params.firecracker_config.mem_size_mib
+
+
+def sweep_record(setting: str, config: dict, sizes: list, samples: list):
+    summary = summarize_samples(samples)
+    reclaim = reclaim_summary(samples)
+    record = {"setting": setting, "config": config, "sizes": sizes, "summary": summary, "reclaim": reclaim}
+    for direction in ["up", "down"]:
+        values = [s["p50"] for s in summary if s["direction"] == direction]
+        record[direction + "_p50"] = statistics.fmean(values) if values else None
+    record["reclaim_p50"] = statistics.fmean(r["time_to_host_reclaim_p50"] for r in reclaim) if reclaim else None
+    record["returned_ratio"] = statistics.fmean(r["host_returned_mb_p50"] / r["size"] for r in reclaim) \
+        if reclaim else None
+    return record
+
+
+def config_id(setting: str, config: dict):
+    return json.dumps([setting, config], sort_keys=True)
+
+
+def run_sweep(params, result_dir: str):
+    # runs every setting with every configuration of sweep.grid, one JSON line per finished configuration, so an
+    # interrupted sweep resumes where it stopped
+    sweep_file = os.path.join(params.home_dir, params.sweep.file)
+    os.makedirs(os.path.dirname(sweep_file), exist_ok=True)
+    records = []
+    if os.path.exists(sweep_file):
+        with open(sweep_file) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    done = {config_id(r["setting"], r["config"]) for r in records}
+
+    samples = []
+    for setting in params.sweep.settings:
+        grid = vars(params.sweep.grid)
+        for config in sweep_configs(grid, setting):
+            if config_id(setting, config) in done:
+                continue
+            print("\n=========%s sweep: %s=========\n" % (setting, json.dumps(config)))
+            configured = configure(params, config)
+            # the guest keeps some memory for itself
+            sizes = [size for size in params.sizes if size < vm_memory(configured, setting)]
+            config_samples = run(configured, setting, sizes, params.repeat)
+            for s in config_samples:
+                s.update(config=json.dumps(config, sort_keys=True))
+            samples += config_samples
+            record = sweep_record(setting, config, sizes, config_samples)
+            records.append(record)
+            with open(sweep_file, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+    if samples:
+        write_results(samples, result_dir)
+    ranking = sweep_ranking(records)
+    write_csv(ranking, os.path.join(result_dir, "ranking.csv"))
+    return ranking
+
+
+def sweep_ranking(records: list):
+    # per setting, configurations ranked by their mean p50 scale up plus scale down, and by host reclaim time
+    rows = []
+    for setting in dict.fromkeys(r["setting"] for r in records):
+        group = [r for r in records if r["setting"] == setting and r["up_p50"] is not None]
+        group.sort(key=lambda r: r["up_p50"] + (r["down_p50"] or 0))
+        by_reclaim = sorted((r for r in group if r["reclaim_p50"] is not None), key=lambda r: r["reclaim_p50"])
+        for rank, r in enumerate(group, 1):
+            rows.append({"setting": setting, "rank": rank,
+                         "reclaim_rank": by_reclaim.index(r) + 1 if r in by_reclaim else None,
+                         "up_p50": r["up_p50"], "down_p50": r["down_p50"], "reclaim_p50": r["reclaim_p50"],
+                         "returned_ratio": r["returned_ratio"],
+                         "config": " ".join("{}={}".format(k.split(".")[1], v) for k, v in r["config"].items())})
+    return rows
+
+
+def print_ranking(ranking: list):
+    print("configurations ranked by scale latency (ms, mean of the per-size p50)")
+    print("{:>24}{:>6}{:>10}{:>10}{:>12}{:>10}{:>10}  {}".format(
+        "setting", "rank", "up", "down", "reclaim", "returned", "r-rank", "config"))
+
+    def fmt(value, spec):
+        return "-" if value is None else spec.format(value)
+
+    for row in ranking:
+        print("{:>24}{:>6}{:>10}{:>10}{:>12}{:>10}{:>10}  {}".format(
+            row["setting"], row["rank"], fmt(row["up_p50"], "{:.1f}"), fmt(row["down_p50"], "{:.1f}"),
+            fmt(row["reclaim_p50"], "{:.1f}"), fmt(row["returned_ratio"], "{:.0%}"),
+            fmt(row["reclaim_rank"], "{}"), row["config"]))
+
+
+def main(config_file, sweep=False):
     with open(config_file, 'r') as f:
         params = json.load(f, object_hook=lambda d: SimpleNamespace(**d))
 
     print(params.home_dir)
     # clear logs
-    subprocess.run("sudo rm -rf logs/*", shell=True, cwd=params.home_dir)
+    subprocess.run(" ".join(root(params) + ["rm", "-rf", "logs/*"]), shell=True, cwd=params.home_dir)
 
-    sizes = [512, 1024, 2048, 3072]
+    if sweep:
+        result_dir = os.path.join(params.home_dir, params.result_dir, "sweep-" + time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(result_dir)
+        print_ranking(run_sweep(params, result_dir))
+        print("results are written to", result_dir)
+        return
 
+    sizes = params.sizes
+    samples = []
     for setting in params.settings:
-        if setting == "qemu-balloon":
-            continue
-        if setting == "qemu-virtio_mem":
-            continue
-        if setting == "firecracker-balloon":
-            continue
-        if setting == "firecracker-faascale":
-            pass
-        run(params, setting, sizes, params.repeat)
+        samples += run(params, setting, sizes, params.repeat)
+
+    samples = [s for s in samples if s["direction"] in params.directions]
+    result_dir = os.path.join(params.home_dir, params.result_dir, time.strftime("%Y%m%d-%H%M%S"))
+    _, report = write_results(samples, result_dir)
+    print("\n" + report)
+    reclaim = reclaim_summary(samples)
+    if reclaim:
+        write_csv(reclaim, os.path.join(result_dir, "reclaim.csv"))
+        print("host reclaim after scale down (p50 over repetitions)")
+        print("{:>24}{:>8}{:>14}{:>16}{:>14}".format("setting", "size", "guest ms", "host ms", "returned MB"))
+        for row in reclaim:
+            print("{:>24}{:>8}{:>14.1f}{:>16.1f}{:>14.0f}".format(
+                row["setting"], row["size"], row["use_time_p50"], row["time_to_host_reclaim_p50"],
+                row["host_returned_mb_p50"]))
+    print("results are written to", result_dir)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: %s <test-scale.json>" % sys.argv[0])
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ["sweep"]):
+        print("Usage: %s <test-scale.json> [sweep]" % sys.argv[0])
         exit(1)
     if not os.path.exists(sys.argv[1]):
         print("File not found:", sys.argv[1])
         exit(1)
-    main(sys.argv[1])
+    main(sys.argv[1], len(sys.argv) == 3)
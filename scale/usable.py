@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import requests
+
+from firecracker_api import FirecrackerAPI
+from results import sample, write_csv, write_results
+from test import (firecracker_socket, guest_addr, root, start_firecracker, start_qemu, start_qemu_api_server,
+                  stop_vmm)
+
+FAULTS = ['minflt', 'majflt', 'thp_faults']
+
+
+def usable_samples(setting: str, size: int, pattern: str, boot: int, rep: int, up: float, touched: dict):
+    # scale up, first touch of the granted memory, and both together: the time until the memory is usable
+    faults = {k: touched[k] for k in FAULTS}
+    return [sample(setting, "up", size, boot, rep, up),
+            sample(setting, "touch-" + pattern, size, boot, rep, touched['touch'], **faults),
+            sample(setting, "usable-" + pattern, size, boot, rep, up + touched['touch'], **faults)]
+
+
+def test_faascale(params, boot: int):
+    samples = []
+    for size in params.sizes:
+        for pattern in params.usable.patterns:
+            url = f"http://{guest_addr(1)}:5000/?size={size}&repeat={params.repetitions}&warmup={params.warmup}" \
+                  f"&touch=1&pattern={pattern}"
+            results = requests.get(url).json()['samples']
+            for rep in range(params.repetitions):
+                touched = {k: results[k][rep] for k in ['touch'] + FAULTS}
+                samples += usable_samples("firecracker-faascale", size, pattern, boot, rep, results['size'][rep],
+                                          touched)
+            print("Firecracker-faascale {}MB {}: usable after {:.1f}ms (p50)".format(
+                size, pattern, statistics.median(u + t for u, t in zip(results['size'], results['touch']))))
+    return samples
+
+
+def test_balloon(params, boot: int, scale_up, prepare, guest_url: str, setting: str):
+    # `prepare` takes `size` from the guest without timing, `scale_up` gives it back and returns the ms it took
+    samples = []
+    for size in params.sizes:
+        for pattern in params.usable.patterns:
+            for rep in range(-params.warmup, params.repetitions):
+                prepare(size)
+                up = scale_up(size)
+                touched = requests.get(f"{guest_url}/touch?size={size}&pattern={pattern}").json()
+                if rep < 0:
+                    continue
+                samples += usable_samples(setting, size, pattern, boot, rep, up, touched)
+                print("{} {}MB {}: up {:.1f}ms + touch {:.1f}ms".format(setting, size, pattern, up,
+                                                                       touched['touch']))
+    return samples
+
+
+def run_firecracker(params, type_: str, boot: int):
+    stop_vmm()
+    pipe = start_firecracker(params, type_)
+    time.sleep(5)
+    socket = firecracker_socket(params, 1)
+    subprocess.run(root(params) + ["chmod", "777", socket])
+    time.sleep(1)
+
+    if type_ == "faascale":
+        samples = test_faascale(params, boot)
+    else:
+        with FirecrackerAPI(socket) as api:
+            samples = test_balloon(params, boot, lambda size: api.scale_balloon(0), api.scale_balloon,
+                                   f"http://{guest_addr(1)}:5000", "firecracker-balloon")
+
+    stop_vmm()
+    pipe.wait()
+    return samples
+
+
+def run_qemu(params, type_: str, boot: int):
+    # the Qemu VMs have no network of their own, their guest daemon must be reachable at usable.qemu_guest_url
+    if not params.usable.qemu_guest_url:
+        print("qemu-{}: usable.qemu_guest_url is not set, skipped".format(type_))
+        return []
+    stop_vmm()
+    pipe = start_qemu(params, type_)
+    time.sleep(5)
+    start_qemu_api_server(params, type_)
+
+    def change(value):
+        url = f"http://localhost:8081/change_{type_}_to?value={value}"
+        return requests.get(url, headers={'Content-Type': 'application/json'}).json()['use_time']
+
+    if type_ == "virtio_mem":
+        samples = test_balloon(params, boot, change, lambda size: change(0), params.usable.qemu_guest_url,
+                               "qemu-virtio_mem")
+    else:
+        mem = params.qemu_config.mem_size_mib
+        samples = test_balloon(params, boot, lambda size: change(mem), lambda size: change(mem - size),
+                               params.usable.qemu_guest_url, "qemu-balloon")
+
+    stop_vmm()
+    pipe.wait()
+    return samples
+
+
+def fault_table(samples: list):
+    groups = {}
+    for s in samples:
+        if s["direction"].startswith("usable-"):
+            groups.setdefault((s["setting"], s["direction"][7:], s["size"]), []).append(s)
+    return [dict(setting=setting, pattern=pattern, size=size,
+                 **{k: statistics.fmean(s[k] for s in group) for k in FAULTS})
+            for (setting, pattern, size), group in sorted(groups.items())]
+
+
+def main(config_file):
+    with open(config_file, 'r') as f:
+        params = json.load(f, object_hook=lambda d: SimpleNamespace(**d))
+
+    subprocess.run(" ".join(root(params) + ["rm", "-rf", "logs/*"]), shell=True, cwd=params.home_dir)
+    samples = []
+    for setting in params.usable.settings:
+        for r in range(params.repeat):
+            print("\n=========%s usable memory: %d=========\n" % (setting, r))
+            if setting.startswith("qemu"):
+                samples += run_qemu(params, setting[5:], r)
+            else:
+                samples += run_firecracker(params, setting[12:], r)
+
+    result_dir = os.path.join(params.home_dir, params.result_dir, "usable-" + time.strftime("%Y%m%d-%H%M%S"))
+    _, report = write_results(samples, result_dir)
+    faults = fault_table(samples)
+    write_csv(faults, os.path.join(result_dir, "faults.csv"))
+    print("\n" + report)
+    print("{:>24}{:>12}{:>8}{:>12}{:>10}{:>12}".format("setting", "pattern", "size", "minflt", "majflt",
+                                                        "thp_faults"))
+    for row in faults:
+        print("{:>24}{:>12}{:>8}{:>12.0f}{:>10.0f}{:>12.0f}".format(row["setting"], row["pattern"], row["size"],
+                                                                 row["minflt"], row["majflt"], row["thp_faults"]))
+    print("results are written to", result_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: %s <test-scale.json>" % sys.argv[0])
+        exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print("File not found:", sys.argv[1])
+        exit(1)
+    main(sys.argv[1])